@@ -9,7 +9,12 @@ import os
 # Añadir directorio raíz al path para imports
 sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-from src.ui_main import main
-
 if __name__ == "__main__":
+    from src.cli import is_cli_command
+    if is_cli_command(sys.argv[1:]):
+        # Subcomandos sin interfaz gráfica (p. ej. `python main.py batch <dir>`)
+        from src.cli import main as cli_main
+        sys.exit(cli_main(sys.argv[1:]))
+    
+    from src.ui_main import main
     main()
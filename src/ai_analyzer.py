@@ -1,48 +1,164 @@
 """
 Módulo para análisis de manuscritos con modelos de IA
 """
+import copy
+import hashlib
+import time
 import torch
-from typing import List, Dict, Tuple, Optional
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from src.config import MAX_INPUT_TOKENS, MAX_OUTPUT_TOKENS_KEYPHRASES, MAX_OUTPUT_TOKENS_ANALYSIS
+from dataclasses import dataclass
+from typing import Any, Callable, List, Dict, Tuple, Optional, Type
+from transformers import (
+    AutoTokenizer,
+    AutoModelForCausalLM,
+    DynamicCache,
+    StoppingCriteria,
+    StoppingCriteriaList
+)
+from src.config import (
+    MAX_INPUT_TOKENS,
+    MAX_OUTPUT_TOKENS_KEYPHRASES,
+    MAX_OUTPUT_TOKENS_ANALYSIS,
+    MAX_OUTPUT_TOKENS_CHUNK,
+    DEFAULT_CONTEXT_WINDOW,
+    DEFAULT_PROMPTS,
+    LONG_DOCUMENT_BATCH_SIZE,
+    PREFIX_CACHE_ENABLED,
+    PREFIX_CACHE_MIN_TOKENS,
+    PROMPT_BUDGET_WEIGHTS
+)
+from src.cancellation import CancelToken
+from src.generation_progress import GenerationProgress, ProgressStreamer
+from src.long_document import (
+    ChunkCache,
+    chunk_manuscript,
+    format_partial_evaluation,
+    has_evaluation_structure,
+    merge_evaluations
+)
+from src.model_loader import load_model_weights, peak_rss_bytes, reset_peak_rss
+from src.model_pool import get_model_pool
+from src.prompt_budget import BudgetedPrompt, PromptBudget
+from src.pubmed_searcher import PubMedSearcher
+from src.pubmed_xml import Article
+from src.quantization import load_int8_model, resolve_precision, torch_dtype
+from src.stopping_criteria import (
+    CancelStoppingCriteria,
+    EvaluationStoppingCriteria,
+    KeyphraseStoppingCriteria,
+    clean_keyphrase_line,
+    evaluation_section,
+    is_valid_keyphrase
+)
+
+
+@dataclass
+class CachedPrefix:
+    """KV cache del prefijo fijo de una plantilla de prompt"""
+    input_ids: List[int]
+    past_key_values: Any
+    prefill_seconds: float
 
 
 class AIAnalyzer:
     """Gestiona el análisis de manuscritos usando modelos de IA locales"""
     
-    def __init__(self, model_name: str):
+    def __init__(
+        self,
+        model_name: str,
+        precision: Optional[str] = None,
+        device: Optional[str] = None,
+        load_options: Optional[Dict[str, Any]] = None
+    ):
         """
         Inicializa el analizador de IA
         
         Args:
             model_name: Nombre del modelo de HuggingFace a usar
+            precision: Precisión en CPU ('fp32', 'bf16' o 'int8'; por defecto CPU_PRECISION). En GPU se usa fp16
+            device: Dispositivo ('cpu' o 'cuda'; por defecto la GPU si está disponible)
+            load_options: Reparto de capas entre GPU, CPU y disco (MemoryPlan.load_kwargs())
         """
         self.model_name = model_name
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+        self.device = device or ("cuda" if torch.cuda.is_available() else "cpu")
+        self.precision = resolve_precision(self.device, precision)
+        self.dtype = torch_dtype(self.precision)
+        self.load_options = load_options or {}
         self.model = None
         self.tokenizer = None
+        self.pool_entry = None
+        self.pool_hit = False
+        self.last_prompt: Optional[BudgetedPrompt] = None
+        self.last_chunk_stats: Optional[Dict[str, int]] = None
+        self.last_tokens_saved = 0
+        self.last_prefix_stats: Optional[Dict[str, float]] = None
+        # Tiempo, pico de memoria y origen de los pesos de la última carga (None si vino del pool)
+        self.last_load_stats: Optional[Dict[str, Any]] = None
+        # Recibe el progreso de cada generación (tokens, velocidad); None lo desactiva
+        self.generation_callback: Optional[Callable[[GenerationProgress], None]] = None
+        # Si se cancela, la generación en curso para en el siguiente token
+        self.cancel_token: Optional[CancelToken] = None
     
     def load_model(self) -> Tuple[AutoModelForCausalLM, AutoTokenizer]:
         """
-        Carga el modelo y tokenizador
+        Carga el modelo y tokenizador (o los reutiliza del pool de modelos)
         
         Returns:
             Tupla con (modelo, tokenizador)
         """
         if self.model is None or self.tokenizer is None:
-            self.tokenizer = AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
-            self.model = AutoModelForCausalLM.from_pretrained(
+            self.last_load_stats = None
+            self.pool_entry, self.pool_hit = get_model_pool().acquire(
                 self.model_name,
-                trust_remote_code=True,
-                torch_dtype=torch.float16 if self.device == "cuda" else torch.float32
-            ).to(self.device)
-            
-            # Asegurar que tiene pad_token
-            if self.tokenizer.pad_token is None:
-                self.tokenizer.pad_token = self.tokenizer.eos_token
+                self.precision,
+                self.device,
+                self._load_from_hub,
+                load_options=self.load_options
+            )
+            self.model = self.pool_entry.model
+            self.tokenizer = self.pool_entry.tokenizer
         
         return self.model, self.tokenizer
     
+    def _load_from_hub(self) -> Tuple[AutoModelForCausalLM, AutoTokenizer]:
+        """
+        Carga el modelo y tokenizador desde HuggingFace
+        
+        Returns:
+            Tupla con (modelo, tokenizador)
+        """
+        reset_peak_rss()
+        start = time.perf_counter()
+        self.last_load_stats = {'source': 'int8 cache'}
+        
+        tokenizer = AutoTokenizer.from_pretrained(self.model_name, trust_remote_code=True)
+        if self.precision == 'int8':
+            # La cuantización solo se hace la primera vez; después se lee del disco
+            model = load_int8_model(self.model_name, self._load_weights)
+        else:
+            model = self._load_weights()
+        
+        self.last_load_stats['seconds'] = time.perf_counter() - start
+        self.last_load_stats['peak_rss_bytes'] = peak_rss_bytes()
+        
+        # Asegurar que tiene pad_token
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        
+        return model, tokenizer
+    
+    def _load_weights(self) -> AutoModelForCausalLM:
+        """
+        Carga los pesos del modelo con el dtype de la precisión elegida, directamente en el dispositivo
+        
+        Returns:
+            Modelo cargado (en CPU si la precisión es int8, que se cuantiza después)
+        """
+        device = "cpu" if self.precision == 'int8' else self.device
+        model, self.last_load_stats['source'] = load_model_weights(
+            self.model_name, self.dtype, device, **self.load_options
+        )
+        return model
+    
     def extract_keyphrases(self, text: str, prompt_template: str, num_keyphrases: int = 5) -> List[str]:
         """
         Extrae frases clave del manuscrito usando IA
@@ -56,32 +172,25 @@ class AIAnalyzer:
             Lista de frases clave
         """
         model, tokenizer = self.load_model()
+        self.last_tokens_saved = 0
+        self.last_prefix_stats = None
+        
+        # Preparar prompt: el texto se recorta para que la instrucción final quepa entera
+        budgeted = self._build_prompt(
+            prompt_template,
+            {'num': num_keyphrases},
+            {'text': text},
+            MAX_OUTPUT_TOKENS_KEYPHRASES
+        )
         
-        # Limitar texto de entrada
-        text_excerpt = text[:MAX_INPUT_TOKENS * 4]  # Aproximadamente 4 chars por token
-        
-        # Preparar prompt
-        prompt = prompt_template.format(num=num_keyphrases, text=text_excerpt)
-        
-        # Generar
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_INPUT_TOKENS).to(self.device)
-        
-        with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=MAX_OUTPUT_TOKENS_KEYPHRASES,
-                temperature=0.7,
-                do_sample=True,
-                top_p=0.9,
-                pad_token_id=tokenizer.pad_token_id
-            )
-        
-        # Decodificar respuesta
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        # Extraer solo la parte generada (después del prompt)
-        if prompt in generated_text:
-            generated_text = generated_text.split(prompt)[-1]
+        # Generar (parando en cuanto haya num_keyphrases frases válidas)
+        generated_text = self._generate_batch(
+            [budgeted],
+            MAX_OUTPUT_TOKENS_KEYPHRASES,
+            KeyphraseStoppingCriteria,
+            stage="Key phrases",
+            num_keyphrases=num_keyphrases
+        )[0]
         
         # Parsear frases clave
         keyphrases = self._parse_keyphrases(generated_text, num_keyphrases)
@@ -103,17 +212,11 @@ class AIAnalyzer:
         keyphrases = []
         
         for line in lines:
-            # Limpiar línea
-            line = line.strip()
-            
-            # Eliminar numeración y guiones
-            line = line.lstrip('0123456789.-) ')
-            
-            # Eliminar comillas
-            line = line.strip('"\'')
+            # Limpiar línea (numeración, guiones y comillas)
+            line = clean_keyphrase_line(line)
             
             # Validar que sea una frase válida (2-6 palabras)
-            if line and 2 <= len(line.split()) <= 6:
+            if is_valid_keyphrase(line):
                 keyphrases.append(line)
             
             if len(keyphrases) >= num_keyphrases:
@@ -133,9 +236,10 @@ class AIAnalyzer:
     def analyze_manuscript(
         self,
         manuscript_text: str,
-        pubmed_data: Dict[str, List[Dict]],
+        pubmed_data: Dict[str, List[Article]],
         prompt_template: str,
-        article_type: str
+        article_type: str,
+        references: Optional[List[Article]] = None
     ) -> Dict[str, List[str]]:
         """
         Analiza el manuscrito usando abstracts de PubMed como referencia
@@ -145,78 +249,376 @@ class AIAnalyzer:
             pubmed_data: Datos de artículos de PubMed
             prompt_template: Template del prompt
             article_type: Tipo de artículo detectado
+            references: Artículos (con abstract ya descargado) a incluir en el prompt;
+                por defecto se eligen de pubmed_data
             
         Returns:
             Diccionario con secciones de evaluación: major, minor, other, suggestions
         """
         model, tokenizer = self.load_model()
+        self.last_tokens_saved = 0
+        self.last_prefix_stats = None
         
         # Preparar abstracts
-        abstracts = self._prepare_abstracts(pubmed_data)
+        if references is None:
+            references = PubMedSearcher.select_references(pubmed_data)
+        abstracts = self._prepare_abstracts(references)
+        
+        # Preparar prompt: instrucciones y formato de salida completos, el resto
+        # del presupuesto repartido entre manuscrito y abstracts
+        budgeted = self._build_prompt(
+            prompt_template,
+            {'type': article_type},
+            {'text': manuscript_text, 'abstracts': abstracts},
+            MAX_OUTPUT_TOKENS_ANALYSIS,
+            empty_values={'abstracts': "No abstracts available"}
+        )
+        
+        # Generar análisis (parando cuando la evaluación está completa y empieza a divagar)
+        generated_text = self._generate_batch(
+            [budgeted],
+            MAX_OUTPUT_TOKENS_ANALYSIS,
+            EvaluationStoppingCriteria,
+            stage="Analysis"
+        )[0]
         
-        # Limitar texto del manuscrito
-        text_excerpt = manuscript_text[:MAX_INPUT_TOKENS * 3]
+        # Parsear evaluación
+        evaluation = self._parse_evaluation(generated_text)
         
-        # Preparar prompt
-        prompt = prompt_template.format(
-            text=text_excerpt,
-            abstracts=abstracts,
-            type=article_type
+        return evaluation
+    
+    def analyze_long_manuscript(
+        self,
+        manuscript_text: str,
+        pubmed_data: Dict[str, List[Article]],
+        prompts: Dict[str, str],
+        article_type: str,
+        references: Optional[List[Article]] = None
+    ) -> Dict[str, List[str]]:
+        """
+        Analiza el manuscrito completo por fragmentos (map-reduce)
+        
+        El texto se divide en fragmentos que caben en el prompt, agrupando
+        secciones completas cuando es posible. Cada fragmento se evalúa con el
+        prompt 'chunk_analysis' (varios fragmentos por llamada a generate) y el
+        prompt 'reduce' une después las evaluaciones eliminando duplicados.
+        Las respuestas de cada fragmento se guardan en caché en disco.
+        
+        Args:
+            manuscript_text: Texto completo del manuscrito
+            pubmed_data: Datos de artículos de PubMed
+            prompts: Diccionario de prompts ('chunk_analysis' y 'reduce' opcionales)
+            article_type: Tipo de artículo detectado
+            references: Artículos (con abstract ya descargado) para el prompt de reducción
+            
+        Returns:
+            Diccionario con secciones de evaluación: major, minor, other, suggestions
+        """
+        model, tokenizer = self.load_model()
+        self.last_tokens_saved = 0
+        self.last_prefix_stats = None
+        chunk_template = prompts.get('chunk_analysis') or DEFAULT_PROMPTS['chunk_analysis']
+        reduce_template = prompts.get('reduce') or DEFAULT_PROMPTS['reduce']
+        
+        # Tamaño de fragmento: presupuesto del prompt menos instrucciones (con
+        # margen para la lista de secciones)
+        overhead = len(tokenizer(chunk_template.format(type=article_type, section='', text=''))['input_ids'])
+        chunk_tokens = max(self._prompt_token_limit(MAX_OUTPUT_TOKENS_CHUNK) - overhead - 16, 64)
+        chunks = chunk_manuscript(manuscript_text, tokenizer, chunk_tokens)
+        
+        # Si el manuscrito cabe en un prompt no hace falta dividirlo
+        if len(chunks) <= 1:
+            self.last_chunk_stats = {'chunks': len(chunks), 'cached': 0}
+            return self.analyze_manuscript(
+                manuscript_text, pubmed_data, prompts.get('analysis', ''), article_type, references
+            )
+        
+        # Map: evaluar los fragmentos que no están en caché, por lotes
+        chunk_prompts = [
+            self._build_prompt(
+                chunk_template,
+                {'type': article_type, 'section': label},
+                {'text': text},
+                MAX_OUTPUT_TOKENS_CHUNK
+            )
+            for label, text in chunks
+        ]
+        cache = ChunkCache()
+        keys = [
+            ChunkCache.key(
+                self.model_name,
+                budgeted.prompt,
+                precision=self.precision,
+                max_new_tokens=MAX_OUTPUT_TOKENS_CHUNK,
+                temperature=0.7,
+                top_p=0.9
+            )
+            for budgeted in chunk_prompts
+        ]
+        outputs = [cache.get(key) for key in keys]
+        pending = [i for i, output in enumerate(outputs) if output is None]
+        
+        # El progreso se reparte entre los lotes y el prompt de reducción
+        parts = (len(pending) + LONG_DOCUMENT_BATCH_SIZE - 1) // LONG_DOCUMENT_BATCH_SIZE + 1
+        for start in range(0, len(pending), LONG_DOCUMENT_BATCH_SIZE):
+            batch = pending[start:start + LONG_DOCUMENT_BATCH_SIZE]
+            generated = self._generate_batch(
+                [chunk_prompts[i] for i in batch],
+                MAX_OUTPUT_TOKENS_CHUNK,
+                EvaluationStoppingCriteria,
+                stage="Section analysis",
+                part=start // LONG_DOCUMENT_BATCH_SIZE + 1,
+                parts=parts
+            )
+            for i, text in zip(batch, generated):
+                outputs[i] = text
+                cache.put(keys[i], text)
+        
+        self.last_chunk_stats = {'chunks': len(chunks), 'cached': len(chunks) - len(pending)}
+        partials = [self._parse_evaluation(output) for output in outputs]
+        
+        # Reduce: unir las evaluaciones parciales con los abstracts de referencia
+        if references is None:
+            references = PubMedSearcher.select_references(pubmed_data)
+        budgeted = self._build_prompt(
+            reduce_template,
+            {'type': article_type},
+            {
+                'evaluations': [
+                    format_partial_evaluation(label, partial)
+                    for (label, _), partial in zip(chunks, partials)
+                ],
+                'abstracts': self._prepare_abstracts(references)
+            },
+            MAX_OUTPUT_TOKENS_ANALYSIS,
+            empty_values={'abstracts': "No abstracts available"}
         )
+        reduced_text = self._generate_batch(
+            [budgeted],
+            MAX_OUTPUT_TOKENS_ANALYSIS,
+            EvaluationStoppingCriteria,
+            stage="Merging evaluations",
+            part=parts,
+            parts=parts
+        )[0]
+        
+        # Si la respuesta no tiene el formato esperado se unen los fragmentos sin el modelo
+        if not has_evaluation_structure(reduced_text):
+            return merge_evaluations(partials)
+        
+        # Las evaluaciones que no cupieron en el prompt de reducción se añaden al final
+        included = budgeted.items_included.get('evaluations', len(partials))
+        return merge_evaluations([self._parse_evaluation(reduced_text)] + partials[included:])
+    
+    def _generate_batch(
+        self,
+        prompts: List[BudgetedPrompt],
+        max_new_tokens: int,
+        criteria_class: Optional[Type[StoppingCriteria]] = None,
+        stage: str = "Generation",
+        part: int = 1,
+        parts: int = 1,
+        **criteria_args
+    ) -> List[str]:
+        """
+        Genera las respuestas de varios prompts en una sola llamada a generate
         
-        # Generar análisis
-        inputs = tokenizer(prompt, return_tensors="pt", truncation=True, max_length=MAX_INPUT_TOKENS).to(self.device)
+        Los prompts se rellenan por la izquierda para que todas las respuestas
+        empiecen en la misma posición. Los tokens ahorrados por la parada
+        anticipada se suman a `last_tokens_saved`.
+        
+        Args:
+            prompts: Prompts ajustados al presupuesto
+            max_new_tokens: Tokens máximos de cada respuesta
+            criteria_class: Criterio de parada anticipada (ver stopping_criteria.py)
+            stage: Nombre de la etapa para el progreso en vivo
+            part: Llamada actual dentro de la etapa
+            parts: Número de llamadas de la etapa
+            **criteria_args: Argumentos adicionales del criterio
+            
+        Returns:
+            Texto generado para cada prompt, en el mismo orden
+        """
+        pad_token_id = self.tokenizer.pad_token_id
+        length = max(len(budgeted.input_ids) for budgeted in prompts)
+        input_ids = torch.full((len(prompts), length), pad_token_id, dtype=torch.long, device=self.device)
+        attention_mask = torch.zeros_like(input_ids)
+        
+        for row, budgeted in enumerate(prompts):
+            start = length - len(budgeted.input_ids)
+            input_ids[row, start:] = torch.tensor(budgeted.input_ids, device=self.device)
+            attention_mask[row, start:] = 1
+        
+        criteria = criteria_class(self.tokenizer, length, **criteria_args) if criteria_class else None
+        stopping_criteria = StoppingCriteriaList([criteria] if criteria else [])
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+            stopping_criteria.append(CancelStoppingCriteria(self.cancel_token))
+        
+        # Con un solo prompt se parte del KV cache de las instrucciones fijas
+        generate_args = {}
+        if len(prompts) == 1:
+            past_key_values = self._prefix_past_key_values(prompts[0])
+            if past_key_values is not None:
+                generate_args['past_key_values'] = past_key_values
+        
+        # Progreso en vivo: el streamer solo cuenta tokens y agrupa los avisos
+        if self.generation_callback is not None:
+            generate_args['streamer'] = ProgressStreamer(
+                self.generation_callback, stage, max_new_tokens, part, parts
+            )
         
         with torch.no_grad():
-            outputs = model.generate(
-                **inputs,
-                max_new_tokens=MAX_OUTPUT_TOKENS_ANALYSIS,
+            outputs = self.model.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                max_new_tokens=max_new_tokens,
                 temperature=0.7,
                 do_sample=True,
                 top_p=0.9,
-                pad_token_id=tokenizer.pad_token_id
+                pad_token_id=pad_token_id,
+                stopping_criteria=stopping_criteria,
+                **generate_args
             )
         
-        # Decodificar
-        generated_text = tokenizer.decode(outputs[0], skip_special_tokens=True)
+        # Una generación cortada por la cancelación no se usa
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
         
-        # Extraer solo la respuesta generada
-        if prompt in generated_text:
-            generated_text = generated_text.split(prompt)[-1]
+        texts = self.tokenizer.batch_decode(outputs[:, length:], skip_special_tokens=True)
+        if criteria is None:
+            return texts
         
-        # Parsear evaluación
-        evaluation = self._parse_evaluation(generated_text)
+        # Quitar lo generado después del punto de parada (repeticiones, texto libre)
+        self.last_tokens_saved += criteria.tokens_saved(outputs.shape[1] - length, max_new_tokens, len(prompts))
+        return [criteria.trim(text, row) for row, text in enumerate(texts)]
+    
+    def _prefix_past_key_values(self, budgeted: BudgetedPrompt) -> Optional[DynamicCache]:
+        """
+        Devuelve una copia del KV cache del prefijo fijo del prompt
         
-        return evaluation
+        El prefijo (instrucciones anteriores al primer placeholder) se calcula
+        una vez por modelo y plantilla y se guarda en la entrada del pool, así
+        que en las siguientes llamadas solo se procesa la parte variable.
+        
+        Args:
+            budgeted: Prompt ajustado al presupuesto
+            
+        Returns:
+            KV cache de los tokens iniciales compartidos con el prompt, o None
+        """
+        if not PREFIX_CACHE_ENABLED or not budgeted.static_prefix or self.pool_entry is None:
+            return None
+        
+        pool = get_model_pool()
+        key = hashlib.sha256(f"{self.model_name}\0{budgeted.static_prefix}".encode('utf-8')).hexdigest()
+        cached = pool.get_prefix(self.pool_entry, key)
+        hit = cached is not None
+        
+        if cached is None:
+            prefix_ids = self.tokenizer(budgeted.static_prefix)['input_ids']
+            if len(prefix_ids) < PREFIX_CACHE_MIN_TOKENS:
+                return None
+            started = time.perf_counter()
+            with torch.no_grad():
+                outputs = self.model(
+                    input_ids=torch.tensor([prefix_ids], device=self.device),
+                    past_key_values=DynamicCache(),
+                    use_cache=True
+                )
+            cached = CachedPrefix(prefix_ids, outputs.past_key_values, time.perf_counter() - started)
+            pool.put_prefix(self.pool_entry, key, cached)
+        
+        # La frontera entre el prefijo y el texto variable puede tokenizarse de
+        # otra forma: solo se reutilizan los tokens iniciales que coinciden
+        # (y al menos uno se deja para que generate lo procese)
+        shared = 0
+        limit = min(len(cached.input_ids), len(budgeted.input_ids) - 1)
+        while shared < limit and cached.input_ids[shared] == budgeted.input_ids[shared]:
+            shared += 1
+        if shared == 0:
+            return None
+        
+        # generate amplía la caché que recibe: se trabaja sobre una copia
+        past_key_values = copy.deepcopy(cached.past_key_values)
+        past_key_values.crop(shared)
+        self.last_prefix_stats = {
+            'hit': hit,
+            'tokens': shared,
+            'seconds_saved': cached.prefill_seconds * shared / len(cached.input_ids) if hit else 0.0
+        }
+        return past_key_values
     
-    def _prepare_abstracts(self, pubmed_data: Dict[str, List[Dict]], max_abstracts: int = 10) -> str:
+    def _prepare_abstracts(self, references: List[Article]) -> List[str]:
         """
         Prepara abstracts de PubMed para el prompt
         
         Args:
-            pubmed_data: Datos de PubMed
-            max_abstracts: Número máximo de abstracts a incluir
+            references: Artículos de referencia seleccionados, por orden de prioridad
             
         Returns:
-            String con abstracts formateados
+            Lista de abstracts formateados (el reparto de tokens descarta los últimos si no caben)
         """
         abstracts = []
-        count = 0
-        
-        for keyphrase, articles in pubmed_data.items():
-            for article in articles:
-                if count >= max_abstracts:
-                    break
-                
-                abstract = article.get('abstract', 'No abstract available')
-                if abstract and abstract != "No abstract available":
-                    abstracts.append(f"[{article.get('year', 'N/A')}] {abstract}")
-                    count += 1
+        
+        for article in references:
+            abstract = article.get('abstract', 'No abstract available')
+            if abstract and abstract != "No abstract available":
+                abstracts.append(f"[{article.get('year', 'N/A')}] {abstract}")
+        
+        return abstracts
+    
+    def _prompt_token_limit(self, max_new_tokens: int) -> int:
+        """
+        Tokens disponibles para el prompt: MAX_INPUT_TOKENS, sin superar la
+        ventana de contexto del modelo menos los tokens de la respuesta
+        
+        Args:
+            max_new_tokens: Tokens reservados para la generación
             
-            if count >= max_abstracts:
-                break
+        Returns:
+            Número máximo de tokens del prompt
+        """
+        context_window = getattr(self.model.config, 'max_position_embeddings', None) or DEFAULT_CONTEXT_WINDOW
+        return max(min(MAX_INPUT_TOKENS, context_window - max_new_tokens), 1)
+    
+    def _build_prompt(
+        self,
+        template: str,
+        values: Dict[str, object],
+        flexible: Dict[str, object],
+        max_new_tokens: int,
+        empty_values: Optional[Dict[str, str]] = None
+    ) -> BudgetedPrompt:
+        """
+        Rellena la plantilla ajustando las partes flexibles al presupuesto de tokens
         
-        return '\n\n'.join(abstracts) if abstracts else "No abstracts available"
+        Args:
+            template: Plantilla del prompt
+            values: Valores que se incluyen completos
+            flexible: Partes recortables (texto o lista de elementos)
+            max_new_tokens: Tokens reservados para la generación
+            empty_values: Texto para las partes flexibles que queden vacías
+            
+        Returns:
+            Prompt ajustado con sus token ids
+        """
+        max_prompt_tokens = self._prompt_token_limit(max_new_tokens)
+        # Un token ocupa casi siempre menos de 10 caracteres: no hace falta
+        # tokenizar el manuscrito completo para llenar el presupuesto
+        flexible = {
+            name: part[:max_prompt_tokens * 10] if isinstance(part, str) else part
+            for name, part in flexible.items()
+        }
+        
+        self.last_prompt = PromptBudget(self.tokenizer, max_prompt_tokens).build(
+            template,
+            {name: str(value) for name, value in values.items()},
+            flexible,
+            PROMPT_BUDGET_WEIGHTS,
+            empty_values
+        )
+        return self.last_prompt
     
     def _parse_evaluation(self, text: str) -> Dict[str, List[str]]:
         """
@@ -242,18 +644,9 @@ class AIAnalyzer:
             line = line.strip()
             
             # Detectar encabezados de sección
-            line_upper = line.upper()
-            if 'MAJOR POINT' in line_upper:
-                current_section = 'major'
-                continue
-            elif 'MINOR POINT' in line_upper:
-                current_section = 'minor'
-                continue
-            elif 'OTHER POINT' in line_upper:
-                current_section = 'other'
-                continue
-            elif 'SUGGESTION' in line_upper or 'IMPROVEMENT' in line_upper:
-                current_section = 'suggestions'
+            section = evaluation_section(line)
+            if section is not None:
+                current_section = section
                 continue
             
             # Agregar contenido a la sección actual
@@ -291,13 +684,20 @@ class AIAnalyzer:
             'suggestions': lines[mid+mid//2:] if len(lines) > mid+mid//2 else []
         }
     
-    def unload_model(self):
-        """Libera memoria descargando el modelo"""
+    def unload_model(self, evict: bool = False):
+        """
+        Libera el modelo de este analizador
+        
+        Args:
+            evict: Si es True, descarga el modelo del pool y libera su memoria.
+                   Por defecto el modelo vuelve al pool y queda listo para la siguiente revisión.
+        """
         if self.model is not None:
-            del self.model
-            del self.tokenizer
+            pool = get_model_pool()
+            pool.release(self.pool_entry)
             self.model = None
             self.tokenizer = None
+            self.pool_entry = None
             
-            if torch.cuda.is_available():
-                torch.cuda.empty_cache()
+            if evict:
+                pool.evict(self.model_name)
@@ -0,0 +1,315 @@
+"""
+Revisión por lotes sin interfaz gráfica
+"""
+import json
+import os
+import threading
+import time
+import traceback
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional
+
+from src.ai_analyzer import AIAnalyzer
+from src.config import BATCH_IO_WORKERS, BATCH_MANIFEST_NAME, SUPPORTED_FORMATS
+from src.model_loader import format_load_stats
+from src.model_pool import get_model_pool
+from src.pipeline import ReviewPipeline
+from src.pubmed_searcher import PubMedSearcher
+from src.pubmed_xml import Article
+from src.reference_ranker import RankedReference
+
+
+class BatchJob:
+    """Estado de un manuscrito dentro del lote"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+        self.started = time.perf_counter()
+        self.timings: Dict[str, float] = {}
+        self.extraction: Optional[Future] = None
+        self.search: Optional[Future] = None
+        self.manuscript_text = ""
+        self.review_text = ""
+        self.article_type = ""
+        self.keyphrases: List[str] = []
+        self.references: List[RankedReference] = []
+        self.tokens_saved = 0
+
+
+class BatchRunner:
+    """
+    Revisa todos los manuscritos de un directorio con una sola carga del modelo.
+
+    Las etapas que usan el modelo (frases clave y análisis) se ejecutan en serie,
+    mientras que la extracción de texto, la búsqueda en PubMed y la generación de
+    informes se solapan en un pool de threads. Cada manuscrito terminado se añade
+    a un manifiesto JSONL, que permite reanudar el lote tras una interrupción.
+    """
+
+    def __init__(
+        self,
+        input_dir: str,
+        model_name: str,
+        pipeline: ReviewPipeline,
+        manifest_path: Optional[str] = None,
+        io_workers: int = BATCH_IO_WORKERS,
+        recursive: bool = False,
+        log: Optional[Callable[[str], None]] = None
+    ):
+        """
+        Inicializa el lote
+
+        Args:
+            input_dir: Directorio con los manuscritos
+            model_name: Modelo de IA a utilizar
+            pipeline: Pipeline con la configuración de la revisión
+            manifest_path: Ruta del manifiesto JSONL (por defecto dentro de input_dir)
+            io_workers: Threads para las etapas de entrada/salida
+            recursive: Si se buscan manuscritos en subdirectorios
+            log: Función que recibe mensajes de progreso
+        """
+        self.input_dir = os.path.abspath(input_dir)
+        self.model_name = model_name
+        self.pipeline = pipeline
+        self.manifest_path = manifest_path or os.path.join(self.input_dir, BATCH_MANIFEST_NAME)
+        self.io_workers = max(1, io_workers)
+        self.recursive = recursive
+        self.log = log or print
+        self._manifest_lock = threading.Lock()
+
+    def discover(self) -> List[str]:
+        """
+        Lista los manuscritos del directorio, excluyendo informes generados por PRRA
+
+        Returns:
+            Rutas absolutas ordenadas alfabéticamente
+        """
+        extensions = {f".{ext}" for ext in SUPPORTED_FORMATS}
+        files = []
+
+        for root, dirs, names in os.walk(self.input_dir):
+            for name in names:
+                base, ext = os.path.splitext(name)
+                if ext.lower() not in extensions:
+                    continue
+                if base.endswith('_Author_Report') or base.endswith('_Auditor_Report'):
+                    continue
+                files.append(os.path.join(root, name))
+            if not self.recursive:
+                break
+
+        return sorted(files)
+
+    def load_manifest(self) -> Dict[str, Dict]:
+        """
+        Lee el manifiesto de ejecuciones anteriores
+
+        Returns:
+            Última entrada registrada por cada manuscrito
+        """
+        entries = {}
+        if not os.path.exists(self.manifest_path):
+            return entries
+
+        with open(self.manifest_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # Línea incompleta escrita durante una caída
+                    continue
+                entries[entry.get('file')] = entry
+
+        return entries
+
+    @staticmethod
+    def is_completed(entry: Optional[Dict], file_path: str) -> bool:
+        """
+        Indica si un manuscrito ya se revisó correctamente y no ha cambiado desde entonces
+
+        Args:
+            entry: Entrada del manifiesto (o None)
+            file_path: Ruta del manuscrito
+
+        Returns:
+            True si se puede omitir
+        """
+        if not entry or entry.get('status') != 'ok':
+            return False
+        stat = os.stat(file_path)
+        return entry.get('size') == stat.st_size and entry.get('mtime') == stat.st_mtime
+
+    def run(self) -> Dict[str, int]:
+        """
+        Ejecuta el lote completo
+
+        Returns:
+            Diccionario con el número de manuscritos revisados, omitidos y fallidos
+        """
+        files = self.discover()
+        manifest = self.load_manifest()
+        pending = [f for f in files if not self.is_completed(manifest.get(f), f)]
+        summary = {'total': len(files), 'skipped': len(files) - len(pending), 'ok': 0, 'error': 0}
+
+        self.log(f"📂 {len(files)} manuscripts found, {summary['skipped']} already reviewed")
+        if not pending:
+            return summary
+
+        plan = self.pipeline.plan_memory(self.model_name)
+        self.log(f"🧮 Memory plan: {plan.summary()}")
+        ai_analyzer = AIAnalyzer(self.model_name, plan.precision, load_options=plan.load_kwargs())
+        self.log(f"🤖 Loading AI model: {self.model_name} ({ai_analyzer.precision})...")
+        ai_analyzer.cancel_token = self.pipeline.cancel_token
+        load_start = time.perf_counter()
+        ai_analyzer.load_model()
+        if ai_analyzer.last_load_stats is not None:
+            self.log(f"✓ Model ready ({format_load_stats(ai_analyzer.last_load_stats)})")
+        else:
+            self.log(f"✓ Model ready in {time.perf_counter() - load_start:.1f}s")
+
+        report_futures: List[Future] = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.io_workers) as executor:
+                jobs = [BatchJob(f) for f in pending]
+                next_extraction = 0
+
+                def prefetch(until: int):
+                    """Lanza la extracción de texto de los siguientes manuscritos"""
+                    nonlocal next_extraction
+                    while next_extraction < min(until, len(jobs)):
+                        job = jobs[next_extraction]
+                        job.started = time.perf_counter()
+                        job.extraction = executor.submit(self._timed, job, 'extraction', self.pipeline.extract, job.file_path)
+                        next_extraction += 1
+
+                # Pipeline de un paso: mientras PubMed busca para el manuscrito i,
+                # el modelo extrae las frases clave del manuscrito i+1
+                waiting: Deque[BatchJob] = deque()
+                for index, job in enumerate(jobs):
+                    prefetch(index + 2 * self.io_workers)
+                    try:
+                        job.manuscript_text, job.article_type, sections = job.extraction.result()
+                        job.review_text = self.pipeline.review_text(job.manuscript_text, sections)
+                        job.extraction = None
+                        job.keyphrases = self._timed(
+                            job, 'keyphrases', self.pipeline.extract_keyphrases, ai_analyzer, job.manuscript_text
+                        )
+                        job.tokens_saved += ai_analyzer.last_tokens_saved
+                        job.search = executor.submit(self._timed, job, 'pubmed', self._search, job)
+                        waiting.append(job)
+                    except Exception as e:
+                        self._record_failure(job, e, summary)
+
+                    if len(waiting) > 1:
+                        self._analyze(waiting.popleft(), ai_analyzer, executor, report_futures, summary)
+
+                while waiting:
+                    self._analyze(waiting.popleft(), ai_analyzer, executor, report_futures, summary)
+
+                for future in report_futures:
+                    future.result()
+        finally:
+            ai_analyzer.unload_model()
+
+        self.log(f"♻ Model pool: {get_model_pool().format_stats()}")
+        self.log(f"✅ Batch completed: {summary['ok']} reviewed, {summary['error']} failed, {summary['skipped']} skipped")
+        return summary
+
+    def _search(self, job: BatchJob) -> Dict[str, List[Article]]:
+        """Busca en PubMed y descarga los abstracts de las referencias más relevantes"""
+        pubmed_data = self.pipeline.search_pubmed(job.keyphrases)
+        job.references = self.pipeline.select_references(pubmed_data, job.review_text)
+        return pubmed_data
+
+    def _analyze(self, job: BatchJob, ai_analyzer: AIAnalyzer, executor: ThreadPoolExecutor,
+                 report_futures: List[Future], summary: Dict[str, int]):
+        """Analiza un manuscrito y encola la generación de sus informes"""
+        try:
+            pubmed_data = job.search.result()
+            evaluation = self._timed(
+                job, 'analysis', self.pipeline.analyze,
+                ai_analyzer, job.review_text, pubmed_data, job.article_type, job.references
+            )
+            job.tokens_saved += ai_analyzer.last_tokens_saved
+        except Exception as e:
+            self._record_failure(job, e, summary)
+            return
+
+        report_futures.append(executor.submit(self._finish, job, evaluation, pubmed_data, summary))
+
+    def _finish(self, job: BatchJob, evaluation: Dict[str, List[str]], pubmed_data: Dict[str, List[Article]],
+                summary: Dict[str, int]):
+        """Genera los informes de un manuscrito y lo registra en el manifiesto"""
+        try:
+            author_report, auditor_report = self._timed(
+                job, 'reports', self.pipeline.generate_reports,
+                job.file_path, evaluation, pubmed_data, job.keyphrases, job.manuscript_text, job.article_type,
+                job.references
+            )
+        except Exception as e:
+            self._record_failure(job, e, summary)
+            return
+
+        self._write_entry(job, {
+            'status': 'ok',
+            'article_type': job.article_type,
+            'keyphrases': job.keyphrases,
+            'total_articles': PubMedSearcher.count_unique_articles(pubmed_data),
+            'references': [
+                {'pmid': reference.article.pmid, 'score': round(reference.score, 3)} for reference in job.references
+            ],
+            'evaluation_counts': {key: len(points) for key, points in evaluation.items()},
+            'tokens_saved': job.tokens_saved,
+            'author_report': author_report,
+            'auditor_report': auditor_report
+        })
+        with self._manifest_lock:
+            summary['ok'] += 1
+        self.log(f"✓ {os.path.basename(job.file_path)} ({time.perf_counter() - job.started:.1f}s)")
+
+        # Liberar el texto del manuscrito: un lote puede tener cientos
+        job.manuscript_text = ""
+
+    def _record_failure(self, job: BatchJob, error: Exception, summary: Dict[str, int]):
+        """Registra en el manifiesto un manuscrito que ha fallado"""
+        self._write_entry(job, {
+            'status': 'error',
+            'error': str(error),
+            'traceback': traceback.format_exc()
+        })
+        with self._manifest_lock:
+            summary['error'] += 1
+        self.log(f"❌ {os.path.basename(job.file_path)}: {error}")
+
+    def _write_entry(self, job: BatchJob, fields: Dict):
+        """Añade una línea al manifiesto y la sincroniza en disco"""
+        stat = os.stat(job.file_path)
+        entry = {
+            'file': job.file_path,
+            'size': stat.st_size,
+            'mtime': stat.st_mtime,
+            'model': self.model_name,
+            'finished_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'timings': {stage: round(seconds, 3) for stage, seconds in job.timings.items()},
+            'wall_time': round(time.perf_counter() - job.started, 3)
+        }
+        entry.update(fields)
+
+        with self._manifest_lock:
+            with open(self.manifest_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+
+    @staticmethod
+    def _timed(job: BatchJob, stage: str, func: Callable, *args):
+        """Ejecuta una etapa registrando su duración en el trabajo"""
+        start = time.perf_counter()
+        try:
+            return func(*args)
+        finally:
+            job.timings[stage] = time.perf_counter() - start
@@ -0,0 +1,143 @@
+"""
+Comparativa de memoria y velocidad de los modelos en CPU según la precisión
+"""
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import torch
+
+from src.ai_analyzer import AIAnalyzer
+from src.model_pool import get_model_pool
+
+BENCHMARK_PROMPT = (
+    "List the main methodological limitations of a randomized controlled trial "
+    "with a small sample size and a short follow-up period."
+)
+
+
+@dataclass
+class BenchmarkResult:
+    """Resultado de un modelo con una precisión"""
+    model: str
+    precision: str
+    memory_bytes: int = 0
+    load_seconds: float = 0.0
+    tokens: int = 0
+    tokens_per_second: float = 0.0
+    error: Optional[str] = None
+
+
+def benchmark_model(model_name: str, precision: str, new_tokens: int) -> BenchmarkResult:
+    """
+    Carga un modelo en CPU con una precisión y mide memoria y velocidad de generación
+
+    La generación es voraz y de longitud fija para que las precisiones sean
+    comparables. El modelo se descarga del pool al terminar.
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        precision: 'fp32', 'bf16' o 'int8'
+        new_tokens: Tokens que se generan
+
+    Returns:
+        Resultado de la medición
+    """
+    pool = get_model_pool()
+    analyzer = AIAnalyzer(model_name, precision, device="cpu")
+
+    # Medir una carga real aunque el modelo ya estuviera en el pool
+    pool.evict(model_name)
+    load_start = time.perf_counter()
+    model, tokenizer = analyzer.load_model()
+    load_seconds = time.perf_counter() - load_start
+
+    try:
+        inputs = tokenizer(BENCHMARK_PROMPT, return_tensors="pt")
+
+        def generate(tokens: int):
+            return model.generate(
+                **inputs,
+                max_new_tokens=tokens,
+                min_new_tokens=tokens,
+                do_sample=False,
+                pad_token_id=tokenizer.pad_token_id
+            )
+
+        with torch.inference_mode():
+            generate(2)  # Calentamiento
+            start = time.perf_counter()
+            outputs = generate(new_tokens)
+            elapsed = time.perf_counter() - start
+
+        generated = outputs.shape[1] - inputs['input_ids'].shape[1]
+        return BenchmarkResult(
+            model=model_name,
+            precision=analyzer.precision,
+            memory_bytes=analyzer.pool_entry.size_bytes,
+            load_seconds=load_seconds,
+            tokens=generated,
+            tokens_per_second=generated / elapsed if elapsed > 0 else 0.0
+        )
+    finally:
+        pool.release(analyzer.pool_entry)
+        pool.evict(model_name)
+
+
+def run_benchmark(
+    models: List[str],
+    precisions: List[str],
+    new_tokens: int,
+    log: Optional[Callable[[str], None]] = None
+) -> List[BenchmarkResult]:
+    """
+    Mide todas las combinaciones de modelo y precisión
+
+    Args:
+        models: Modelos de HuggingFace
+        precisions: Precisiones en CPU
+        new_tokens: Tokens generados por medición
+        log: Función que recibe mensajes de progreso
+
+    Returns:
+        Resultados (los fallos se registran en `error` y no detienen el resto)
+    """
+    log = log or print
+    results = []
+    for model_name in models:
+        for precision in precisions:
+            log(f"⏱ {model_name} ({precision})...")
+            try:
+                results.append(benchmark_model(model_name, precision, new_tokens))
+            except Exception as e:
+                log(f"❌ {model_name} ({precision}): {str(e)}")
+                results.append(BenchmarkResult(model=model_name, precision=precision, error=str(e)))
+    return results
+
+
+def format_benchmark(results: List[BenchmarkResult]) -> str:
+    """
+    Devuelve los resultados como tabla, comparando cada precisión con fp32
+
+    Args:
+        results: Resultados de run_benchmark
+
+    Returns:
+        Tabla en texto plano
+    """
+    baselines = {r.model: r for r in results if r.precision == 'fp32' and r.error is None}
+    lines = [f"{'Model':<45} {'Precision':<9} {'Memory':>9} {'Load':>8} {'tok/s':>7} {'Mem vs fp32':>12} {'Speed vs fp32':>14}"]
+
+    for r in results:
+        if r.error is not None:
+            lines.append(f"{r.model:<45} {r.precision:<9} failed: {r.error}")
+            continue
+        baseline = baselines.get(r.model)
+        memory_ratio = f"{r.memory_bytes / baseline.memory_bytes:.2f}x" if baseline and baseline.memory_bytes else "-"
+        speedup = f"{r.tokens_per_second / baseline.tokens_per_second:.2f}x" if baseline and baseline.tokens_per_second else "-"
+        lines.append(
+            f"{r.model:<45} {r.precision:<9} {r.memory_bytes / 1024 ** 3:>7.1f}GB {r.load_seconds:>7.1f}s "
+            f"{r.tokens_per_second:>7.2f} {memory_ratio:>12} {speedup:>14}"
+        )
+
+    return "\n".join(lines)
@@ -0,0 +1,53 @@
+"""
+Cancelación cooperativa de revisiones en curso
+"""
+import threading
+from concurrent.futures import Future, wait
+
+
+class ReviewCancelled(Exception):
+    """La revisión se ha cancelado a petición del usuario"""
+    pass
+
+
+class CancelToken:
+    """
+    Señal de cancelación compartida entre la interfaz y el thread de trabajo.
+
+    Cancelar no interrumpe nada por sí mismo: el pipeline la consulta entre
+    etapas, el buscador de PubMed antes de cada petición y el modelo en cada
+    paso de generación (ver CancelStoppingCriteria), y en ese punto se lanza
+    ReviewCancelled.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self):
+        """Solicita la cancelación (se puede llamar desde cualquier thread)"""
+        self._event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        """Indica si se ha solicitado la cancelación"""
+        return self._event.is_set()
+
+    def raise_if_cancelled(self):
+        """Lanza ReviewCancelled si se ha solicitado la cancelación"""
+        if self._event.is_set():
+            raise ReviewCancelled("Review cancelled by the user")
+
+    def wait_for(self, future: Future, poll_interval: float = 0.5):
+        """
+        Espera a que termine un Future sin dejar de atender la cancelación
+
+        Args:
+            future: Tarea en segundo plano
+            poll_interval: Segundos entre comprobaciones de la cancelación
+
+        Raises:
+            ReviewCancelled: Si se cancela antes de que termine (el Future sigue en curso)
+        """
+        while not future.done():
+            self.raise_if_cancelled()
+            wait([future], timeout=poll_interval)
@@ -0,0 +1,177 @@
+"""
+Interfaz de línea de comandos de PRRA (modo sin interfaz gráfica)
+"""
+import argparse
+import json
+from typing import List, Optional
+
+from src.config import (
+    AVAILABLE_MODELS, DEFAULT_NUM_KEYPHRASES, DEFAULT_NUM_ARTICLES,
+    DEFAULT_OUTPUT_FORMAT, DEFAULT_PROMPTS, BATCH_IO_WORKERS,
+    CPU_PRECISION, CPU_PRECISIONS, BENCHMARK_NEW_TOKENS
+)
+
+# Subcomandos de build_parser; cualquier otro argumento es para la interfaz gráfica (p. ej. opciones de Qt)
+COMMANDS = ("batch", "benchmark", "cache", "pubmed-import")
+
+
+def is_cli_command(argv: List[str]) -> bool:
+    """
+    Indica si los argumentos piden un subcomando de la línea de comandos
+
+    Args:
+        argv: Argumentos sin el nombre del programa
+
+    Returns:
+        True si el primer argumento es un subcomando o la ayuda
+    """
+    return bool(argv) and argv[0] in COMMANDS + ("-h", "--help")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """
+    Construye el parser de argumentos con todos los subcomandos
+
+    Returns:
+        Parser de argparse
+    """
+    parser = argparse.ArgumentParser(prog="prra", description="PRRA - Peer Review Automated Application")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    batch = subparsers.add_parser("batch", help="Review every manuscript in a directory without the GUI")
+    batch.add_argument("directory", help="Directory containing the manuscripts")
+    batch.add_argument("--model", default=AVAILABLE_MODELS[0], help="HuggingFace model to use")
+    batch.add_argument("--num-keyphrases", type=int, default=DEFAULT_NUM_KEYPHRASES)
+    batch.add_argument("--num-articles", type=int, default=DEFAULT_NUM_ARTICLES)
+    batch.add_argument("--format", choices=["pdf", "docx"], default=DEFAULT_OUTPUT_FORMAT)
+    batch.add_argument("--prompts", help="JSON file with custom prompts")
+    batch.add_argument("--manifest", help="JSONL manifest path (default: <directory>/prra_manifest.jsonl)")
+    batch.add_argument("--workers", type=int, default=BATCH_IO_WORKERS, help="Threads for I/O-bound stages")
+    batch.add_argument("--recursive", action="store_true", help="Include subdirectories")
+    batch.add_argument(
+        "--long-document", action="store_true",
+        help="Review the full manuscript in chunks instead of an excerpt"
+    )
+    batch.add_argument(
+        "--precision", choices=CPU_PRECISIONS, default=CPU_PRECISION,
+        help="Model precision when running on CPU (int8 is converted once and cached on disk)"
+    )
+    batch.set_defaults(func=_run_batch)
+
+    benchmark = subparsers.add_parser(
+        "benchmark", help="Compare memory footprint and tokens/sec of each model on CPU per precision"
+    )
+    benchmark.add_argument("--models", nargs="+", default=AVAILABLE_MODELS, help="Models to benchmark")
+    benchmark.add_argument("--precisions", nargs="+", choices=CPU_PRECISIONS, default=CPU_PRECISIONS)
+    benchmark.add_argument("--tokens", type=int, default=BENCHMARK_NEW_TOKENS, help="Tokens generated per run")
+    benchmark.add_argument("--json", help="Also write the results to this JSON file")
+    benchmark.set_defaults(func=_run_benchmark)
+
+    cache = subparsers.add_parser("cache", help="Inspect or prune the local PubMed cache")
+    cache.add_argument("action", choices=["stats", "prune", "clear"])
+    cache.add_argument("--max-searches", type=int, help="Keep at most this many searches when pruning")
+    cache.add_argument("--max-articles", type=int, help="Keep at most this many articles when pruning")
+    cache.set_defaults(func=_run_cache)
+
+    pubmed_import = subparsers.add_parser(
+        "pubmed-import", help="Import PubMed baseline/update XML files into the offline index"
+    )
+    pubmed_import.add_argument("files", nargs="+", help="PubMed XML files (.xml or .xml.gz)")
+    pubmed_import.add_argument("--index", help="Index path (default: PUBMED_OFFLINE_INDEX_PATH)")
+    pubmed_import.set_defaults(func=_run_pubmed_import)
+
+    return parser
+
+
+def _load_prompts(path: Optional[str]) -> dict:
+    """Carga los prompts desde un archivo JSON o devuelve los prompts por defecto"""
+    if not path:
+        return DEFAULT_PROMPTS.copy()
+
+    with open(path, 'r', encoding='utf-8') as f:
+        prompts = json.load(f)
+    if 'keyphrases' not in prompts or 'analysis' not in prompts:
+        raise ValueError("Prompts must contain 'keyphrases' and 'analysis' keys")
+    return prompts
+
+
+def _run_batch(args: argparse.Namespace) -> int:
+    """Ejecuta el subcomando `batch`"""
+    from src.batch import BatchRunner
+    from src.pipeline import ReviewPipeline
+
+    pipeline = ReviewPipeline(
+        args.num_keyphrases,
+        args.num_articles,
+        _load_prompts(args.prompts),
+        args.format,
+        long_document=args.long_document,
+        precision=args.precision
+    )
+    runner = BatchRunner(
+        args.directory,
+        args.model,
+        pipeline,
+        manifest_path=args.manifest,
+        io_workers=args.workers,
+        recursive=args.recursive
+    )
+    summary = runner.run()
+    return 1 if summary['error'] else 0
+
+
+def _run_benchmark(args: argparse.Namespace) -> int:
+    """Ejecuta el subcomando `benchmark`"""
+    from dataclasses import asdict
+    from src.benchmark import format_benchmark, run_benchmark
+
+    results = run_benchmark(args.models, args.precisions, args.tokens)
+    print(format_benchmark(results))
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump([asdict(r) for r in results], f, indent=2)
+    return 1 if any(r.error for r in results) else 0
+
+
+def _run_cache(args: argparse.Namespace) -> int:
+    """Ejecuta el subcomando `cache`"""
+    from src.pubmed_cache import get_pubmed_cache
+
+    cache = get_pubmed_cache()
+    if args.action == "prune":
+        removed = cache.prune(args.max_searches, args.max_articles)
+        print(f"Removed {removed['searches']} searches and {removed['articles']} articles")
+    elif args.action == "clear":
+        cache.clear()
+        print("PubMed cache cleared")
+
+    stats = cache.stats()
+    print(f"Cache file: {cache.path}")
+    print(f"Searches: {stats['searches']} ({stats['expired_searches']} expired)")
+    print(f"Articles: {stats['articles']}")
+    print(f"Size on disk: {stats['bytes'] / 1024 ** 2:.1f} MB")
+    return 0
+
+
+def _run_pubmed_import(args: argparse.Namespace) -> int:
+    """Ejecuta el subcomando `pubmed-import`"""
+    from src.config import PUBMED_OFFLINE_INDEX_PATH
+    from src.pubmed_offline import import_pubmed_files
+
+    totals = import_pubmed_files(args.files, args.index or PUBMED_OFFLINE_INDEX_PATH)
+    print(f"Imported {totals['imported']} articles, deleted {totals['deleted']}")
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    Punto de entrada de la línea de comandos
+
+    Args:
+        argv: Argumentos (por defecto sys.argv[1:])
+
+    Returns:
+        Código de salida
+    """
+    args = build_parser().parse_args(argv)
+    return args.func(args)
@@ -1,10 +1,15 @@
 """
 PRRA application configuration and constants
 """
+import os
+
+# Directorio de datos locales de PRRA (cachés)
+PRRA_DATA_DIR = os.path.join(os.path.expanduser("~"), ".prra")
 
 # Configuración de PubMed
 ENTREZ_EMAIL = "prra@example.com"
 ENTREZ_TOOL = "PRRA"
+NCBI_API_KEY = ""  # Opcional: con API key NCBI permite 10 peticiones/s en lugar de 3
 
 # Modelos de IA disponibles
 AVAILABLE_MODELS = [
@@ -29,23 +34,20 @@ DEFAULT_NUM_ARTICLES = 20
 DEFAULT_OUTPUT_FORMAT = "pdf"
 
 # Prompts por defecto
+# Las instrucciones van antes del primer placeholder: ese prefijo es igual para
+# todos los manuscritos y su KV cache se reutiliza entre revisiones
 DEFAULT_PROMPTS = {
-    'keyphrases': """Extract {num} key phrases (2-4 words each) from the following scientific manuscript text.
+    'keyphrases': """Extract key phrases (2-4 words each) from the scientific manuscript text below.
 Focus on the main topics, methods, and findings. Return only the phrases, one per line.
 
+Number of key phrases: {num}
+
 Text:
 {text}
 
 Key phrases:""",
     
-    'analysis': """You are an expert scientific peer reviewer. Analyze the following manuscript and provide a detailed evaluation.
-
-Manuscript Type: {type}
-Manuscript Text (excerpt):
-{text}
-
-Reference Abstracts from recent PubMed articles:
-{abstracts}
+    'analysis': """You are an expert scientific peer reviewer. Analyze the manuscript below and provide a detailed evaluation.
 
 Evaluate the manuscript on these aspects:
 1. English language quality (grammar, clarity, academic style)
@@ -56,6 +58,36 @@ Evaluate the manuscript on these aspects:
 6. Data presentation and interpretation
 7. Conclusions supported by results
 
+Use the reference abstracts from recent PubMed articles to judge whether the manuscript is up-to-date.
+
+Provide your evaluation in this exact format:
+
+MAJOR POINTS:
+- [List critical issues that must be addressed]
+
+MINOR POINTS:
+- [List smaller issues that should be improved]
+
+OTHER POINTS:
+- [List optional suggestions or observations]
+
+SUGGESTIONS FOR IMPROVEMENT:
+- [List specific actionable suggestions]
+
+Manuscript Type: {type}
+Manuscript Text (excerpt):
+{text}
+
+Reference Abstracts from recent PubMed articles:
+{abstracts}
+
+Evaluation:""",
+    
+    'chunk_analysis': """You are an expert scientific peer reviewer. You will receive one part of a longer manuscript.
+Evaluate only this part; other reviewers cover the remaining sections.
+
+Evaluate language quality, structure, methodology, data presentation and whether claims are supported.
+
 Provide your evaluation in this exact format:
 
 MAJOR POINTS:
@@ -70,6 +102,39 @@ OTHER POINTS:
 SUGGESTIONS FOR IMPROVEMENT:
 - [List specific actionable suggestions]
 
+Manuscript Type: {type}
+Sections: {section}
+Manuscript Text:
+{text}
+
+Evaluation:""",
+    
+    'reduce': """You are an expert scientific peer reviewer. Several reviewers evaluated different sections of the same manuscript.
+Merge their evaluations into a single review: remove duplicated points, combine points that describe the same issue,
+and use the reference abstracts to judge whether the manuscript is up-to-date.
+
+Provide the merged evaluation in this exact format:
+
+MAJOR POINTS:
+- [List critical issues that must be addressed]
+
+MINOR POINTS:
+- [List smaller issues that should be improved]
+
+OTHER POINTS:
+- [List optional suggestions or observations]
+
+SUGGESTIONS FOR IMPROVEMENT:
+- [List specific actionable suggestions]
+
+Manuscript Type: {type}
+
+Section evaluations:
+{evaluations}
+
+Reference Abstracts from recent PubMed articles:
+{abstracts}
+
 Evaluation:"""
 }
 
@@ -77,11 +142,88 @@ Evaluation:"""
 PUBMED_INITIAL_YEARS = 5  # Años hacia atrás para búsqueda inicial
 PUBMED_MAX_RESULTS_THRESHOLD = 100  # Umbral para considerar "demasiados resultados"
 PUBMED_MIN_RESULTS_THRESHOLD = 5   # Umbral para considerar "pocos resultados"
+PUBMED_EFETCH_BATCH_SIZE = 200  # PMIDs por petición efetch/esummary
+PUBMED_MAX_REFERENCES = 10  # Abstracts completos que se incluyen en el prompt
+
+# Selección de referencias para el prompt (BM25 + MMR + recencia, ver reference_ranker.py)
+REFERENCE_CANDIDATE_POOL = 30  # Candidatos preseleccionados por título cuyos abstracts se descargan
+REFERENCE_MMR_LAMBDA = 0.5  # 1 = solo relevancia, 0 = solo diversidad
+REFERENCE_RECENCY_WEIGHT = 0.15  # Peso del bonus por artículo reciente
+REFERENCE_RECENCY_HALF_LIFE = 5  # Años en los que el bonus de recencia se reduce a la mitad
+PUBMED_MAX_WORKERS = 5  # Búsquedas simultáneas (limitadas por PUBMED_RATE_LIMIT)
+PUBMED_RATE_LIMIT = 3  # Peticiones/s permitidas por NCBI sin API key
+PUBMED_RATE_LIMIT_WITH_KEY = 10  # Peticiones/s permitidas por NCBI con API key
+
+# Origen de las búsquedas: "online" (Entrez) u "offline" (índice local importado
+# con `python main.py pubmed-import`, para equipos sin conexión)
+PUBMED_MODE = "online"
+PUBMED_OFFLINE_INDEX_PATH = os.path.join(PRRA_DATA_DIR, "pubmed_index.sqlite")
+
+# Caché local de resultados de PubMed
+PUBMED_CACHE_ENABLED = True
+PUBMED_CACHE_PATH = os.path.join(PRRA_DATA_DIR, "pubmed_cache.sqlite")
+PUBMED_CACHE_SEARCH_TTL_DAYS = 7  # Validez de las búsquedas (los artículos no caducan)
+PUBMED_CACHE_MAX_SEARCHES = 20000
+PUBMED_CACHE_MAX_ARTICLES = 200000
+
+# Extracción de PDF en paralelo (cada proceso abre el archivo y extrae un rango de páginas)
+PDF_EXTRACTION_WORKERS = os.cpu_count() or 1
+PDF_PARALLEL_MIN_PAGES = 12  # Con menos páginas no compensa arrancar procesos
+
+# Caché del texto extraído de los manuscritos (clave: hash del archivo y versión del extractor)
+EXTRACTION_CACHE_ENABLED = True
+EXTRACTION_CACHE_DIR = os.path.join(PRRA_DATA_DIR, "extraction_cache")
+EXTRACTION_CACHE_MAX_MB = 200  # Se descartan las entradas usadas menos recientemente
 
 # Configuración de generación de texto con IA
 MAX_INPUT_TOKENS = 2000
 MAX_OUTPUT_TOKENS_KEYPHRASES = 300
 MAX_OUTPUT_TOKENS_ANALYSIS = 2000
+DEFAULT_CONTEXT_WINDOW = 2048  # Si el modelo no declara su ventana de contexto
+GENERATION_PROGRESS_INTERVAL = 0.5  # Segundos mínimos entre avisos de progreso de la generación
+
+# Reparto de los tokens del prompt que quedan tras instrucciones y generación
+PROMPT_BUDGET_WEIGHTS = {'text': 0.65, 'abstracts': 0.35, 'evaluations': 0.65}
+PROMPT_MIN_PARTIAL_TOKENS = 48  # Un abstract se recorta solo si cabe al menos este trozo
+
+# Modo de documento largo: el manuscrito completo se evalúa por fragmentos
+# (una llamada a generate por lote) y un prompt final une las evaluaciones
+LONG_DOCUMENT_BATCH_SIZE = 4  # Fragmentos generados a la vez
+MAX_OUTPUT_TOKENS_CHUNK = 600
+LONG_DOCUMENT_CACHE_DIR = os.path.join(PRRA_DATA_DIR, "chunk_cache")
+
+# Pool de modelos cargados (se mantienen en memoria entre revisiones)
+MODEL_POOL_MAX_RAM_GB = 32   # Presupuesto para modelos en CPU
+MODEL_POOL_MAX_VRAM_GB = 24  # Presupuesto para modelos en GPU
+# La interfaz precarga el modelo elegido cuando la selección lleva este tiempo sin cambiar
+PRELOAD_DEBOUNCE_SECONDS = 0.5
+
+# Precisión de los modelos en CPU (en GPU siempre se usa fp16):
+# 'fp32', 'bf16' (solo si la CPU tiene instrucciones bf16; si no, se usa fp32)
+# o 'int8' (cuantización dinámica de las capas Linear, guardada en disco tras la primera conversión)
+CPU_PRECISIONS = ['fp32', 'bf16', 'int8']
+CPU_PRECISION = 'fp32'
+QUANTIZED_MODEL_CACHE_DIR = os.path.join(PRRA_DATA_DIR, "quantized_models")
+# Copias en safetensors de los modelos que solo publican pesos .bin (se cargan
+# mapeadas en memoria, sin pasar por una copia completa en RAM)
+SAFETENSORS_CACHE_DIR = os.path.join(PRRA_DATA_DIR, "safetensors_models")
+BENCHMARK_NEW_TOKENS = 64  # Tokens generados por modelo en `prra benchmark`
+
+# Planificador de memoria: antes de cargar un modelo se estima si cabe y,
+# si no, se baja la precisión o se descargan capas a RAM/disco
+MEMORY_PLAN_RESERVE_GB = 2.0  # Memoria que se deja libre para el sistema y la aplicación
+MEMORY_PLAN_OVERHEAD = 1.15   # Margen sobre pesos y KV cache (activaciones, buffers)
+MEMORY_PLAN_ALLOW_DISK_OFFLOAD = True  # Si es False, un modelo que no cabe en memoria se rechaza
+MODEL_OFFLOAD_DIR = os.path.join(PRRA_DATA_DIR, "offload")
+
+# KV cache del prefijo fijo de los prompts (instrucciones comunes a todos los manuscritos)
+PREFIX_CACHE_ENABLED = True
+PREFIX_CACHE_MAX_ENTRIES = 8  # Plantillas por modelo
+PREFIX_CACHE_MIN_TOKENS = 32  # Prefijos más cortos no compensan la copia de la caché
+
+# Configuración del modo batch (sin interfaz)
+BATCH_IO_WORKERS = 4  # Threads para extracción, PubMed e informes
+BATCH_MANIFEST_NAME = "prra_manifest.jsonl"
 
 # Configuración de interfaz
 WINDOW_WIDTH = 1000
@@ -1,23 +1,278 @@
 """
 Módulo para extracción de texto de diferentes formatos de documento
 """
+import atexit
+import multiprocessing
 import os
-from typing import Optional
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_EXCEPTION
+from typing import Callable, Collection, Dict, Iterator, List, NamedTuple, Optional, Sequence, Tuple
 from docx import Document
 from PyPDF2 import PdfReader
 from striprtf.striprtf import rtf_to_text
 
+from src.cancellation import CancelToken, ReviewCancelled
+from src.config import EXTRACTION_CACHE_ENABLED, PDF_EXTRACTION_WORKERS, PDF_PARALLEL_MIN_PAGES
+from src.extraction_cache import ExtractedManuscript, ExtractionCache
+
+# Versión de la extracción (texto, tipo de artículo y secciones): al cambiar
+# cualquiera de ellos se incrementa para invalidar la caché de extracción
+EXTRACTOR_VERSION = 2
+
+_pdf_executor: Optional[ProcessPoolExecutor] = None
+_pdf_executor_workers = 0
+_pdf_executor_lock = threading.Lock()
+
+
+def _get_pdf_executor(workers: int) -> ProcessPoolExecutor:
+    """
+    Devuelve el pool de procesos para extraer PDFs (se crea la primera vez y se reutiliza)
+    
+    Se usa "spawn" en lugar de fork: el proceso principal tiene threads
+    (Qt, carga de modelos) y torch cargado, que no se duplican de forma segura.
+    Si se pide otro número de procesos, el pool se sustituye por uno nuevo;
+    el anterior termina lo que tenga en marcha y se cierra.
+    """
+    global _pdf_executor, _pdf_executor_workers
+    with _pdf_executor_lock:
+        if _pdf_executor is not None and _pdf_executor_workers != workers:
+            _pdf_executor.shutdown(wait=False)
+            _pdf_executor = None
+        if _pdf_executor is None:
+            _pdf_executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+            _pdf_executor_workers = workers
+        return _pdf_executor
+
+
+@atexit.register
+def shutdown_pdf_executor():
+    """Cierra el pool de procesos de extracción de PDFs, si se llegó a crear (se vuelve a crear si hace falta)"""
+    global _pdf_executor
+    with _pdf_executor_lock:
+        executor, _pdf_executor = _pdf_executor, None
+    if executor is not None:
+        executor.shutdown(wait=True)
+
+
+def _extract_pdf_pages(file_path: str, start: int, stop: int) -> List[str]:
+    """
+    Extrae el texto de un rango de páginas (se ejecuta en un proceso del pool)
+    
+    Cada proceso abre el archivo por su cuenta: un PdfReader no se puede compartir entre procesos.
+    
+    Args:
+        file_path: Ruta al PDF
+        start: Primera página (incluida)
+        stop: Última página (excluida)
+        
+    Returns:
+        Texto de cada página, en orden ('' si la página no tiene texto)
+    """
+    reader = PdfReader(file_path)
+    return [reader.pages[i].extract_text() or '' for i in range(start, stop)]
+
+
+# Palabras clave de cada tipo de artículo y mínimo de palabras distintas
+# encontradas para asignarlo (se comprueban en este orden)
+ARTICLE_TYPE_KEYWORDS = {
+    'Research Article': (['methods', 'methodology', 'materials', 'results', 'discussion'], 4),
+    'Review': (['review', 'systematic review', 'meta-analysis', 'literature'], 2),
+    'Case Report': (['case report', 'case study', 'patient', 'diagnosis', 'treatment'], 3),
+}
+
+
+def _keyword_pattern(keyword: str) -> re.Pattern:
+    """
+    Expresión de una palabra clave: plural opcional, límite de palabra al final y cualquier espacio entre palabras
+    
+    Empieza por el texto literal de la palabra clave para que `re` la busque
+    con su búsqueda rápida de prefijos; un \\b inicial o IGNORECASE la desactivan,
+    así que el límite inicial se comprueba en _contains_keyword y el texto se pasa en minúsculas.
+    """
+    return re.compile(r'\s+'.join(re.escape(word) for word in keyword.split()) + r'(?:e?s)?\b')
+
+
+def _contains_keyword(text_lower: str, pattern: re.Pattern) -> bool:
+    """Indica si la palabra clave aparece como palabra completa (no dentro de otra: "preview" no es "review")"""
+    for match in pattern.finditer(text_lower):
+        start = match.start()
+        if start == 0 or not (text_lower[start - 1].isalnum() or text_lower[start - 1] == '_'):
+            return True
+    return False
+
+
+_ARTICLE_TYPE_PATTERNS = {
+    keyword: _keyword_pattern(keyword)
+    for keywords, _ in ARTICLE_TYPE_KEYWORDS.values()
+    for keyword in keywords
+}
+
+
+def _keyword_score(text_lower: str, keywords: List[str]) -> int:
+    """Número de palabras clave distintas que aparecen en el texto"""
+    return sum(1 for keyword in keywords if _contains_keyword(text_lower, _ARTICLE_TYPE_PATTERNS[keyword]))
+
+
+# Encabezados de sección habituales en artículos científicos (línea propia,
+# con numeración opcional: "2. Methods", "RESULTS", "Materials and methods:")
+_SECTION_HEADING = re.compile(
+    r'^[ \t]*(?:\d+(?:\.\d+)*\.?[ \t]+)?'
+    r'(abstract|summary|introduction|background|methods|materials and methods|patients and methods|'
+    r'methodology|results|findings|discussion|conclusions?|limitations|references|bibliography|'
+    r'acknowledge?ments)[ \t]*:?[ \t]*$',
+    re.IGNORECASE | re.MULTILINE
+)
+
+_NON_BLANK = re.compile(r'\S')
+
+
+def section_offsets(text: str) -> List[Tuple[str, int, int]]:
+    """
+    Localiza las secciones del manuscrito por sus encabezados
+
+    Args:
+        text: Texto completo del manuscrito
+
+    Returns:
+        Lista de (nombre de sección, inicio, fin) del cuerpo de cada sección
+        en `text`, sin el encabezado; el texto anterior al primer encabezado
+        se etiqueta como 'Front matter'. Se omiten las secciones vacías
+    """
+    offsets = []
+    start, label = 0, "Front matter"
+    for match in _SECTION_HEADING.finditer(text):
+        if _NON_BLANK.search(text, start, match.start()):
+            offsets.append((label, start, match.start()))
+        start, label = match.end(), match.group(1).strip().title()
+    if _NON_BLANK.search(text, start):
+        offsets.append((label, start, len(text)))
+    return offsets
+
+
+# Nombre común de cada encabezado de sección (los no listados se usan en minúsculas)
+_SECTION_KINDS = {
+    'summary': 'abstract',
+    'background': 'introduction',
+    'materials and methods': 'methods',
+    'patients and methods': 'methods',
+    'methodology': 'methods',
+    'findings': 'results',
+    'conclusion': 'conclusions',
+    'bibliography': 'references',
+    'acknowledgements': 'acknowledgments',
+    'acknowledgments': 'acknowledgments',
+    'acknowledgement': 'acknowledgments',
+    'acknowledgment': 'acknowledgments',
+}
+
+# Secciones que no aportan a la revisión del contenido
+NON_REVIEWABLE_SECTIONS = ('references', 'acknowledgments')
+
+
+class SectionSpan(NamedTuple):
+    """Cuerpo de una sección dentro del texto del manuscrito (sin el encabezado)"""
+    label: str
+    start: int
+    end: int
+    
+    @property
+    def kind(self) -> str:
+        """Nombre común de la sección: 'abstract', 'methods', 'results', 'references'..."""
+        name = self.label.lower()
+        return _SECTION_KINDS.get(name, name)
+
+
+class SectionIndex(Sequence[SectionSpan]):
+    """
+    Índice de las secciones de un manuscrito: posiciones en el texto, no copias
+    
+    Se construye una vez por manuscrito (DocumentProcessor.segment_sections)
+    y permite tomar solo las secciones que necesita cada etapa.
+    """
+    
+    def __init__(self, spans: Sequence[Tuple[str, int, int]]):
+        self._spans = tuple(SectionSpan(*span) for span in spans)
+    
+    def __getitem__(self, index):
+        return self._spans[index]
+    
+    def __len__(self) -> int:
+        return len(self._spans)
+    
+    def __eq__(self, other) -> bool:
+        return list(self) == list(other) if isinstance(other, Sequence) else NotImplemented
+    
+    def __repr__(self) -> str:
+        return f"SectionIndex({', '.join(span.label for span in self._spans)})"
+    
+    def find(self, kind: str) -> Optional[SectionSpan]:
+        """Primera sección de un tipo ('methods', 'results'...) o None"""
+        return next((span for span in self._spans if span.kind == kind), None)
+    
+    def select(self, text: str, kinds: Collection[str]) -> str:
+        """
+        Texto de las secciones pedidas, en el orden del manuscrito
+        
+        Args:
+            text: Texto del manuscrito del que se construyó el índice
+            kinds: Tipos de sección ('abstract', 'methods'...)
+            
+        Returns:
+            Cuerpos de las secciones separados por una línea en blanco
+        """
+        return '\n\n'.join(text[span.start:span.end].strip() for span in self._spans if span.kind in kinds)
+    
+    def excluding(self, text: str, kinds: Collection[str]) -> str:
+        """
+        Texto del manuscrito sin las secciones indicadas (con sus encabezados)
+        
+        Las secciones que se conservan mantienen su encabezado, así que el
+        resultado se puede volver a segmentar.
+        
+        Args:
+            text: Texto del manuscrito del que se construyó el índice
+            kinds: Tipos de sección que se quitan
+            
+        Returns:
+            Texto resultante
+        """
+        if not any(span.kind in kinds for span in self._spans):
+            return text
+        pieces = []
+        previous_end = 0
+        for span in self._spans:
+            if span.kind not in kinds:
+                pieces.append(text[previous_end:span.end])
+            previous_end = span.end
+        return ''.join(pieces)
+
+
+def _page_ranges(num_pages: int, workers: int) -> List[Tuple[int, int]]:
+    """
+    Divide las páginas en rangos contiguos para repartirlos entre procesos
+    
+    Se hacen unas cuatro tareas por proceso para equilibrar páginas con
+    mucho y poco texto sin multiplicar las veces que se abre el archivo.
+    """
+    size = max(1, -(-num_pages // (workers * 4)))
+    return [(start, min(start + size, num_pages)) for start in range(0, num_pages, size)]
+
 
 class DocumentProcessor:
     """Procesa documentos en múltiples formatos y extrae texto"""
     
     @staticmethod
-    def extract_text(file_path: str) -> str:
+    def extract_text(file_path: str, cancel_token: Optional[CancelToken] = None) -> str:
         """
         Extrae texto de un archivo según su extensión
         
         Args:
             file_path: Ruta al archivo
+            cancel_token: Señal de cancelación (se comprueba entre páginas de los PDF)
             
         Returns:
             Texto extraído del documento
@@ -33,7 +288,7 @@ class DocumentProcessor:
         
         try:
             if ext == '.pdf':
-                return DocumentProcessor._extract_from_pdf(file_path)
+                return DocumentProcessor._extract_from_pdf(file_path, cancel_token)
             elif ext in ['.doc', '.docx']:
                 return DocumentProcessor._extract_from_docx(file_path)
             elif ext == '.rtf':
@@ -42,25 +297,250 @@ class DocumentProcessor:
                 return DocumentProcessor._extract_from_txt(file_path)
             else:
                 raise ValueError(f"Formato no soportado: {ext}")
+        except ReviewCancelled:
+            raise
         except Exception as e:
             raise Exception(f"Error al extraer texto del archivo {file_path}: {str(e)}")
     
     @staticmethod
-    def _extract_from_pdf(file_path: str) -> str:
-        """Extrae texto de un archivo PDF"""
+    def extract_manuscript(
+        file_path: str,
+        cancel_token: Optional[CancelToken] = None,
+        cache: Optional[ExtractionCache] = None
+    ) -> ExtractedManuscript:
+        """
+        Extrae el texto, el tipo de artículo y las secciones, reutilizando la caché de extracción
+        
+        La caché se indexa por el contenido del archivo: si el mismo manuscrito
+        ya se extrajo (aunque sea con otro nombre), no se vuelve a abrir con PyPDF2.
+        
+        Args:
+            file_path: Ruta al archivo
+            cancel_token: Señal de cancelación (se comprueba entre páginas de los PDF)
+            cache: Caché de extracción (por defecto la de EXTRACTION_CACHE_DIR si
+                EXTRACTION_CACHE_ENABLED)
+            
+        Returns:
+            Manuscrito extraído; `cached` indica si salió de la caché
+            
+        Raises:
+            ValueError: Si el formato no es soportado o el documento está vacío
+            FileNotFoundError: Si el archivo no existe
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Archivo no encontrado: {file_path}")
+        
+        if cache is None and EXTRACTION_CACHE_ENABLED:
+            cache = ExtractionCache()
+        
+        key = None
+        if cache is not None:
+            key = cache.key(file_path, EXTRACTOR_VERSION)
+            manuscript = cache.get(key)
+            if manuscript is not None:
+                manuscript.sections = SectionIndex(manuscript.sections)
+                return manuscript
+        
+        text = DocumentProcessor.extract_text(file_path, cancel_token)
+        if not text.strip():
+            raise ValueError("The manuscript appears to be empty or unreadable")
+        
+        manuscript = ExtractedManuscript(
+            text=text,
+            article_type=DocumentProcessor.detect_article_type(text),
+            sections=DocumentProcessor.segment_sections(text)
+        )
+        
+        if cache is not None:
+            try:
+                cache.put(key, manuscript)
+            except OSError as e:
+                print(f"Error guardando en la caché de extracción: {str(e)}")
+        
+        return manuscript
+    
+    @staticmethod
+    def segment_sections(text: str) -> SectionIndex:
+        """
+        Localiza las secciones (Abstract, Methods, Results, Discussion, References...) en una pasada
+        
+        Sirve para todos los formatos porque trabaja sobre el texto ya extraído:
+        los encabezados se reconocen en una línea propia, con numeración opcional.
+        
+        Args:
+            text: Texto del manuscrito
+            
+        Returns:
+            Índice de secciones; el texto anterior al primer encabezado es 'Front matter'
+        """
+        return SectionIndex(section_offsets(text))
+    
+    @staticmethod
+    def iter_text(
+        file_path: str,
+        max_chars: Optional[int] = None,
+        stop_when: Optional[Callable[[str], bool]] = None
+    ) -> Iterator[str]:
+        """
+        Recorre el texto del documento por páginas (PDF) o párrafos (DOCX, RTF, TXT)
+        
+        El documento se lee a medida que se piden fragmentos, así que quien solo
+        necesita el principio no extrae el resto: en un PDF solo se procesan las
+        páginas recorridas. Las páginas y párrafos vacíos se omiten.
+        
+        Args:
+            file_path: Ruta al archivo
+            max_chars: Se deja de leer al reunir este número de caracteres (el último fragmento se recorta)
+            stop_when: Función que recibe cada fragmento; si devuelve True se deja de leer
+                       y ese fragmento no se devuelve (p. ej. al llegar a las referencias)
+            
+        Yields:
+            Texto de cada página o párrafo, en orden
+            
+        Raises:
+            ValueError: Si el formato no es soportado
+            FileNotFoundError: Si el archivo no existe
+        """
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"Archivo no encontrado: {file_path}")
+        
+        readers = {
+            '.pdf': DocumentProcessor._iter_pdf_pages,
+            '.doc': DocumentProcessor._iter_docx_paragraphs,
+            '.docx': DocumentProcessor._iter_docx_paragraphs,
+            '.rtf': DocumentProcessor._iter_rtf_paragraphs,
+            '.txt': DocumentProcessor._iter_txt_paragraphs
+        }
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in readers:
+            raise ValueError(f"Formato no soportado: {ext}")
+        
+        total = 0
+        for piece in readers[ext](file_path):
+            if not piece.strip():
+                continue
+            if stop_when is not None and stop_when(piece):
+                return
+            if max_chars is not None and total + len(piece) >= max_chars:
+                yield piece[:max_chars - total]
+                return
+            total += len(piece)
+            yield piece
+    
+    @staticmethod
+    def _iter_pdf_pages(file_path: str) -> Iterator[str]:
+        """Extrae las páginas de un PDF una a una"""
         reader = PdfReader(file_path)
-        text_parts = []
         for page in reader.pages:
-            page_text = page.extract_text()
-            if page_text:
-                text_parts.append(page_text)
-        return ' '.join(text_parts)
+            yield page.extract_text() or ''
+    
+    @staticmethod
+    def _iter_docx_paragraphs(file_path: str) -> Iterator[str]:
+        """Recorre los párrafos de un DOCX (python-docx lee el XML entero, pero no se copia el texto)"""
+        for paragraph in Document(file_path).paragraphs:
+            yield paragraph.text
+    
+    @staticmethod
+    def _iter_rtf_paragraphs(file_path: str) -> Iterator[str]:
+        """
+        Recorre los párrafos de un RTF
+        
+        striprtf no convierte por partes, así que el RTF se convierte entero y se devuelve por párrafos.
+        """
+        yield from DocumentProcessor._extract_from_rtf(file_path).split('\n')
+    
+    @staticmethod
+    def _iter_txt_paragraphs(file_path: str) -> Iterator[str]:
+        """Lee un TXT línea a línea y devuelve sus párrafos (separados por líneas en blanco)"""
+        with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
+            lines = []
+            for line in f:
+                if line.strip():
+                    lines.append(line.rstrip('\n'))
+                elif lines:
+                    yield '\n'.join(lines)
+                    lines = []
+            if lines:
+                yield '\n'.join(lines)
+    
+    @staticmethod
+    def _extract_from_pdf(
+        file_path: str,
+        cancel_token: Optional[CancelToken] = None,
+        workers: int = PDF_EXTRACTION_WORKERS,
+        min_pages: int = PDF_PARALLEL_MIN_PAGES
+    ) -> str:
+        """
+        Extrae texto de un archivo PDF
+        
+        Con `min_pages` páginas o más, los rangos de páginas se extraen en un
+        pool de procesos y se unen en orden; el resultado es idéntico al de la
+        extracción página a página.
+        
+        Args:
+            file_path: Ruta al PDF
+            cancel_token: Señal de cancelación
+            workers: Procesos del pool
+            min_pages: Páginas a partir de las cuales se extrae en paralelo
+            
+        Returns:
+            Texto de las páginas con texto, separadas por un espacio
+        """
+        reader = PdfReader(file_path)
+        num_pages = len(reader.pages)
+        
+        if workers <= 1 or num_pages < min_pages:
+            page_texts = []
+            for page in reader.pages:
+                if cancel_token is not None:
+                    cancel_token.raise_if_cancelled()
+                page_texts.append(page.extract_text() or '')
+        else:
+            page_texts = DocumentProcessor._extract_pdf_parallel(file_path, num_pages, workers, cancel_token)
+        
+        return ' '.join(text for text in page_texts if text)
+    
+    @staticmethod
+    def _extract_pdf_parallel(
+        file_path: str,
+        num_pages: int,
+        workers: int,
+        cancel_token: Optional[CancelToken] = None
+    ) -> List[str]:
+        """
+        Extrae rangos de páginas en el pool de procesos
+        
+        Al cancelar se descartan los rangos pendientes; los que ya están en
+        marcha terminan en segundo plano (son de pocas páginas).
+        
+        Returns:
+            Texto de cada página, en orden
+        """
+        executor = _get_pdf_executor(workers)
+        futures = [
+            executor.submit(_extract_pdf_pages, file_path, start, stop)
+            for start, stop in _page_ranges(num_pages, workers)
+        ]
+        
+        try:
+            pending = set(futures)
+            while pending:
+                if cancel_token is not None and cancel_token.cancelled:
+                    raise ReviewCancelled("Review cancelled by the user")
+                done, pending = wait(pending, timeout=0.2, return_when=FIRST_EXCEPTION)
+                for future in done:
+                    future.result()  # Propaga el primer error de un proceso
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+        
+        return [text for future in futures for text in future.result()]
     
     @staticmethod
     def _extract_from_docx(file_path: str) -> str:
         """Extrae texto de un archivo DOCX o DOC"""
-        doc = Document(file_path)
-        return '\n'.join(paragraph.text for paragraph in doc.paragraphs if paragraph.text.strip())
+        return '\n'.join(text for text in DocumentProcessor._iter_docx_paragraphs(file_path) if text.strip())
     
     @staticmethod
     def _extract_from_rtf(file_path: str) -> str:
@@ -87,28 +567,32 @@ class DocumentProcessor:
             Tipo de artículo: "Research Article", "Review", "Case Report", u "Other"
         """
         text_lower = text.lower()
+        # Los tipos se puntúan por orden y se deja de buscar al asignar uno
+        for article_type, (keywords, threshold) in ARTICLE_TYPE_KEYWORDS.items():
+            if _keyword_score(text_lower, keywords) >= threshold:
+                return article_type
+        return "Other"
+    
+    @staticmethod
+    def article_type_scores(text: str) -> Dict[str, int]:
+        """
+        Cuenta cuántas palabras clave distintas de cada tipo de artículo aparecen en el texto
         
-        # Palabras clave para artículos de investigación
-        research_keywords = ['methods', 'methodology', 'materials', 'results', 'discussion']
-        research_count = sum(1 for keyword in research_keywords if keyword in text_lower)
-        
-        # Palabras clave para revisiones
-        review_keywords = ['review', 'systematic review', 'meta-analysis', 'literature']
-        review_count = sum(1 for keyword in review_keywords if keyword in text_lower)
-        
-        # Palabras clave para casos clínicos
-        case_keywords = ['case report', 'case study', 'patient', 'diagnosis', 'treatment']
-        case_count = sum(1 for keyword in case_keywords if keyword in text_lower)
-        
-        # Determinar tipo basándose en las coincidencias
-        if research_count >= 4:
-            return "Research Article"
-        elif review_count >= 2:
-            return "Review"
-        elif case_count >= 3:
-            return "Case Report"
-        else:
-            return "Other"
+        Las palabras clave cuentan solo como palabras completas (con plural
+        opcional) y una vez cada una. Cada búsqueda se detiene en la primera
+        aparición.
+        
+        Args:
+            text: Texto del manuscrito
+            
+        Returns:
+            Puntuación de cada tipo de ARTICLE_TYPE_KEYWORDS
+        """
+        text_lower = text.lower()
+        return {
+            article_type: _keyword_score(text_lower, keywords)
+            for article_type, (keywords, _) in ARTICLE_TYPE_KEYWORDS.items()
+        }
     
     @staticmethod
     def get_text_preview(text: str, max_chars: int = 1000) -> str:
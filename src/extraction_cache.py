@@ -0,0 +1,125 @@
+"""
+Caché en disco del texto extraído de los manuscritos, indexada por el contenido del archivo
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence, Tuple
+
+from src.config import EXTRACTION_CACHE_DIR, EXTRACTION_CACHE_MAX_MB
+
+_HASH_BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ExtractedManuscript:
+    """Texto extraído de un manuscrito y lo que se deduce de él"""
+    text: str
+    article_type: str
+    sections: Sequence[Tuple[str, int, int]]  # (sección, inicio, fin) dentro de text
+    cached: bool = False
+
+
+def file_digest(file_path: str) -> str:
+    """
+    Hash blake2b del contenido del archivo, leído por bloques
+
+    Args:
+        file_path: Ruta al archivo
+
+    Returns:
+        Hash en hexadecimal
+    """
+    digest = hashlib.blake2b(digest_size=20)
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK_SIZE), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class ExtractionCache:
+    """
+    Caché del texto extraído, tipo de artículo y secciones de cada manuscrito.
+
+    La clave es el hash del contenido (no la ruta), así que un archivo
+    renombrado o copiado se reutiliza y uno modificado se vuelve a extraer.
+    Incluye la versión del extractor para invalidar las entradas cuando cambia
+    la extracción. Al superar `max_bytes` se borran las entradas usadas
+    menos recientemente.
+    """
+
+    def __init__(self, cache_dir: str = EXTRACTION_CACHE_DIR, max_bytes: int = EXTRACTION_CACHE_MAX_MB * 1024 ** 2):
+        """
+        Inicializa la caché
+
+        Args:
+            cache_dir: Directorio donde se guardan las entradas
+            max_bytes: Tamaño máximo de la caché en disco
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+
+    @staticmethod
+    def key(file_path: str, extractor_version: int) -> str:
+        """Clave de un archivo: hash de su contenido y versión del extractor"""
+        return f"{file_digest(file_path)}-v{extractor_version}"
+
+    def get(self, key: str) -> Optional[ExtractedManuscript]:
+        """Devuelve la extracción guardada (y la marca como usada) o None"""
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            os.utime(path)
+            return ExtractedManuscript(
+                text=entry['text'],
+                article_type=entry['article_type'],
+                sections=[tuple(section) for section in entry['sections']],
+                cached=True
+            )
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def put(self, key: str, manuscript: ExtractedManuscript):
+        """Guarda una extracción (escritura atómica) y descarta las entradas más antiguas si hace falta"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({
+                'text': manuscript.text,
+                'article_type': manuscript.article_type,
+                'sections': [list(section) for section in manuscript.sections]
+            }, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self) -> int:
+        """
+        Borra las entradas usadas menos recientemente hasta que la caché quepa en `max_bytes`
+
+        Returns:
+            Número de entradas borradas
+        """
+        entries = []
+        try:
+            for entry in os.scandir(self.cache_dir):
+                if entry.name.endswith('.json'):
+                    stat = entry.stat()
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+        except OSError:
+            return 0
+
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
@@ -0,0 +1,118 @@
+"""
+Seguimiento en vivo de la generación de texto (tokens, velocidad, tiempo)
+"""
+import time
+from dataclasses import dataclass
+from typing import Callable, Optional
+
+from transformers.generation.streamers import BaseStreamer
+
+from src.config import GENERATION_PROGRESS_INTERVAL
+
+
+@dataclass
+class GenerationProgress:
+    """Estado de una llamada a generate en curso"""
+    stage: str
+    tokens: int
+    max_tokens: int
+    elapsed: float
+    tokens_per_second: float
+    part: int = 1
+    parts: int = 1
+    finished: bool = False
+
+    @property
+    def fraction(self) -> float:
+        """Fracción completada de la etapa (las etapas con varias llamadas avanzan por partes)"""
+        current = min(self.tokens / self.max_tokens, 1.0) if self.max_tokens else 1.0
+        if self.finished:
+            current = 1.0
+        return (self.part - 1 + current) / self.parts
+
+    def format(self) -> str:
+        """Devuelve el estado en una línea legible"""
+        minutes, seconds = divmod(int(self.elapsed), 60)
+        part = f" ({self.part}/{self.parts})" if self.parts > 1 else ""
+        return (
+            f"{self.stage}{part}: {self.tokens}/{self.max_tokens} tokens · "
+            f"{self.tokens_per_second:.1f} tok/s · {minutes}:{seconds:02d} elapsed"
+        )
+
+
+class ProgressStreamer(BaseStreamer):
+    """
+    Streamer de generate que cuenta los pasos de generación.
+
+    No decodifica texto: solo cuenta tokens y llama a `callback` como mucho
+    cada `interval` segundos, para no saturar la interfaz con una señal por
+    token ni ralentizar la generación.
+    """
+
+    def __init__(
+        self,
+        callback: Callable[[GenerationProgress], None],
+        stage: str,
+        max_tokens: int,
+        part: int = 1,
+        parts: int = 1,
+        interval: float = GENERATION_PROGRESS_INTERVAL,
+        clock: Callable[[], float] = time.perf_counter
+    ):
+        """
+        Inicializa el streamer
+
+        Args:
+            callback: Función que recibe el progreso
+            stage: Nombre de la etapa que se muestra al usuario
+            max_tokens: Tokens máximos de la generación
+            part: Llamada actual dentro de la etapa (empezando en 1)
+            parts: Número de llamadas de la etapa
+            interval: Segundos mínimos entre avisos
+            clock: Reloj en segundos (se sustituye en las pruebas)
+        """
+        self.callback = callback
+        self.stage = stage
+        self.max_tokens = max_tokens
+        self.part = part
+        self.parts = parts
+        self.interval = interval
+        self.clock = clock
+        self.tokens = 0
+        self.started: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self._last_emit = 0.0
+
+    def put(self, value):
+        """Recibe el prompt (primera llamada) y después los tokens de cada paso"""
+        now = self.clock()
+        if self.started is None:
+            self.started = now
+            self._last_emit = now
+            self._emit(now)
+            return
+
+        if self.first_token_at is None:
+            self.first_token_at = now
+        self.tokens += 1
+        if now - self._last_emit >= self.interval:
+            self._emit(now)
+
+    def end(self):
+        """Avisa del final de la generación"""
+        self._emit(self.clock(), finished=True)
+
+    def _emit(self, now: float, finished: bool = False):
+        """Envía el progreso actual al callback"""
+        self._last_emit = now
+        decoding_time = now - self.first_token_at if self.first_token_at is not None else 0.0
+        self.callback(GenerationProgress(
+            stage=self.stage,
+            tokens=self.tokens,
+            max_tokens=self.max_tokens,
+            elapsed=now - (self.started if self.started is not None else now),
+            tokens_per_second=(self.tokens - 1) / decoding_time if decoding_time > 0 else 0.0,
+            part=self.part,
+            parts=self.parts,
+            finished=finished
+        ))
@@ -0,0 +1,188 @@
+"""
+Utilidades del modo de documento largo (análisis map-reduce por fragmentos)
+"""
+import hashlib
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+from src.config import LONG_DOCUMENT_CACHE_DIR
+from src.document_processor import section_offsets
+
+# Secciones que no se envían al modelo
+_SKIPPED_SECTIONS = {'references', 'bibliography', 'acknowledgments', 'acknowledgements'}
+
+_EVALUATION_SECTIONS = ('major', 'minor', 'other', 'suggestions')
+
+
+def split_sections(text: str) -> List[Tuple[str, str]]:
+    """
+    Divide el manuscrito por sus encabezados de sección
+
+    Args:
+        text: Texto completo del manuscrito
+
+    Returns:
+        Lista de (nombre de sección, texto); el texto anterior al primer
+        encabezado se etiqueta como 'Front matter'
+    """
+    return [(label, text[start:end].strip()) for label, start, end in section_offsets(text)]
+
+
+def chunk_manuscript(text: str, tokenizer, max_tokens: int) -> List[Tuple[str, str]]:
+    """
+    Divide el manuscrito en fragmentos de como máximo `max_tokens` tokens
+
+    Las secciones se agrupan mientras quepan juntas; una sección demasiado
+    larga se parte por párrafos y, si un párrafo no cabe, por tokens.
+
+    Args:
+        text: Texto completo del manuscrito
+        tokenizer: Tokenizador del modelo
+        max_tokens: Tokens máximos por fragmento
+
+    Returns:
+        Lista de (secciones incluidas, texto del fragmento)
+    """
+    sections = [
+        (label, body) for label, body in split_sections(text)
+        if label.lower() not in _SKIPPED_SECTIONS
+    ]
+
+    # Unidades mínimas: párrafos etiquetados con su sección
+    units: List[Tuple[str, str]] = []
+    for label, body in sections:
+        units.extend((label, paragraph.strip()) for paragraph in re.split(r'\n\s*\n', body) if paragraph.strip())
+    if not units:
+        return []
+
+    token_counts = [len(ids) for ids in tokenizer([unit for _, unit in units], add_special_tokens=False)['input_ids']]
+
+    chunks: List[Tuple[str, str]] = []
+    labels: List[str] = []
+    parts: List[str] = []
+    used = 0
+
+    def flush():
+        nonlocal labels, parts, used
+        if parts:
+            chunks.append((', '.join(labels), '\n\n'.join(parts)))
+        labels, parts, used = [], [], 0
+
+    for (label, paragraph), count in zip(units, token_counts):
+        if count > max_tokens:
+            # Párrafo más largo que un fragmento: se corta por tokens
+            flush()
+            ids = tokenizer(paragraph, add_special_tokens=False)['input_ids']
+            for i in range(0, len(ids), max_tokens):
+                chunks.append((label, tokenizer.decode(ids[i:i + max_tokens], skip_special_tokens=True)))
+            continue
+        if used + count > max_tokens:
+            flush()
+        if label not in labels:
+            labels.append(label)
+        parts.append(paragraph)
+        used += count
+    flush()
+
+    return chunks
+
+
+def format_partial_evaluation(label: str, evaluation: Dict[str, List[str]]) -> str:
+    """
+    Formatea la evaluación de un fragmento para el prompt de reducción
+
+    Args:
+        label: Secciones del manuscrito que cubre el fragmento
+        evaluation: Evaluación parseada del fragmento
+
+    Returns:
+        Texto con los puntos del fragmento agrupados por tipo
+    """
+    titles = {
+        'major': 'MAJOR POINTS',
+        'minor': 'MINOR POINTS',
+        'other': 'OTHER POINTS',
+        'suggestions': 'SUGGESTIONS FOR IMPROVEMENT'
+    }
+    lines = [f"[{label}]"]
+    for key in _EVALUATION_SECTIONS:
+        if evaluation.get(key):
+            lines.append(f"{titles[key]}:")
+            lines.extend(f"- {point}" for point in evaluation[key])
+    return '\n'.join(lines)
+
+
+def has_evaluation_structure(text: str) -> bool:
+    """Indica si una respuesta del modelo tiene los encabezados del formato de evaluación"""
+    text_upper = text.upper()
+    return 'MAJOR POINT' in text_upper or 'MINOR POINT' in text_upper
+
+
+def merge_evaluations(evaluations: List[Dict[str, List[str]]]) -> Dict[str, List[str]]:
+    """
+    Une las evaluaciones de varios fragmentos eliminando puntos repetidos
+
+    Se usa cuando la respuesta del prompt de reducción no tiene la estructura
+    esperada.
+
+    Args:
+        evaluations: Evaluaciones parseadas de cada fragmento
+
+    Returns:
+        Diccionario con secciones: major, minor, other, suggestions
+    """
+    merged = {key: [] for key in _EVALUATION_SECTIONS}
+    seen = set()
+    for evaluation in evaluations:
+        for key in _EVALUATION_SECTIONS:
+            for point in evaluation.get(key, []):
+                normalized = re.sub(r'\W+', ' ', point.lower()).strip()
+                if normalized and normalized not in seen:
+                    seen.add(normalized)
+                    merged[key].append(point)
+    return merged
+
+
+class ChunkCache:
+    """
+    Caché en disco de las respuestas del modelo para cada fragmento.
+
+    La clave incluye el modelo, el prompt completo y los parámetros de
+    generación, así que reanalizar el mismo manuscrito (o una versión con
+    solo algunas secciones cambiadas) solo genera los fragmentos nuevos.
+    """
+
+    def __init__(self, cache_dir: str = LONG_DOCUMENT_CACHE_DIR):
+        """
+        Inicializa la caché
+
+        Args:
+            cache_dir: Directorio donde se guardan las respuestas
+        """
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def key(model_name: str, prompt: str, **params) -> str:
+        """Clave de un fragmento: hash del modelo, el prompt y los parámetros de generación"""
+        payload = json.dumps({'model': model_name, 'prompt': prompt, 'params': params}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """Devuelve la respuesta guardada o None"""
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)['output']
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def put(self, key: str, output: str):
+        """Guarda una respuesta (escritura atómica)"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = os.path.join(self.cache_dir, f"{key}.json")
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'output': output}, f)
+        os.replace(tmp_path, path)
@@ -0,0 +1,344 @@
+"""
+Planificador de memoria: comprueba si un modelo cabe antes de cargar sus pesos
+"""
+import os
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from src.config import (
+    CPU_PRECISIONS,
+    MAX_INPUT_TOKENS,
+    MAX_OUTPUT_TOKENS_ANALYSIS,
+    MEMORY_PLAN_ALLOW_DISK_OFFLOAD,
+    MEMORY_PLAN_OVERHEAD,
+    MEMORY_PLAN_RESERVE_GB,
+    MODEL_OFFLOAD_DIR
+)
+
+_BYTES_PER_PARAMETER = {'fp32': 4, 'bf16': 2, 'fp16': 2}
+_GB = 1024 ** 3
+
+
+@dataclass
+class ModelFootprint:
+    """Tamaño de un modelo calculado a partir de su configuración (sin descargar los pesos)"""
+    parameters: int
+    embedding_parameters: int
+    kv_elements_per_token: int
+
+    def weights_bytes(self, precision: str) -> int:
+        """
+        Memoria de los pesos con una precisión
+
+        En int8 solo se cuantizan las capas Linear; los embeddings siguen en fp32.
+        """
+        if precision == 'int8':
+            return self.embedding_parameters * 4 + (self.parameters - self.embedding_parameters)
+        return self.parameters * _BYTES_PER_PARAMETER[precision]
+
+    def kv_cache_bytes(self, precision: str, tokens: int, batch_size: int = 1) -> int:
+        """Memoria de la KV cache para `batch_size` secuencias de `tokens` tokens"""
+        element_size = 2 if precision in ('fp16', 'bf16') else 4
+        return self.kv_elements_per_token * tokens * batch_size * element_size
+
+
+def footprint_from_config(config: Any) -> ModelFootprint:
+    """
+    Estima parámetros y KV cache de un modelo decoder a partir de su configuración
+
+    Cuenta embeddings, atención (con grouped-query attention si el modelo la
+    usa), MLP con compuerta y normalizaciones. Es exacto para Llama, Qwen2 y
+    Phi-3 salvo sesgos y otros términos despreciables.
+
+    Args:
+        config: Configuración del modelo (AutoConfig)
+
+    Returns:
+        Huella del modelo
+    """
+    hidden = config.hidden_size
+    layers = config.num_hidden_layers
+    heads = config.num_attention_heads
+    kv_heads = getattr(config, 'num_key_value_heads', None) or heads
+    head_dim = getattr(config, 'head_dim', None) or hidden // heads
+    intermediate = getattr(config, 'intermediate_size', None) or 4 * hidden
+    embeddings = config.vocab_size * hidden
+
+    attention = 2 * hidden * heads * head_dim + 2 * hidden * kv_heads * head_dim
+    mlp = 3 * hidden * intermediate
+    per_layer = attention + mlp + 2 * hidden
+    output = 0 if getattr(config, 'tie_word_embeddings', False) else embeddings
+
+    return ModelFootprint(
+        parameters=embeddings + output + layers * per_layer + hidden,
+        embedding_parameters=embeddings,
+        kv_elements_per_token=2 * layers * kv_heads * head_dim
+    )
+
+
+@dataclass
+class MemoryPlan:
+    """Cómo se va a cargar un modelo (o por qué no se puede cargar)"""
+    model_name: str
+    device: str
+    precision: str
+    fits: bool
+    weights_bytes: int
+    kv_cache_bytes: int
+    available_ram: Optional[int]
+    available_vram: Optional[int] = None
+    requested_precision: Optional[str] = None
+    device_map: Optional[str] = None
+    max_memory: Optional[Dict[Any, int]] = None
+    offload_folder: Optional[str] = None
+    notes: List[str] = field(default_factory=list)
+
+    @property
+    def needed_bytes(self) -> int:
+        """Memoria total estimada (pesos, KV cache y margen)"""
+        return int((self.weights_bytes + self.kv_cache_bytes) * MEMORY_PLAN_OVERHEAD)
+
+    @property
+    def offloaded(self) -> bool:
+        """Indica si parte de las capas se descarga a CPU o a disco"""
+        return self.device_map is not None
+
+    @property
+    def adjusted(self) -> bool:
+        """Indica si el plan cambia la precisión pedida o descarga capas (conviene confirmarlo)"""
+        return self.offloaded or self.precision != (self.requested_precision or self.precision)
+
+    def load_kwargs(self) -> Dict[str, Any]:
+        """Argumentos de from_pretrained para aplicar el plan"""
+        kwargs = {}
+        if self.device_map is not None:
+            kwargs['device_map'] = self.device_map
+            kwargs['max_memory'] = self.max_memory
+        if self.offload_folder is not None:
+            kwargs['offload_folder'] = self.offload_folder
+        return kwargs
+
+    def summary(self) -> str:
+        """Devuelve el plan en texto legible (una línea y una por nota)"""
+        available = self.available_vram if self.device == "cuda" else self.available_ram
+        available_text = f"{available / _GB:.1f} GB available" if available is not None else "available memory unknown"
+        placement = "GPU" if self.device == "cuda" else "CPU"
+        lines = [
+            f"{self.model_name}: {self.precision} on {placement}, ~{self.needed_bytes / _GB:.1f} GB "
+            f"(weights {self.weights_bytes / _GB:.1f} GB + KV cache {self.kv_cache_bytes / _GB:.1f} GB), "
+            f"{available_text}"
+        ]
+        lines.extend(f"  • {note}" for note in self.notes)
+        return "\n".join(lines)
+
+
+def choose_plan(
+    model_name: str,
+    footprint: ModelFootprint,
+    precision: str,
+    available_ram: Optional[int],
+    available_vram: Optional[int] = None,
+    tokens: int = MAX_INPUT_TOKENS + MAX_OUTPUT_TOKENS_ANALYSIS,
+    batch_size: int = 1,
+    bf16_supported: bool = False,
+    int8_cached: bool = False,
+    allow_disk_offload: bool = MEMORY_PLAN_ALLOW_DISK_OFFLOAD,
+    reserve_bytes: int = int(MEMORY_PLAN_RESERVE_GB * _GB)
+) -> MemoryPlan:
+    """
+    Elige precisión y reparto del modelo según la memoria disponible
+
+    En GPU se carga entero si cabe; si no, las capas que no caben se
+    descargan a RAM y, en último caso, a disco. En CPU se prueba la precisión
+    pedida y después las que ocupan menos (bf16 si la CPU lo soporta, int8);
+    si ninguna cabe, se descargan capas a disco. Si nada es posible el plan
+    se marca como que no cabe.
+
+    Args:
+        model_name: Nombre del modelo
+        footprint: Huella estimada del modelo
+        precision: Precisión pedida ('fp16' en GPU; 'fp32', 'bf16' o 'int8' en CPU)
+        available_ram: RAM disponible en bytes (None si no se conoce)
+        available_vram: VRAM disponible en bytes (None si no hay GPU)
+        tokens: Longitud máxima de una secuencia (prompt y generación)
+        batch_size: Secuencias generadas a la vez
+        bf16_supported: Si la CPU tiene instrucciones bf16 nativas
+        int8_cached: Si el modelo ya está cuantizado en la caché de disco
+        allow_disk_offload: Si se permite descargar capas a disco
+        reserve_bytes: Memoria que se deja libre para el sistema y la aplicación
+
+    Returns:
+        Plan de carga
+    """
+    requested = precision
+
+    def plan(precision: str, device: str, fits: bool = True, **kwargs) -> MemoryPlan:
+        return MemoryPlan(
+            model_name=model_name,
+            device=device,
+            precision=precision,
+            requested_precision=requested,
+            fits=fits,
+            weights_bytes=footprint.weights_bytes(precision),
+            kv_cache_bytes=footprint.kv_cache_bytes(precision, tokens, batch_size),
+            available_ram=available_ram,
+            available_vram=available_vram,
+            **kwargs
+        )
+
+    def needed(precision: str) -> int:
+        return plan(precision, "cpu").needed_bytes
+
+    ram_budget = available_ram - reserve_bytes if available_ram is not None else None
+
+    if available_vram is not None:
+        vram_budget = available_vram - reserve_bytes // 4
+        if needed('fp16') <= vram_budget:
+            return plan('fp16', "cuda")
+
+        # Las capas que no caben en la GPU van a RAM (y a disco si tampoco caben)
+        kv_bytes = int(footprint.kv_cache_bytes('fp16', tokens, batch_size) * MEMORY_PLAN_OVERHEAD)
+        gpu_weights = max(vram_budget - kv_bytes, 0)
+        cpu_weights = max(ram_budget or 0, 0)
+        offload = {'device_map': "auto", 'max_memory': {0: gpu_weights, 'cpu': cpu_weights}}
+        weights = footprint.weights_bytes('fp16')
+        if gpu_weights and weights <= gpu_weights + cpu_weights:
+            return plan('fp16', "cuda", notes=[
+                f"{(weights - gpu_weights) / _GB:.1f} GB of layers offloaded to CPU RAM (slower generation)"
+            ], **offload)
+        if gpu_weights and allow_disk_offload:
+            return plan('fp16', "cuda", offload_folder=MODEL_OFFLOAD_DIR, notes=[
+                f"{max(weights - gpu_weights - cpu_weights, 0) / _GB:.1f} GB of layers offloaded to disk "
+                f"(much slower generation)"
+            ], **offload)
+        return plan('fp16', "cuda", fits=False, notes=[
+            "Not enough GPU memory for the KV cache; choose a smaller model or free GPU memory"
+        ])
+
+    if ram_budget is None:
+        return plan(precision, "cpu", notes=["Available memory unknown: the fit was not checked"])
+
+    candidates = CPU_PRECISIONS[CPU_PRECISIONS.index(precision):]
+    for candidate in candidates:
+        if candidate == 'bf16' and not bf16_supported:
+            continue
+        if needed(candidate) > ram_budget:
+            continue
+        notes = []
+        if candidate == 'int8' and not int8_cached:
+            # La primera conversión a int8 necesita el modelo completo en fp32
+            if footprint.weights_bytes('fp32') > ram_budget:
+                continue
+            notes.append("First int8 load converts the model from fp32 and caches it on disk")
+        if candidate != precision:
+            notes.insert(0, f"{precision} needs ~{needed(precision) / _GB:.1f} GB; using {candidate} instead")
+        return plan(candidate, "cpu", notes=notes)
+
+    # Ninguna precisión cabe: las capas que no quepan en RAM se leen de disco
+    kv_bytes = int(footprint.kv_cache_bytes(precision, tokens, batch_size) * MEMORY_PLAN_OVERHEAD)
+    cpu_weights = ram_budget - kv_bytes
+    offload_precision = 'fp32' if precision == 'int8' else precision
+    if allow_disk_offload and cpu_weights > 0:
+        weights = footprint.weights_bytes(offload_precision)
+        return plan(
+            offload_precision, "cpu",
+            device_map="auto",
+            max_memory={'cpu': cpu_weights},
+            offload_folder=MODEL_OFFLOAD_DIR,
+            notes=[f"{(weights - cpu_weights) / _GB:.1f} GB of layers offloaded to disk (much slower generation)"]
+        )
+
+    return plan(precision, "cpu", fits=False, notes=[
+        "Not enough memory for this model; choose a smaller model (e.g. Phi-3 mini) or close other applications"
+    ])
+
+
+def available_ram_bytes() -> Optional[int]:
+    """
+    RAM disponible para nuevos procesos (MemAvailable en Linux)
+
+    Returns:
+        Bytes, o None si no se puede consultar
+    """
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        return os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def plan_model_memory(
+    model_name: str,
+    precision: Optional[str] = None,
+    batch_size: int = 1
+) -> MemoryPlan:
+    """
+    Calcula el plan de carga de un modelo antes de descargar o cargar sus pesos
+
+    Solo se descarga la configuración del modelo. Los modelos del pool que no
+    están en uso cuentan como memoria disponible, porque se descartarían para
+    hacer sitio.
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        precision: Precisión en CPU pedida (por defecto CPU_PRECISION)
+        batch_size: Secuencias generadas a la vez (LONG_DOCUMENT_BATCH_SIZE en modo documento largo)
+
+    Returns:
+        Plan de carga
+    """
+    import torch
+    from transformers import AutoConfig
+
+    from src.model_pool import get_model_pool
+    from src.quantization import cpu_supports_bf16, quantized_cache_path, resolve_precision
+
+    config = AutoConfig.from_pretrained(model_name, trust_remote_code=True)
+    footprint = footprint_from_config(config)
+    device = "cuda" if torch.cuda.is_available() else "cpu"
+    resolved = resolve_precision(device, precision)
+    tokens = min(
+        MAX_INPUT_TOKENS + MAX_OUTPUT_TOKENS_ANALYSIS,
+        getattr(config, 'max_position_embeddings', None) or MAX_INPUT_TOKENS + MAX_OUTPUT_TOKENS_ANALYSIS
+    )
+
+    pool = get_model_pool()
+    # Solo cuenta una carga completa en el dispositivo: un modelo con capas descargadas
+    # tiene otra clave en el pool y se vuelve a planificar
+    if pool.is_loaded(model_name, resolved, device):
+        return MemoryPlan(
+            model_name=model_name,
+            device=device,
+            precision=resolved,
+            fits=True,
+            weights_bytes=footprint.weights_bytes(resolved),
+            kv_cache_bytes=footprint.kv_cache_bytes(resolved, tokens, batch_size),
+            available_ram=available_ram_bytes(),
+            notes=["Already loaded in memory"]
+        )
+
+    available_ram = available_ram_bytes()
+    if available_ram is not None:
+        available_ram += pool.reclaimable_bytes("cpu")
+    available_vram = None
+    if device == "cuda":
+        available_vram = torch.cuda.mem_get_info()[0] + pool.reclaimable_bytes("cuda")
+
+    return choose_plan(
+        model_name,
+        footprint,
+        resolved,
+        available_ram,
+        available_vram,
+        tokens=tokens,
+        batch_size=batch_size,
+        bf16_supported=cpu_supports_bf16(),
+        int8_cached=os.path.exists(quantized_cache_path(model_name))
+    )
@@ -0,0 +1,168 @@
+"""
+Carga de modelos con poca memoria: safetensors mapeados en memoria y carga directa al dispositivo
+"""
+import os
+import re
+import shutil
+from typing import Any, Dict, Optional, Tuple
+
+from transformers import AutoModelForCausalLM
+
+from src.config import SAFETENSORS_CACHE_DIR
+
+
+def reset_peak_rss():
+    """Reinicia el pico de memoria residente del proceso (solo Linux; en otros sistemas no hace nada)"""
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def peak_rss_bytes() -> Optional[int]:
+    """
+    Pico de memoria residente del proceso
+
+    En Linux es el pico desde el último reset_peak_rss(); en otros sistemas,
+    el pico desde que arrancó el proceso.
+
+    Returns:
+        Bytes, o None si el sistema no lo permite consultar
+    """
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS lo da en bytes; Linux y BSD en KB
+        return peak if sys.platform == 'darwin' else peak * 1024
+    except (ImportError, ValueError):
+        return None
+
+
+def format_load_stats(stats: Dict[str, Any]) -> str:
+    """
+    Devuelve las estadísticas de carga de AIAnalyzer.last_load_stats en una línea legible
+
+    Args:
+        stats: Diccionario con seconds, peak_rss_bytes y source
+
+    Returns:
+        Texto del tipo "12.3s from safetensors, peak RSS 14.2 GB"
+    """
+    text = f"{stats['seconds']:.1f}s from {stats['source']}"
+    if stats.get('peak_rss_bytes') is not None:
+        text += f", peak RSS {stats['peak_rss_bytes'] / 1024 ** 3:.1f} GB"
+    return text
+
+
+def converted_model_path(model_name: str, cache_dir: str = SAFETENSORS_CACHE_DIR) -> str:
+    """
+    Directorio de la copia local en safetensors de un modelo que solo publica pesos .bin
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        cache_dir: Directorio de las copias convertidas
+
+    Returns:
+        Ruta del directorio
+    """
+    return os.path.join(cache_dir, re.sub(r'[^\w.-]+', '--', model_name))
+
+
+def _from_pretrained(source: str, dtype: Any, device: str, **kwargs) -> Any:
+    """
+    Carga los pesos directamente en el dispositivo de destino
+
+    Con safetensors los tensores se leen de un archivo mapeado en memoria
+    y se copian uno a uno al dispositivo: nunca hay dos copias del modelo.
+    Un `device_map` en kwargs (p. ej. "auto" con max_memory) sustituye al dispositivo.
+    """
+    kwargs.setdefault('device_map', device)
+    return AutoModelForCausalLM.from_pretrained(
+        source,
+        trust_remote_code=True,
+        torch_dtype=dtype,
+        low_cpu_mem_usage=True,
+        **kwargs
+    )
+
+
+def load_model_weights(
+    model_name: str,
+    dtype: Any,
+    device: str,
+    cache_dir: str = SAFETENSORS_CACHE_DIR,
+    **load_options
+) -> Tuple[Any, str]:
+    """
+    Carga un modelo con el menor pico de memoria posible
+
+    Se usan los safetensors del modelo si existen. Si el modelo solo tiene
+    pesos .bin (pickle, que se carga entero en memoria), la primera vez se
+    convierte a una copia local en safetensors y las siguientes cargas usan esa copia.
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        dtype: Tipo de dato de los pesos
+        device: Dispositivo de destino ('cpu' o 'cuda')
+        cache_dir: Directorio de las copias convertidas
+        **load_options: device_map, max_memory y offload_folder de un MemoryPlan
+
+    Returns:
+        Tupla con (modelo, origen de los pesos: 'safetensors', 'converted' o 'converted now')
+    """
+    converted = converted_model_path(model_name, cache_dir)
+
+    if os.path.isdir(converted):
+        model = _from_pretrained(converted, dtype, device, **load_options)
+        source = 'converted'
+    else:
+        try:
+            model = _from_pretrained(model_name, dtype, device, use_safetensors=True, **load_options)
+            source = 'safetensors'
+        except OSError:
+            _convert_to_safetensors(model_name, converted)
+            model = _from_pretrained(converted, dtype, device, **load_options)
+            source = 'converted now'
+
+    return model, source
+
+
+def _convert_to_safetensors(model_name: str, path: str):
+    """
+    Convierte a safetensors un modelo publicado solo con pesos .bin
+
+    Se carga en su dtype original (sin convertir) y se guarda en un directorio
+    temporal que se renombra al terminar, para no dejar copias a medias: si la
+    conversión falla, la siguiente carga vuelve a intentarla.
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        path: Directorio de la copia convertida
+    """
+    model = AutoModelForCausalLM.from_pretrained(
+        model_name,
+        trust_remote_code=True,
+        torch_dtype="auto",
+        low_cpu_mem_usage=True
+    )
+    tmp_path = f"{path}.tmp"
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Restos de una conversión interrumpida
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    try:
+        model.save_pretrained(tmp_path, safe_serialization=True)
+        del model
+        os.replace(tmp_path, path)
+    except Exception:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        raise
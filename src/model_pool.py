@@ -0,0 +1,355 @@
+"""
+Pool de modelos de IA compartido por todo el proceso
+"""
+import gc
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from src.config import MODEL_POOL_MAX_RAM_GB, MODEL_POOL_MAX_VRAM_GB, PREFIX_CACHE_MAX_ENTRIES
+
+
+class PooledModel:
+    """Entrada del pool: par (modelo, tokenizador) cargado y su huella de memoria"""
+
+    def __init__(self, key: Tuple[str, ...], model: Any, tokenizer: Any, device: str, size_bytes: int):
+        self.key = key
+        self.model = model
+        self.tokenizer = tokenizer
+        self.device = device
+        self.size_bytes = size_bytes
+        self.in_use = 0
+        # KV cache del prefijo fijo de cada plantilla de prompt (ver AIAnalyzer)
+        self.prefix_cache: "OrderedDict[str, Any]" = OrderedDict()
+
+
+class ModelPool:
+    """
+    Mantiene modelos cargados entre revisiones, indexados por (nombre,
+    precisión, dispositivo, opciones de carga): un modelo cargado con otro
+    reparto de capas (device_map, max_memory, offload) es otra entrada.
+
+    Cuando cargar un modelo nuevo supera el presupuesto de memoria del
+    dispositivo, se descartan primero las entradas usadas menos recientemente
+    (LRU) que no estén en uso.
+    """
+
+    def __init__(self, max_ram_gb: float = MODEL_POOL_MAX_RAM_GB, max_vram_gb: float = MODEL_POOL_MAX_VRAM_GB):
+        """
+        Inicializa el pool
+
+        Args:
+            max_ram_gb: Presupuesto de memoria para modelos en CPU (GB)
+            max_vram_gb: Presupuesto de memoria para modelos en GPU (GB)
+        """
+        self.budgets = {
+            'cpu': int(max_ram_gb * 1024 ** 3),
+            'cuda': int(max_vram_gb * 1024 ** 3)
+        }
+        self._entries: "OrderedDict[Tuple[str, ...], PooledModel]" = OrderedDict()
+        # Modelos que se están cargando: las demás peticiones del mismo modelo esperan a su evento
+        self._loading: Dict[Tuple[str, ...], threading.Event] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def key(
+        model_name: str,
+        dtype: str,
+        device: str,
+        load_options: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, ...]:
+        """
+        Clave de un modelo en el pool
+
+        Las opciones de carga se normalizan (claves ordenadas, valores como
+        texto) para que el mismo plan dé siempre la misma clave.
+
+        Args:
+            model_name: Nombre del modelo de HuggingFace
+            dtype: Precisión con la que se carga el modelo
+            device: Dispositivo de destino ('cpu' o 'cuda')
+            load_options: device_map, max_memory y offload_folder de un MemoryPlan
+
+        Returns:
+            Tupla con (nombre, precisión, dispositivo, opciones de carga)
+        """
+        def stable(value: Any) -> Any:
+            if isinstance(value, dict):
+                return tuple(sorted((str(name), stable(item)) for name, item in value.items()))
+            return str(value)
+
+        return (model_name, str(dtype), device, repr(stable(load_options or {})))
+
+    def acquire(
+        self,
+        model_name: str,
+        dtype: str,
+        device: str,
+        loader: Callable[[], Tuple[Any, Any]],
+        expected_bytes: Optional[int] = None,
+        load_options: Optional[Dict[str, Any]] = None
+    ) -> Tuple[PooledModel, bool]:
+        """
+        Obtiene un modelo del pool, cargándolo con `loader` si no está presente
+
+        Args:
+            model_name: Nombre del modelo de HuggingFace
+            dtype: Precisión con la que se carga el modelo ('fp32', 'int8'...)
+            device: Dispositivo de destino ('cpu' o 'cuda')
+            loader: Función que carga y devuelve (modelo, tokenizador)
+            expected_bytes: Tamaño estimado del modelo, para liberar espacio antes de cargar
+            load_options: Opciones con las que `loader` reparte las capas (forman parte de la clave)
+
+        Returns:
+            Tupla con (entrada del pool, True si ya estaba cargado)
+        """
+        key = self.key(model_name, dtype, device, load_options)
+
+        # La carga se hace sin el lock, que puede pedir la interfaz mientras tanto;
+        # una segunda petición del mismo modelo espera a que termine la primera
+        # en lugar de cargarlo dos veces (si la primera falla, lo intenta ella)
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    self._entries.move_to_end(key)
+                    entry.in_use += 1
+                    self.hits += 1
+                    return entry, True
+
+                loading = self._loading.get(key)
+                if loading is None:
+                    loading = self._loading[key] = threading.Event()
+                    self.misses += 1
+                    if expected_bytes:
+                        self._make_room(device, expected_bytes)
+                    break
+            loading.wait()
+
+        try:
+            model, tokenizer = loader()
+            entry = PooledModel(key, model, tokenizer, device, self._estimate_model_bytes(model))
+            entry.in_use += 1
+
+            # Ajustar al tamaño real una vez cargado
+            with self._lock:
+                self._make_room(device, entry.size_bytes)
+                self._entries[key] = entry
+            return entry, False
+        finally:
+            with self._lock:
+                del self._loading[key]
+            loading.set()
+
+    def is_loaded(
+        self,
+        model_name: str,
+        dtype: str,
+        device: str,
+        load_options: Optional[Dict[str, Any]] = None
+    ) -> bool:
+        """
+        Indica si un modelo ya está cargado en el pool
+
+        Args:
+            model_name: Nombre del modelo de HuggingFace
+            dtype: Precisión con la que se cargó
+            device: Dispositivo en el que se cargó
+            load_options: Opciones de carga con las que se cargó
+
+        Returns:
+            True si `acquire` lo reutilizaría sin cargarlo
+        """
+        with self._lock:
+            return self.key(model_name, dtype, device, load_options) in self._entries
+
+    def reclaimable_bytes(self, device: str) -> int:
+        """
+        Memoria que se liberaría descartando los modelos de un dispositivo que no están en uso
+
+        Args:
+            device: Dispositivo ('cpu' o 'cuda')
+
+        Returns:
+            Bytes
+        """
+        with self._lock:
+            return sum(
+                entry.size_bytes for entry in self._entries.values()
+                if entry.device == device and entry.in_use == 0
+            )
+
+    def release(self, entry: PooledModel):
+        """
+        Devuelve al pool un modelo obtenido con `acquire` (permanece cargado)
+
+        Args:
+            entry: Entrada devuelta por `acquire`
+        """
+        with self._lock:
+            entry.in_use = max(0, entry.in_use - 1)
+
+    def evict(self, model_name: Optional[str] = None):
+        """
+        Descarga modelos del pool (los que están en uso se conservan)
+
+        Args:
+            model_name: Nombre del modelo a descargar (None descarga todos)
+        """
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if (model_name is None or key[0] == model_name) and entry.in_use == 0:
+                    del self._entries[key]
+                    self.evictions += 1
+        self._release_memory()
+
+    def clear(self):
+        """Descarga todos los modelos del pool"""
+        self.evict()
+
+    def get_prefix(self, entry: PooledModel, key: str) -> Optional[Any]:
+        """
+        Devuelve el prefijo precalculado de una plantilla para un modelo del pool
+
+        Args:
+            entry: Entrada del modelo
+            key: Hash del prefijo de la plantilla
+
+        Returns:
+            Prefijo guardado con `put_prefix` o None
+        """
+        with self._lock:
+            cached = entry.prefix_cache.get(key)
+            if cached is not None:
+                entry.prefix_cache.move_to_end(key)
+            return cached
+
+    def put_prefix(self, entry: PooledModel, key: str, cached: Any, max_entries: int = PREFIX_CACHE_MAX_ENTRIES):
+        """
+        Guarda el prefijo precalculado de una plantilla, descartando los menos usados
+
+        Args:
+            entry: Entrada del modelo
+            key: Hash del prefijo de la plantilla
+            cached: Prefijo precalculado
+            max_entries: Prefijos máximos por modelo
+        """
+        with self._lock:
+            entry.prefix_cache[key] = cached
+            entry.prefix_cache.move_to_end(key)
+            while len(entry.prefix_cache) > max_entries:
+                entry.prefix_cache.popitem(last=False)
+
+    def clear_prefix_caches(self):
+        """Descarta los prefijos precalculados de todos los modelos (p. ej. al editar los prompts)"""
+        with self._lock:
+            for entry in self._entries.values():
+                entry.prefix_cache.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """
+        Devuelve contadores del pool
+
+        Returns:
+            Diccionario con hits, misses, evictions, modelos cargados y bytes ocupados
+        """
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'loaded': len(self._entries),
+                'bytes': sum(entry.size_bytes for entry in self._entries.values())
+            }
+
+    def format_stats(self) -> str:
+        """Devuelve los contadores del pool en una línea legible"""
+        stats = self.stats()
+        return (
+            f"{stats['hits']} hits, {stats['misses']} misses, {stats['evictions']} evictions, "
+            f"{stats['loaded']} loaded ({stats['bytes'] / 1024 ** 3:.1f} GB)"
+        )
+
+    def _make_room(self, device: str, needed_bytes: int):
+        """
+        Descarta entradas LRU del mismo dispositivo hasta que `needed_bytes` quepa en el presupuesto
+
+        Args:
+            device: Dispositivo en el que se cargará el modelo
+            needed_bytes: Bytes que se necesitan
+        """
+        budget = self.budgets.get(device, self.budgets['cpu'])
+        evicted = False
+
+        for key in list(self._entries):
+            used = sum(e.size_bytes for e in self._entries.values() if e.device == device)
+            if used + needed_bytes <= budget:
+                break
+            entry = self._entries[key]
+            # No se descartan modelos que otra revisión está usando
+            if entry.device != device or entry.in_use > 0:
+                continue
+            del self._entries[key]
+            self.evictions += 1
+            evicted = True
+
+        if evicted:
+            self._release_memory()
+
+    @staticmethod
+    def _estimate_model_bytes(model: Any) -> int:
+        """
+        Estima la memoria ocupada por los parámetros y buffers del modelo
+
+        Args:
+            model: Modelo cargado
+
+        Returns:
+            Tamaño estimado en bytes
+        """
+        total = 0
+        try:
+            for tensor in list(model.parameters()) + list(model.buffers()):
+                total += tensor.numel() * tensor.element_size()
+            # Las capas Linear cuantizadas a int8 guardan los pesos empaquetados fuera de parameters()
+            for module in model.modules() if hasattr(model, 'modules') else []:
+                packed = getattr(module, '_packed_params', None)
+                if hasattr(packed, '_weight_bias'):
+                    for tensor in packed._weight_bias():
+                        if tensor is not None:
+                            total += tensor.numel() * tensor.element_size()
+        except Exception:
+            pass
+        return total
+
+    @staticmethod
+    def _release_memory():
+        """Fuerza la liberación de memoria tras descartar modelos"""
+        gc.collect()
+        try:
+            import torch
+            if torch.cuda.is_available():
+                torch.cuda.empty_cache()
+        except ImportError:
+            pass
+
+
+_pool: Optional[ModelPool] = None
+_pool_lock = threading.Lock()
+
+
+def get_model_pool() -> ModelPool:
+    """
+    Devuelve el pool de modelos del proceso (lo crea la primera vez)
+
+    Returns:
+        Instancia compartida de ModelPool
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ModelPool()
+        return _pool
@@ -0,0 +1,615 @@
+"""
+Pipeline de revisión independiente de la interfaz gráfica
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from src.config import (
+    LONG_DOCUMENT_BATCH_SIZE, MAX_INPUT_TOKENS, PRELOAD_DEBOUNCE_SECONDS, PUBMED_MAX_REFERENCES,
+    REFERENCE_CANDIDATE_POOL
+)
+from src.document_processor import NON_REVIEWABLE_SECTIONS, DocumentProcessor, SectionIndex
+from src.extraction_cache import ExtractionCache
+from src.ai_analyzer import AIAnalyzer
+from src.cancellation import CancelToken
+from src.generation_progress import GenerationProgress
+from src.memory_planner import MemoryPlan, plan_model_memory
+from src.model_loader import format_load_stats
+from src.model_pool import get_model_pool
+from src.pubmed_searcher import PubMedSearcher, create_pubmed_searcher
+from src.pubmed_xml import Article
+from src.reference_ranker import RankedReference, ReferenceRanker
+from src.report_generator import ReportGenerator
+
+
+def _no_op(*args):
+    """Callback vacío por defecto"""
+    pass
+
+
+def preload_model(
+    model_name: str,
+    precision: Optional[str] = None,
+    long_document: bool = False
+) -> Tuple[MemoryPlan, bool]:
+    """
+    Carga un modelo en el pool para que la siguiente revisión lo encuentre ya cargado
+
+    Solo se precarga si el modelo cabe tal cual; si el plan cambia la precisión
+    o descarga capas, se deja para la revisión, que pide confirmación.
+
+    Args:
+        model_name: Modelo de IA
+        precision: Precisión en CPU (por defecto CPU_PRECISION)
+        long_document: Si la revisión usará el modo de documento largo
+
+    Returns:
+        Tupla con (plan de memoria, True si el modelo ha quedado cargado)
+    """
+    batch_size = LONG_DOCUMENT_BATCH_SIZE if long_document else 1
+    plan = plan_model_memory(model_name, precision, batch_size)
+    if not plan.fits or plan.adjusted:
+        return plan, False
+
+    ai_analyzer = AIAnalyzer(model_name, plan.precision, load_options=plan.load_kwargs())
+    ai_analyzer.load_model()
+    ai_analyzer.unload_model()
+    return plan, True
+
+
+class ModelPreloader:
+    """
+    Precarga en segundo plano el modelo elegido en la interfaz, de uno en uno.
+
+    Las peticiones se atienden en orden en un único thread daemon, así que el
+    plan de memoria de cada precarga se calcula cuando la anterior ya ha
+    terminado de cargar. Solo se carga la última selección: una petición
+    espera a que la selección lleve `debounce` segundos sin cambiar, y las que
+    ya no son la actual al llegar su turno se descartan sin cargar nada.
+    """
+
+    def __init__(self, load: Callable[..., Any] = preload_model, debounce: float = PRELOAD_DEBOUNCE_SECONDS):
+        """
+        Inicializa el precargador
+
+        Args:
+            load: Función que planifica y carga el modelo (recibe los elementos de la clave)
+            debounce: Segundos sin cambios en la selección antes de cargar
+        """
+        self.load = load
+        self.debounce = debounce
+        self._key: Optional[tuple] = None
+        self._requested_at = 0.0
+        self._lock = threading.Lock()
+        self._queue: "queue.Queue[Tuple[tuple, Future]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def current_key(self) -> Optional[tuple]:
+        """Última selección pedida"""
+        with self._lock:
+            return self._key
+
+    def request(self, key: tuple) -> Future:
+        """
+        Pide precargar un modelo; las peticiones anteriores pendientes quedan obsoletas
+
+        Args:
+            key: Argumentos de `load` (modelo, precisión, documento largo)
+
+        Returns:
+            Future con el resultado de `load`, o None si se descartó por obsoleta
+        """
+        future = Future()
+        with self._lock:
+            self._key = key
+            self._requested_at = time.monotonic()
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="model-preload", daemon=True)
+                self._thread.start()
+        self._queue.put((key, future))
+        return future
+
+    def _run(self):
+        """Atiende las peticiones en orden (una carga a la vez)"""
+        while True:
+            key, future = self._queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+
+            # Esperar a que la selección deje de cambiar
+            while True:
+                with self._lock:
+                    current = self._key == key
+                    remaining = self._requested_at + self.debounce - time.monotonic()
+                if not current or remaining <= 0:
+                    break
+                time.sleep(remaining)
+
+            if not current:
+                future.set_result(None)
+                continue
+            try:
+                future.set_result(self.load(*key))
+            except Exception as e:
+                future.set_exception(e)
+
+
+class ReviewPipeline:
+    """
+    Ejecuta las etapas de revisión (extracción → frases clave → PubMed →
+    análisis → informes) sin depender de Qt.
+
+    La interfaz gráfica conecta `log` y `progress` a señales del WorkerThread;
+    el modo batch usa las etapas por separado para solaparlas entre manuscritos.
+    """
+
+    def __init__(
+        self,
+        num_keyphrases: int,
+        num_articles: int,
+        prompts: Dict[str, str],
+        output_format: str,
+        log: Optional[Callable[[str], None]] = None,
+        progress: Optional[Callable[[int], None]] = None,
+        long_document: bool = False,
+        generation: Optional[Callable[[GenerationProgress], None]] = None,
+        cancel_token: Optional[CancelToken] = None,
+        precision: Optional[str] = None
+    ):
+        """
+        Inicializa el pipeline
+
+        Args:
+            num_keyphrases: Número de frases clave a extraer
+            num_articles: Número de artículos por búsqueda en PubMed
+            prompts: Diccionario con los prompts 'keyphrases' y 'analysis'
+            output_format: Formato de los informes ('pdf' o 'docx')
+            log: Función que recibe mensajes de progreso
+            progress: Función que recibe el porcentaje completado
+            long_document: Si se evalúa el manuscrito completo por fragmentos
+            generation: Función que recibe el progreso de la generación en curso
+            cancel_token: Señal de cancelación; se comprueba entre etapas, en PubMed y durante la generación
+            precision: Precisión del modelo en CPU ('fp32', 'bf16' o 'int8'; por defecto CPU_PRECISION)
+        """
+        self.num_keyphrases = num_keyphrases
+        self.num_articles = num_articles
+        self.prompts = prompts
+        self.output_format = output_format
+        self.log = log or _no_op
+        self.progress = progress or _no_op
+        self.long_document = long_document
+        self.generation = generation
+        self.cancel_token = cancel_token or CancelToken()
+        self.precision = precision
+        # Tramo de la barra de progreso que ocupa la generación en curso
+        self._generation_range = (0, 0)
+
+    @staticmethod
+    def extract(file_path: str, cache: Optional[ExtractionCache] = None) -> Tuple[str, str, SectionIndex]:
+        """
+        Extrae el texto del manuscrito, detecta su tipo y localiza sus secciones (no depende de la configuración del pipeline)
+
+        Usa la caché de extracción, así que repetir la revisión de un manuscrito
+        no lo vuelve a leer ni a segmentar.
+
+        Args:
+            file_path: Ruta al manuscrito
+            cache: Caché de extracción (por defecto la de DocumentProcessor.extract_manuscript)
+
+        Returns:
+            Tupla con (texto, tipo de artículo, índice de secciones)
+        """
+        manuscript = DocumentProcessor.extract_manuscript(file_path, cache=cache)
+        return manuscript.text, manuscript.article_type, manuscript.sections
+
+    def wait_for_background(
+        self,
+        preload: Optional[Future] = None,
+        extraction: Optional[Future] = None
+    ) -> Optional[Tuple[str, str, SectionIndex]]:
+        """
+        Espera a la precarga del modelo y a la extracción lanzadas por la interfaz
+
+        Primero la precarga: planificar la memoria mientras el modelo se está
+        cargando daría cifras falsas. Ambas esperas atienden la cancelación.
+        Un error en la precarga se ignora (run vuelve a cargar el modelo); uno
+        en la extracción se propaga.
+
+        Args:
+            preload: Future de preload_model
+            extraction: Future de extract
+
+        Returns:
+            Resultado de la extracción para run(extracted=...), o None si no hay
+        """
+        if preload is not None and not preload.done():
+            self.log("⏳ Waiting for the model that is loading in the background...")
+            self.cancel_token.wait_for(preload)
+
+        if extraction is None:
+            return None
+        if not extraction.done():
+            self.log("⏳ Waiting for the text extraction...")
+            self.cancel_token.wait_for(extraction)
+        return extraction.result()
+
+    @staticmethod
+    def review_text(manuscript_text: str, sections: Optional[SectionIndex] = None) -> str:
+        """
+        Texto que se revisa: el manuscrito sin referencias ni agradecimientos
+
+        Args:
+            manuscript_text: Texto del manuscrito
+            sections: Índice de secciones ya construido (si no, se segmenta aquí)
+
+        Returns:
+            Texto para la selección de referencias y el análisis
+        """
+        if sections is None:
+            sections = DocumentProcessor.segment_sections(manuscript_text)
+        return sections.excluding(manuscript_text, NON_REVIEWABLE_SECTIONS)
+
+    def plan_memory(self, model_name: str) -> MemoryPlan:
+        """
+        Comprueba que el modelo cabe en memoria antes de cargarlo
+
+        Args:
+            model_name: Modelo de IA a utilizar
+
+        Returns:
+            Plan de carga (precisión y reparto de capas)
+
+        Raises:
+            ValueError: Si el modelo no cabe de ninguna forma
+        """
+        batch_size = LONG_DOCUMENT_BATCH_SIZE if self.long_document else 1
+        plan = plan_model_memory(model_name, self.precision, batch_size)
+        if not plan.fits:
+            raise ValueError(f"The model does not fit in the available memory\n{plan.summary()}")
+        return plan
+
+    def extract_keyphrases(self, ai_analyzer: AIAnalyzer, manuscript_text: str) -> List[str]:
+        """
+        Extrae las frases clave del manuscrito
+
+        Args:
+            ai_analyzer: Analizador con el modelo cargado
+            manuscript_text: Texto del manuscrito
+
+        Returns:
+            Lista de frases clave
+        """
+        keyphrases = ai_analyzer.extract_keyphrases(
+            manuscript_text,
+            self.prompts.get('keyphrases', ''),
+            self.num_keyphrases
+        )
+
+        if not keyphrases:
+            raise ValueError("Could not extract key phrases from the manuscript")
+
+        return keyphrases
+
+    def search_pubmed(self, keyphrases: List[str]) -> Dict[str, List[Article]]:
+        """
+        Busca artículos de referencia en PubMed
+
+        Args:
+            keyphrases: Frases clave del manuscrito
+
+        Returns:
+            Diccionario con artículos por frase clave
+        """
+        return self._create_searcher().search_articles(keyphrases, self.num_articles)
+
+    def _create_searcher(self) -> PubMedSearcher:
+        """Crea el buscador de PubMed configurado, atento a la cancelación"""
+        pubmed_searcher = create_pubmed_searcher()
+        pubmed_searcher.cancel_token = self.cancel_token
+        return pubmed_searcher
+
+    def select_references(self, pubmed_data: Dict[str, List[Article]], manuscript_text: str) -> List[RankedReference]:
+        """
+        Elige las referencias del prompt por relevancia y descarga solo sus abstracts
+
+        Primero se preseleccionan REFERENCE_CANDIDATE_POOL artículos por título,
+        después se descargan sus abstracts y se vuelven a ordenar con el texto completo.
+
+        Args:
+            pubmed_data: Artículos (solo metadatos) por frase clave
+            manuscript_text: Texto del manuscrito
+
+        Returns:
+            Referencias elegidas con sus puntuaciones
+        """
+        ranker = ReferenceRanker()
+        query_text = manuscript_text[:MAX_INPUT_TOKENS * 3]
+
+        candidates = [
+            reference.article
+            for reference in ranker.rank(query_text, pubmed_data, REFERENCE_CANDIDATE_POOL)
+        ]
+        self._create_searcher().fetch_abstracts(candidates)
+        return ranker.rank(query_text, pubmed_data, PUBMED_MAX_REFERENCES, candidates)
+
+    def analyze(
+        self,
+        ai_analyzer: AIAnalyzer,
+        manuscript_text: str,
+        pubmed_data: Dict[str, List[Article]],
+        article_type: str,
+        references: Optional[List[RankedReference]] = None
+    ) -> Dict[str, List[str]]:
+        """
+        Evalúa el manuscrito con el modelo de IA
+
+        En modo de documento largo se evalúa el texto completo por fragmentos
+        (ver AIAnalyzer.analyze_long_manuscript); si no, un extracto.
+
+        Args:
+            ai_analyzer: Analizador con el modelo cargado
+            manuscript_text: Texto del manuscrito
+            pubmed_data: Artículos de referencia
+            article_type: Tipo de artículo
+            references: Referencias con abstract para el prompt (ver select_references)
+
+        Returns:
+            Diccionario con secciones de evaluación
+        """
+        articles = [reference.article for reference in references] if references is not None else None
+        if self.long_document:
+            return ai_analyzer.analyze_long_manuscript(
+                manuscript_text,
+                pubmed_data,
+                self.prompts,
+                article_type,
+                articles
+            )
+        return ai_analyzer.analyze_manuscript(
+            manuscript_text,
+            pubmed_data,
+            self.prompts.get('analysis', ''),
+            article_type,
+            articles
+        )
+
+    def generate_reports(
+        self,
+        file_path: str,
+        evaluation: Dict[str, List[str]],
+        pubmed_data: Dict[str, List[Article]],
+        keyphrases: List[str],
+        manuscript_text: str,
+        article_type: str,
+        references: Optional[List[RankedReference]] = None,
+        on_author_report: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, str]:
+        """
+        Genera los informes para el autor y para auditoría
+
+        Args:
+            on_author_report: Función que recibe la ruta del informe del autor
+                en cuanto está listo, antes de generar el de auditoría
+
+        Returns:
+            Tupla con (ruta del informe del autor, ruta del informe de auditoría)
+        """
+        report_generator = ReportGenerator(self.output_format)
+        author_report = report_generator.generate_author_report(file_path, evaluation)
+        if on_author_report is not None:
+            on_author_report(author_report)
+        auditor_report = report_generator.generate_auditor_report(
+            file_path,
+            evaluation,
+            pubmed_data,
+            keyphrases,
+            manuscript_text,
+            article_type,
+            selected_references=references
+        )
+        return author_report, auditor_report
+
+    def _on_generation(self, info: GenerationProgress):
+        """Reenvía el progreso de la generación y avanza la barra dentro del tramo de la etapa"""
+        self.generation(info)
+        if info.finished:
+            self.log(f"  • {info.format()}")
+        start, end = self._generation_range
+        self.progress(start + int((end - start) * info.fraction))
+
+    def _log_generation_stats(self, ai_analyzer: AIAnalyzer):
+        """Registra el ahorro de la última generación (parada anticipada y prefijo en caché)"""
+        if ai_analyzer.last_tokens_saved:
+            self.log(f"  • Early stop: {ai_analyzer.last_tokens_saved} tokens saved")
+        prefix = ai_analyzer.last_prefix_stats
+        if prefix is not None:
+            if prefix['hit']:
+                self.log(
+                    f"  • Prompt prefix cache: {prefix['tokens']} tokens reused "
+                    f"(~{prefix['seconds_saved']:.1f}s of prefill saved)"
+                )
+            else:
+                self.log(f"  • Prompt prefix cached ({prefix['tokens']} tokens) for the next reviews")
+
+    def run(
+        self,
+        file_path: str,
+        model_name: str,
+        manual_mode: bool = False,
+        extracted: Optional[Tuple[str, str, SectionIndex]] = None
+    ) -> Dict:
+        """
+        Ejecuta el proceso completo de revisión de un manuscrito
+
+        Args:
+            file_path: Ruta al manuscrito
+            model_name: Modelo de IA a utilizar
+            manual_mode: Si se muestran las pausas de confirmación manual
+            extracted: (texto, tipo de artículo, secciones) de extract() en segundo plano, o None para extraerlos aquí
+
+        Returns:
+            Diccionario con el resultado de la revisión
+        """
+        ai_analyzer = None
+        try:
+            # Paso 1: Extraer texto del manuscrito
+            if extracted is not None:
+                manuscript_text, article_type, sections = extracted
+                self.log(f"✓ Text extracted in the background: {len(manuscript_text)} characters")
+                self.log(f"✓ Article type: {article_type}")
+                self.progress(15)
+            else:
+                self.log("📄 Extracting text from manuscript...")
+                self.progress(5)
+
+                manuscript = DocumentProcessor.extract_manuscript(file_path, self.cancel_token)
+                manuscript_text = manuscript.text
+
+                if manuscript.cached:
+                    self.log(f"♻ Loaded {len(manuscript_text)} characters from the extraction cache")
+                else:
+                    self.log(f"✓ Extracted {len(manuscript_text)} characters")
+                self.progress(10)
+
+                # Paso 2: Tipo de artículo (se detecta al extraer el texto)
+                self.cancel_token.raise_if_cancelled()
+                article_type = manuscript.article_type
+                sections = manuscript.sections
+                self.log(f"✓ Article type: {article_type}")
+                self.progress(15)
+
+            review_text = self.review_text(manuscript_text, sections)
+            self.log(f"✓ Sections: {', '.join(span.label for span in sections)}")
+
+            # Paso 3: Inicializar y cargar modelo de IA
+            self.cancel_token.raise_if_cancelled()
+            plan = self.plan_memory(model_name)
+            self.log(f"🧮 Memory plan: {plan.summary()}")
+            ai_analyzer = AIAnalyzer(model_name, plan.precision, load_options=plan.load_kwargs())
+            self.log(f"🤖 Loading AI model: {model_name} ({ai_analyzer.precision})...")
+            if self.precision == 'bf16' and ai_analyzer.precision == 'fp32':
+                self.log("⚠ This CPU has no native bf16 support, using fp32")
+            self.log("⏳ This may take a few minutes the first time...")
+            ai_analyzer.cancel_token = self.cancel_token
+            if self.generation is not None:
+                ai_analyzer.generation_callback = self._on_generation
+            ai_analyzer.load_model()
+            if ai_analyzer.pool_hit:
+                self.log("✓ Model reused from memory (already loaded)")
+            else:
+                self.log(f"✓ Model loaded successfully ({format_load_stats(ai_analyzer.last_load_stats)})")
+            self.log(f"♻ Model pool: {get_model_pool().format_stats()}")
+            self.progress(25)
+
+            # Paso 4: Extraer frases clave
+            self.cancel_token.raise_if_cancelled()
+            self.log(f"🔑 Extracting {self.num_keyphrases} key phrases...")
+            self._generation_range = (25, 35)
+            keyphrases = self.extract_keyphrases(ai_analyzer, manuscript_text)
+
+            self.log("✓ Extracted key phrases:")
+            for kp in keyphrases:
+                self.log(f"  • {kp}")
+            self._log_generation_stats(ai_analyzer)
+            self.progress(35)
+
+            # Confirmación manual si está activado
+            if manual_mode:
+                self.log("⏸ Waiting for user confirmation...")
+                # Aquí se podría emitir señal para confirmación
+                # Por ahora continuamos automáticamente
+
+            # Paso 5: Buscar en PubMed
+            self.cancel_token.raise_if_cancelled()
+            self.log("🔬 Searching PubMed database...")
+            pubmed_data = self.search_pubmed(keyphrases)
+
+            if not pubmed_data:
+                self.log("⚠ Warning: No articles found in PubMed")
+                self.log("⚠ The evaluation will proceed with limited reference data")
+            else:
+                total_articles = PubMedSearcher.count_unique_articles(pubmed_data)
+                self.log(f"✓ Found {total_articles} articles:")
+                for kp, articles in pubmed_data.items():
+                    self.log(f"  • '{kp}': {len(articles)} articles")
+
+            references = self.select_references(pubmed_data, review_text)
+            if references:
+                self.log(f"✓ {len(references)} most relevant abstracts selected for the analysis")
+            self.progress(55)
+
+            # Confirmación manual si está activado
+            if manual_mode:
+                self.log("⏸ Waiting for user confirmation...")
+
+            # Paso 6: Analizar manuscrito con IA
+            self.cancel_token.raise_if_cancelled()
+            self.log("📊 Analyzing manuscript with AI...")
+            self.log("⏳ This may take several minutes...")
+            self._generation_range = (55, 75)
+
+            evaluation = self.analyze(ai_analyzer, review_text, pubmed_data, article_type, references)
+
+            self.log("✓ Analysis completed")
+            if self.long_document and ai_analyzer.last_chunk_stats is not None:
+                chunk_stats = ai_analyzer.last_chunk_stats
+                self.log(
+                    f"  • Long-document mode: {chunk_stats['chunks']} chunks "
+                    f"({chunk_stats['cached']} reused from cache)"
+                )
+            if ai_analyzer.last_prompt is not None:
+                prompt_info = ai_analyzer.last_prompt
+                self.log(
+                    f"  • Prompt: {len(prompt_info.input_ids)} tokens "
+                    f"({prompt_info.tokens_by_field.get('text', 0)} manuscript, "
+                    f"{prompt_info.items_included.get('abstracts', 0)} abstracts)"
+                )
+            self._log_generation_stats(ai_analyzer)
+            self.log(f"  • Major points: {len(evaluation.get('major', []))}")
+            self.log(f"  • Minor points: {len(evaluation.get('minor', []))}")
+            self.log(f"  • Other points: {len(evaluation.get('other', []))}")
+            self.log(f"  • Suggestions: {len(evaluation.get('suggestions', []))}")
+            self.progress(75)
+
+            # Paso 7: Generar informes
+            self.cancel_token.raise_if_cancelled()
+            self.log("📝 Generating reports...")
+
+            def on_author_report(author_report: str):
+                self.log(f"✓ Author report: {author_report}")
+                self.progress(85)
+
+            author_report, auditor_report = self.generate_reports(
+                file_path,
+                evaluation,
+                pubmed_data,
+                keyphrases,
+                manuscript_text,
+                article_type,
+                references,
+                on_author_report=on_author_report
+            )
+            self.log(f"✓ Auditor report: {auditor_report}")
+
+            self.progress(95)
+        finally:
+            # Devolver el modelo al pool (queda cargado para la siguiente revisión)
+            if ai_analyzer is not None:
+                ai_analyzer.unload_model()
+
+        self.progress(100)
+        self.log("✅ Review completed successfully!")
+
+        return {
+            'success': True,
+            'author_report': author_report,
+            'auditor_report': auditor_report,
+            'evaluation': evaluation,
+            'keyphrases': keyphrases,
+            'article_type': article_type,
+            'total_articles': PubMedSearcher.count_unique_articles(pubmed_data)
+        }
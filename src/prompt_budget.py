@@ -0,0 +1,270 @@
+"""
+Reparto del presupuesto de tokens del prompt entre sus partes
+"""
+import string
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Union
+
+from src.config import PROMPT_MIN_PARTIAL_TOKENS
+
+
+@dataclass
+class BudgetedPrompt:
+    """
+    Prompt ya ajustado al presupuesto, con sus tokens y el uso por parte
+
+    `static_prefix` es el texto de la plantilla anterior al primer placeholder,
+    igual en todas las llamadas con la misma plantilla.
+    """
+    prompt: str
+    input_ids: List[int]
+    tokens_by_field: Dict[str, int] = field(default_factory=dict)
+    items_included: Dict[str, int] = field(default_factory=dict)
+    truncated: List[str] = field(default_factory=list)
+    static_prefix: str = ""
+
+
+class PromptBudget:
+    """
+    Construye prompts que caben exactamente en el presupuesto de tokens.
+
+    La plantilla se divide en partes fijas (instrucciones, formato de salida y
+    valores cortos como el tipo de artículo), que siempre se conservan, y
+    partes flexibles (texto del manuscrito, abstracts), que se recortan. Cada
+    parte se tokeniza una sola vez; los tokens que quedan tras las partes fijas
+    se reparten entre las flexibles según sus pesos, y lo que una parte no
+    necesita pasa a las demás. Las listas (abstracts) se incluyen elemento a
+    elemento en orden, así que se descartan los últimos en vez de cortar todos.
+    """
+
+    def __init__(self, tokenizer, max_prompt_tokens: int, separator: str = "\n\n"):
+        """
+        Inicializa el reparto
+
+        Args:
+            tokenizer: Tokenizador de HuggingFace del modelo
+            max_prompt_tokens: Tokens disponibles para el prompt (ventana de contexto menos generación)
+            separator: Separador entre los elementos de una parte de tipo lista
+        """
+        self.tokenizer = tokenizer
+        self.max_prompt_tokens = max_prompt_tokens
+        self.separator = separator
+
+    def build(
+        self,
+        template: str,
+        values: Dict[str, str],
+        flexible: Dict[str, Union[str, List[str]]],
+        weights: Dict[str, float],
+        empty_values: Optional[Dict[str, str]] = None
+    ) -> BudgetedPrompt:
+        """
+        Rellena la plantilla recortando las partes flexibles al presupuesto
+
+        Args:
+            template: Plantilla con placeholders de str.format
+            values: Valores fijos (se incluyen siempre completos)
+            flexible: Partes recortables: texto o lista de elementos por orden de prioridad
+            weights: Peso de cada parte flexible en el reparto
+            empty_values: Texto a usar si una parte flexible queda vacía
+
+        Returns:
+            Prompt ajustado con sus token ids
+
+        Raises:
+            ValueError: Si las partes fijas por sí solas no caben en el presupuesto
+        """
+        empty_values = empty_values or {}
+        fixed_parts = []
+        template_fields = set()
+        for literal, field_name, _, _ in string.Formatter().parse(template):
+            fixed_parts.append(literal)
+            if field_name is None:
+                continue
+            template_fields.add(field_name)
+            if field_name not in flexible:
+                fixed_parts.append(str(values.get(field_name, '')))
+        # Las partes que la plantilla no usa no consumen presupuesto
+        flexible = {name: part for name, part in flexible.items() if name in template_fields}
+
+        # Una sola llamada al tokenizador para todas las partes
+        names = list(flexible)
+        pieces = [''.join(fixed_parts)]
+        layout = []
+        for name in names:
+            items = [flexible[name]] if isinstance(flexible[name], str) else list(flexible[name])
+            layout.append((name, isinstance(flexible[name], str), len(items)))
+            pieces.extend(items)
+        pieces.append(self.separator)
+        encoded = self.tokenizer(pieces, add_special_tokens=False)['input_ids']
+
+        fixed_tokens = len(encoded[0])
+        separator_tokens = len(encoded[-1])
+        special_tokens = len(self.tokenizer("")['input_ids'])
+        available = max(self.max_prompt_tokens - fixed_tokens - special_tokens, 0)
+
+        tokens_by_item: Dict[str, List[List[int]]] = {}
+        offset = 1
+        for name, _, count in layout:
+            tokens_by_item[name] = encoded[offset:offset + count]
+            offset += count
+
+        demands = {
+            name: sum(len(ids) for ids in tokens_by_item[name]) + separator_tokens * max(count - 1, 0)
+            for name, _, count in layout
+        }
+        allocation = self._allocate(available, demands, weights)
+
+        # Las listas se llenan primero; los tokens que no usan pasan al texto
+        is_text = {name: text for name, text, _ in layout}
+        chosen: Dict[str, List[List[int]]] = {}
+        spare = 0
+        for name in names:
+            if is_text[name]:
+                continue
+            chosen[name] = self._fill_items(tokens_by_item[name], allocation[name], separator_tokens)
+            used = sum(len(ids) for ids in chosen[name]) + separator_tokens * max(len(chosen[name]) - 1, 0)
+            spare += allocation[name] - used
+
+        text_names = [name for name in names if is_text[name]]
+        if text_names:
+            extra = self._allocate(
+                spare,
+                {name: demands[name] - allocation[name] for name in text_names},
+                weights
+            )
+            for name in text_names:
+                chosen[name] = [tokens_by_item[name][0][:allocation[name] + extra[name]]]
+
+        truncated = [
+            name for name in names
+            if sum(len(ids) for ids in chosen[name]) < sum(len(ids) for ids in tokens_by_item[name])
+        ]
+
+        # La tokenización del prompt completo puede diferir unos tokens de la suma
+        # de las partes (fusiones en las fronteras): se recortan las partes
+        # flexibles hasta que quepa, nunca el final del prompt (las instrucciones)
+        while True:
+            prompt = self._render(template, values, chosen, is_text, empty_values)
+            input_ids = self.tokenizer(prompt)['input_ids']
+            overflow = len(input_ids) - self.max_prompt_tokens
+            if overflow <= 0:
+                break
+            if not self._shrink(chosen, truncated, overflow):
+                raise ValueError(
+                    f"The prompt instructions alone need {len(input_ids)} tokens, "
+                    f"more than the {self.max_prompt_tokens} available"
+                )
+
+        return BudgetedPrompt(
+            prompt=prompt,
+            input_ids=input_ids,
+            tokens_by_field={
+                name: sum(len(ids) for ids in chosen[name]) for name in names
+            },
+            items_included={
+                name: sum(1 for ids in chosen[name] if ids) for name in names if not is_text[name]
+            },
+            truncated=truncated,
+            static_prefix=fixed_parts[0] if fixed_parts else ""
+        )
+
+    @staticmethod
+    def _allocate(available: int, demands: Dict[str, int], weights: Dict[str, float]) -> Dict[str, int]:
+        """
+        Reparte tokens por pesos sin dar a ninguna parte más de lo que necesita
+
+        Args:
+            available: Tokens a repartir
+            demands: Tokens que necesita cada parte para entrar completa
+            weights: Peso de cada parte
+
+        Returns:
+            Tokens asignados a cada parte
+        """
+        allocation = {name: 0 for name in demands}
+        active = [name for name, demand in demands.items() if demand > 0]
+        remaining = available
+        while active and remaining > 0:
+            total_weight = sum(weights.get(name, 1.0) for name in active) or len(active)
+            shares = {name: remaining * weights.get(name, 1.0) / total_weight for name in active}
+            satisfied = [name for name in active if demands[name] - allocation[name] <= shares[name]]
+            if not satisfied:
+                for name in active:
+                    allocation[name] += int(shares[name])
+                break
+            for name in satisfied:
+                remaining -= demands[name] - allocation[name]
+                allocation[name] = demands[name]
+                active.remove(name)
+        return allocation
+
+    @staticmethod
+    def _fill_items(items: List[List[int]], budget: int, separator_tokens: int) -> List[List[int]]:
+        """
+        Toma elementos completos en orden mientras quepan; el último que no
+        cabe se recorta si todavía queda un trozo útil
+
+        Args:
+            items: Tokens de cada elemento, por orden de prioridad
+            budget: Tokens disponibles
+            separator_tokens: Tokens del separador entre elementos
+
+        Returns:
+            Tokens de los elementos incluidos
+        """
+        chosen = []
+        remaining = budget
+        for ids in items:
+            cost = len(ids) + (separator_tokens if chosen else 0)
+            if cost <= remaining:
+                chosen.append(ids)
+                remaining -= cost
+                continue
+            partial = remaining - (separator_tokens if chosen else 0)
+            if partial >= PROMPT_MIN_PARTIAL_TOKENS:
+                chosen.append(ids[:partial])
+            break
+        return chosen
+
+    @staticmethod
+    def _shrink(chosen: Dict[str, List[List[int]]], truncated: List[str], overflow: int) -> bool:
+        """
+        Recorta `overflow` tokens del último elemento de una parte, empezando por
+        las que ya estaban recortadas para no tocar las que entraron completas.
+        Los elementos que se quedan vacíos se descartan, así que las llamadas
+        sucesivas siguen por el elemento anterior.
+
+        Returns:
+            False si no queda nada que recortar
+        """
+        for items in chosen.values():
+            while items and not items[-1]:
+                items.pop()
+        candidates = [name for name in truncated if chosen[name]]
+        if not candidates:
+            candidates = [name for name in chosen if chosen[name]]
+        if not candidates:
+            return False
+        name = max(candidates, key=lambda candidate: len(chosen[candidate][-1]))
+        if name not in truncated:
+            truncated.append(name)
+        last = chosen[name][-1]
+        chosen[name][-1] = last[:max(len(last) - overflow, 0)]
+        return True
+
+    def _render(
+        self,
+        template: str,
+        values: Dict[str, str],
+        chosen: Dict[str, List[List[int]]],
+        is_text: Dict[str, bool],
+        empty_values: Dict[str, str]
+    ) -> str:
+        """Decodifica las partes elegidas y rellena la plantilla"""
+        rendered = dict(values)
+        for name, items in chosen.items():
+            texts = [self.tokenizer.decode(ids, skip_special_tokens=True) for ids in items if ids]
+            joined = texts[0] if is_text[name] and texts else self.separator.join(texts)
+            rendered[name] = joined if joined.strip() else empty_values.get(name, '')
+        return template.format(**rendered)
@@ -0,0 +1,262 @@
+"""
+Caché persistente en SQLite para resultados de PubMed
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from src.config import (
+    PUBMED_CACHE_PATH,
+    PUBMED_CACHE_SEARCH_TTL_DAYS,
+    PUBMED_CACHE_MAX_SEARCHES,
+    PUBMED_CACHE_MAX_ARTICLES
+)
+from src.pubmed_xml import Article
+
+
+class PubMedCache:
+    """
+    Guarda en disco los resultados de esearch y los artículos ya parseados.
+
+    Las búsquedas se indexan por (consulta, ventana de fechas, retmax) y caducan
+    tras `ttl_days`; los artículos se indexan por PMID y no caducan. Ambas tablas
+    se recortan por antigüedad de uso (LRU) cuando superan su tamaño máximo.
+    """
+
+    def __init__(
+        self,
+        path: str = PUBMED_CACHE_PATH,
+        ttl_days: float = PUBMED_CACHE_SEARCH_TTL_DAYS,
+        max_searches: int = PUBMED_CACHE_MAX_SEARCHES,
+        max_articles: int = PUBMED_CACHE_MAX_ARTICLES
+    ):
+        """
+        Abre (o crea) la caché
+
+        Args:
+            path: Ruta del archivo SQLite
+            ttl_days: Días de validez de una búsqueda
+            max_searches: Número máximo de búsquedas guardadas
+            max_articles: Número máximo de artículos guardados
+        """
+        self.path = path
+        self.ttl_seconds = ttl_days * 86400
+        self.max_searches = max_searches
+        self.max_articles = max_articles
+        self._lock = threading.Lock()
+
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS searches (
+                    query TEXT NOT NULL,
+                    mindate TEXT NOT NULL,
+                    maxdate TEXT NOT NULL,
+                    retmax INTEGER NOT NULL,
+                    result TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    PRIMARY KEY (query, mindate, maxdate, retmax)
+                )"""
+            )
+            self._conn.execute(
+                """CREATE TABLE IF NOT EXISTS articles (
+                    pmid TEXT PRIMARY KEY,
+                    record TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )"""
+            )
+
+    def get_search(self, query: str, mindate: str, maxdate: str, retmax: int) -> Optional[Dict]:
+        """
+        Devuelve una búsqueda guardada si no ha caducado
+
+        Args:
+            query: Término de búsqueda
+            mindate: Fecha mínima ('' sin límite)
+            maxdate: Fecha máxima ('' sin límite)
+            retmax: Número máximo de PMIDs pedido
+
+        Returns:
+            Diccionario con 'ids' y 'count', o None si no está en caché
+        """
+        key = (query, mindate, maxdate, retmax)
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT result, created_at FROM searches WHERE query=? AND mindate=? AND maxdate=? AND retmax=?",
+                key
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl_seconds:
+                self._conn.execute(
+                    "DELETE FROM searches WHERE query=? AND mindate=? AND maxdate=? AND retmax=?", key
+                )
+                return None
+            self._conn.execute(
+                "UPDATE searches SET accessed_at=? WHERE query=? AND mindate=? AND maxdate=? AND retmax=?",
+                (now,) + key
+            )
+        return json.loads(row[0])
+
+    def put_search(self, query: str, mindate: str, maxdate: str, retmax: int, result: Dict):
+        """
+        Guarda el resultado de una búsqueda
+
+        Args:
+            query: Término de búsqueda
+            mindate: Fecha mínima ('' sin límite)
+            maxdate: Fecha máxima ('' sin límite)
+            retmax: Número máximo de PMIDs pedido
+            result: Diccionario con 'ids' y 'count'
+        """
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO searches VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (query, mindate, maxdate, retmax, json.dumps(result), now, now)
+            )
+            self._trim('searches', self.max_searches)
+
+    def get_articles(self, pmids: Iterable[str]) -> Dict[str, Article]:
+        """
+        Devuelve los artículos guardados de entre los PMIDs pedidos
+
+        Args:
+            pmids: PMIDs a buscar
+
+        Returns:
+            Diccionario PMID -> artículo (solo los que están en caché)
+        """
+        pmids = list(pmids)
+        found = {}
+        now = time.time()
+        with self._lock, self._conn:
+            # SQLite limita el número de parámetros por consulta
+            for i in range(0, len(pmids), 500):
+                chunk = pmids[i:i + 500]
+                placeholders = ','.join('?' * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT pmid, record FROM articles WHERE pmid IN ({placeholders})", chunk
+                ).fetchall()
+                for pmid, record in rows:
+                    found[pmid] = Article.from_dict(json.loads(record))
+                self._conn.execute(
+                    f"UPDATE articles SET accessed_at=? WHERE pmid IN ({placeholders})", [now] + chunk
+                )
+        return found
+
+    def put_articles(self, articles: List[Article]):
+        """
+        Guarda artículos parseados (solo metadatos de esummary o registros completos)
+
+        Args:
+            articles: Lista de artículos
+        """
+        if not articles:
+            return
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?)",
+                [(article.pmid, json.dumps(article.to_dict()), now, now) for article in articles]
+            )
+            self._trim('articles', self.max_articles)
+
+    def stats(self) -> Dict:
+        """
+        Devuelve el tamaño de la caché
+
+        Returns:
+            Diccionario con número de búsquedas (totales y caducadas), artículos y bytes en disco
+        """
+        expired_before = time.time() - self.ttl_seconds
+        with self._lock:
+            searches = self._conn.execute("SELECT COUNT(*) FROM searches").fetchone()[0]
+            expired = self._conn.execute(
+                "SELECT COUNT(*) FROM searches WHERE created_at < ?", (expired_before,)
+            ).fetchone()[0]
+            articles = self._conn.execute("SELECT COUNT(*) FROM articles").fetchone()[0]
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        return {'searches': searches, 'expired_searches': expired, 'articles': articles, 'bytes': size}
+
+    def prune(self, max_searches: Optional[int] = None, max_articles: Optional[int] = None) -> Dict[str, int]:
+        """
+        Elimina búsquedas caducadas y recorta ambas tablas a su tamaño máximo
+
+        Args:
+            max_searches: Límite de búsquedas (por defecto el configurado)
+            max_articles: Límite de artículos (por defecto el configurado)
+
+        Returns:
+            Número de búsquedas y artículos eliminados
+        """
+        expired_before = time.time() - self.ttl_seconds
+        with self._lock, self._conn:
+            removed_searches = self._conn.execute(
+                "DELETE FROM searches WHERE created_at < ?", (expired_before,)
+            ).rowcount
+            removed_searches += self._trim(
+                'searches', self.max_searches if max_searches is None else max_searches
+            )
+            removed_articles = self._trim(
+                'articles', self.max_articles if max_articles is None else max_articles
+            )
+        with self._lock:
+            self._conn.execute("VACUUM")
+        return {'searches': removed_searches, 'articles': removed_articles}
+
+    def clear(self):
+        """Vacía la caché por completo"""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM searches")
+            self._conn.execute("DELETE FROM articles")
+        with self._lock:
+            self._conn.execute("VACUUM")
+
+    def _trim(self, table: str, max_rows: int) -> int:
+        """
+        Elimina las filas usadas menos recientemente que excedan `max_rows`
+
+        Args:
+            table: 'searches' o 'articles'
+            max_rows: Número máximo de filas
+
+        Returns:
+            Filas eliminadas
+        """
+        count = self._conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        excess = count - max_rows
+        if excess <= 0:
+            return 0
+        return self._conn.execute(
+            f"DELETE FROM {table} WHERE rowid IN "
+            f"(SELECT rowid FROM {table} ORDER BY accessed_at LIMIT ?)",
+            (excess,)
+        ).rowcount
+
+
+_cache: Optional[PubMedCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_pubmed_cache() -> PubMedCache:
+    """
+    Devuelve la caché de PubMed del proceso (la abre la primera vez)
+
+    Returns:
+        Instancia compartida de PubMedCache
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = PubMedCache()
+        return _cache
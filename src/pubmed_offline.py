@@ -0,0 +1,293 @@
+"""
+Búsqueda en PubMed sin conexión sobre un índice local (SQLite FTS5)
+"""
+import os
+import re
+import sqlite3
+import threading
+from typing import Callable, Dict, Iterable, List, Optional
+
+from src.config import PUBMED_OFFLINE_INDEX_PATH
+from src.pubmed_searcher import PubMedSearcher
+from src.pubmed_xml import Article, iter_pubmed_xml
+
+_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS articles (
+        pmid INTEGER PRIMARY KEY,
+        year INTEGER,
+        year_text TEXT,
+        title TEXT,
+        authors TEXT,
+        journal TEXT,
+        abstract TEXT
+    )""",
+    "CREATE INDEX IF NOT EXISTS articles_year ON articles(year)",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS articles_fts USING fts5(
+        title, abstract, content='articles', content_rowid='pmid'
+    )"""
+)
+
+_YEAR_PATTERN = re.compile(r'(\d{4})')
+_QUERY_TOKEN_PATTERN = re.compile(r'"[^"]*"|\S+')
+
+
+def _open_index(path: str) -> sqlite3.Connection:
+    """Abre el índice local creando las tablas si no existen"""
+    if path != ':memory:':
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    conn = sqlite3.connect(path, check_same_thread=False)
+    with conn:
+        for statement in _SCHEMA:
+            conn.execute(statement)
+    return conn
+
+
+class PubMedIndexImporter:
+    """Importa ficheros baseline/update de PubMed (XML o XML.gz) al índice local"""
+
+    def __init__(self, index_path: str = PUBMED_OFFLINE_INDEX_PATH, batch_size: int = 1000):
+        """
+        Inicializa el importador
+
+        Args:
+            index_path: Ruta del índice SQLite
+            batch_size: Artículos por transacción (acota la memoria usada)
+        """
+        self.index_path = index_path
+        self.batch_size = batch_size
+        self.conn = _open_index(index_path)
+
+    def import_file(self, source: str, progress: Optional[Callable[[int], None]] = None) -> Dict[str, int]:
+        """
+        Importa un fichero de PubMed leyéndolo de forma incremental
+
+        Args:
+            source: Ruta del fichero (.xml o .xml.gz)
+            progress: Función que recibe el número de artículos procesados
+
+        Returns:
+            Número de artículos importados y eliminados
+        """
+        counts = {'imported': 0, 'deleted': 0}
+        batch = []
+
+        for record in iter_pubmed_xml(source):
+            if not isinstance(record, Article):
+                self._flush(batch)
+                counts['imported'] += len(batch)
+                batch = []
+                self._delete(record['deleted'])
+                counts['deleted'] += 1
+                continue
+
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                self._flush(batch)
+                counts['imported'] += len(batch)
+                batch = []
+                if progress:
+                    progress(counts['imported'])
+
+        self._flush(batch)
+        counts['imported'] += len(batch)
+        if progress:
+            progress(counts['imported'])
+        return counts
+
+    def optimize(self):
+        """Compacta el índice de texto tras una importación grande"""
+        with self.conn:
+            self.conn.execute("INSERT INTO articles_fts(articles_fts) VALUES ('optimize')")
+
+    def _flush(self, records: List[Article]):
+        """Inserta un lote de artículos reemplazando versiones anteriores"""
+        if not records:
+            return
+        with self.conn:
+            for record in records:
+                pmid = int(record.pmid)
+                # Los ficheros update revisan artículos ya importados
+                self._remove_from_fts(pmid)
+                year_match = _YEAR_PATTERN.search(record.year)
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO articles VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (
+                        pmid,
+                        int(year_match.group(1)) if year_match else None,
+                        record.year,
+                        record.title,
+                        record.authors,
+                        record.journal,
+                        record.abstract
+                    )
+                )
+                self.conn.execute(
+                    "INSERT INTO articles_fts(rowid, title, abstract) VALUES (?, ?, ?)",
+                    (pmid, record.title, record.abstract)
+                )
+
+    def _delete(self, pmid: str):
+        """Elimina un artículo retirado por un fichero update"""
+        with self.conn:
+            self._remove_from_fts(int(pmid))
+            self.conn.execute("DELETE FROM articles WHERE pmid = ?", (int(pmid),))
+
+    def _remove_from_fts(self, pmid: int):
+        """Quita un artículo del índice de texto (tabla FTS con contenido externo)"""
+        row = self.conn.execute("SELECT title, abstract FROM articles WHERE pmid = ?", (pmid,)).fetchone()
+        if row is not None:
+            self.conn.execute(
+                "INSERT INTO articles_fts(articles_fts, rowid, title, abstract) VALUES ('delete', ?, ?, ?)",
+                (pmid, row[0], row[1])
+            )
+
+
+class OfflinePubMedSearcher(PubMedSearcher):
+    """
+    Buscador de PubMed sobre el índice local.
+
+    Reutiliza la estrategia de búsqueda de PubMedSearcher (ventanas de fechas,
+    búsqueda combinada con AND, deduplicación) sustituyendo las peticiones a
+    Entrez por consultas al índice, que se resuelven en milisegundos.
+    """
+
+    def __init__(self, index_path: str = PUBMED_OFFLINE_INDEX_PATH):
+        """
+        Inicializa el buscador sin conexión
+
+        Args:
+            index_path: Ruta del índice creado con PubMedIndexImporter
+        """
+        if index_path != ':memory:' and not os.path.exists(index_path):
+            raise FileNotFoundError(
+                f"Índice de PubMed no encontrado: {index_path}. "
+                f"Impórtalo con: python main.py pubmed-import <ficheros>"
+            )
+        self.index_path = index_path
+        self.conn = _open_index(index_path)
+        self._lock = threading.Lock()
+        self.max_workers = 1
+        self.cache = None
+        self.cancel_token = None
+
+    def _esearch(self, query: str, max_results: int, mindate: str = "", maxdate: str = "") -> Dict:
+        """
+        Equivalente local de esearch, ordenado por fecha de publicación
+
+        Args:
+            query: Término de búsqueda (frase clave o combinación con AND/OR/NOT)
+            max_results: Número máximo de PMIDs
+            mindate: Fecha mínima ('' sin límite)
+            maxdate: Fecha máxima ('' sin límite)
+
+        Returns:
+            Diccionario con 'ids' y 'count'
+        """
+        self._check_cancelled()
+        conditions = ["articles_fts MATCH ?"]
+        params: List = [self._to_fts_query(query)]
+        if mindate:
+            conditions.append("a.year >= ?")
+            params.append(int(mindate[:4]))
+        if maxdate:
+            conditions.append("a.year <= ?")
+            params.append(int(maxdate[:4]))
+        where = ' AND '.join(conditions)
+
+        with self._lock:
+            count = self.conn.execute(
+                f"SELECT COUNT(*) FROM articles_fts JOIN articles a ON a.pmid = articles_fts.rowid WHERE {where}",
+                params
+            ).fetchone()[0]
+            rows = self.conn.execute(
+                f"SELECT a.pmid FROM articles_fts JOIN articles a ON a.pmid = articles_fts.rowid "
+                f"WHERE {where} ORDER BY a.year DESC, a.pmid DESC LIMIT ?",
+                params + [max_results]
+            ).fetchall()
+
+        return {'ids': [str(row[0]) for row in rows], 'count': count}
+
+    def _fetch_article_details(self, pmids: List[str]) -> List[Article]:
+        """
+        Lee artículos del índice local
+
+        Args:
+            pmids: Lista de PMIDs
+
+        Returns:
+            Lista de artículos
+        """
+        if not pmids:
+            return []
+        placeholders = ','.join('?' * len(pmids))
+        with self._lock:
+            rows = self.conn.execute(
+                f"SELECT pmid, title, authors, journal, year_text, abstract FROM articles "
+                f"WHERE pmid IN ({placeholders})",
+                [int(pmid) for pmid in pmids]
+            ).fetchall()
+
+        by_pmid = {str(row[0]): Article(str(row[0]), *row[1:]) for row in rows}
+        return [by_pmid[pmid] for pmid in pmids if pmid in by_pmid]
+
+    def _fetch_article_summaries(self, pmids: List[str]) -> List[Article]:
+        """
+        En el índice local el registro completo cuesta lo mismo que el resumen,
+        así que se devuelven los artículos con su abstract
+
+        Args:
+            pmids: Lista de PMIDs
+
+        Returns:
+            Lista de artículos
+        """
+        return self._fetch_article_details(pmids)
+
+    @staticmethod
+    def _to_fts_query(query: str) -> str:
+        """
+        Traduce una consulta de PubMed a sintaxis FTS5
+
+        Las palabras sueltas se combinan con AND (como hace PubMed), las frases
+        entre comillas se buscan como frase y se respetan los operadores AND/OR/NOT.
+
+        Args:
+            query: Consulta en formato PubMed
+
+        Returns:
+            Expresión MATCH de FTS5
+        """
+        terms = []
+        for token in _QUERY_TOKEN_PATTERN.findall(query):
+            if token in ('AND', 'OR', 'NOT'):
+                terms.append(token)
+                continue
+            token = token.strip('"').replace('"', '')
+            if token:
+                terms.append(f'"{token}"')
+        return ' '.join(terms) if terms else '""'
+
+
+def import_pubmed_files(paths: Iterable[str], index_path: str = PUBMED_OFFLINE_INDEX_PATH,
+                        log: Callable[[str], None] = print) -> Dict[str, int]:
+    """
+    Importa varios ficheros de PubMed al índice local
+
+    Args:
+        paths: Rutas de ficheros baseline/update
+        index_path: Ruta del índice SQLite
+        log: Función que recibe mensajes de progreso
+
+    Returns:
+        Totales de artículos importados y eliminados
+    """
+    importer = PubMedIndexImporter(index_path)
+    totals = {'imported': 0, 'deleted': 0}
+    for path in paths:
+        log(f"📥 Importing {path}...")
+        counts = importer.import_file(path)
+        totals['imported'] += counts['imported']
+        totals['deleted'] += counts['deleted']
+        log(f"✓ {counts['imported']} articles imported, {counts['deleted']} deleted")
+    importer.optimize()
+    return totals
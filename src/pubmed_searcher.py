@@ -2,31 +2,72 @@
 Módulo para búsqueda de artículos en PubMed
 """
 import datetime
-from typing import List, Dict, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from Bio import Entrez
 from src.config import (
     ENTREZ_EMAIL,
     ENTREZ_TOOL,
+    NCBI_API_KEY,
     PUBMED_INITIAL_YEARS,
     PUBMED_MAX_RESULTS_THRESHOLD,
-    PUBMED_MIN_RESULTS_THRESHOLD
+    PUBMED_MIN_RESULTS_THRESHOLD,
+    PUBMED_MAX_WORKERS,
+    PUBMED_EFETCH_BATCH_SIZE,
+    PUBMED_MAX_REFERENCES,
+    PUBMED_RATE_LIMIT,
+    PUBMED_RATE_LIMIT_WITH_KEY,
+    PUBMED_CACHE_ENABLED,
+    PUBMED_MODE
 )
+from src.cancellation import CancelToken, ReviewCancelled
+from src.pubmed_cache import get_pubmed_cache
+from src.pubmed_xml import Article, iter_esummary_xml, iter_pubmed_xml
+from src.rate_limiter import get_shared_bucket
+
+# Ventana elegida cuando una búsqueda no tiene resultados en ninguna ventana
+# (None ya significa "sin límite de fecha"); no se consulta a PubMed
+NO_RESULTS_WINDOW: Tuple[int, int] = (0, 0)
 
 
 class PubMedSearcher:
     """Gestiona búsquedas en la base de datos PubMed"""
     
-    def __init__(self, email: str = ENTREZ_EMAIL):
+    def __init__(
+        self,
+        email: str = ENTREZ_EMAIL,
+        api_key: str = NCBI_API_KEY,
+        max_workers: int = PUBMED_MAX_WORKERS,
+        use_cache: bool = PUBMED_CACHE_ENABLED
+    ):
         """
         Inicializa el buscador de PubMed
         
         Args:
             email: Email para identificación en Entrez
+            api_key: API key de NCBI (opcional, aumenta el límite de peticiones)
+            max_workers: Número máximo de búsquedas simultáneas
+            use_cache: Si se usa la caché local de búsquedas y artículos
         """
         Entrez.email = email
         Entrez.tool = ENTREZ_TOOL
+        if api_key:
+            Entrez.api_key = api_key
+        
+        # El límite de NCBI es por cliente: todas las instancias comparten el mismo bucket
+        rate = PUBMED_RATE_LIMIT_WITH_KEY if api_key else PUBMED_RATE_LIMIT
+        self.rate_limiter = get_shared_bucket('ncbi', rate)
+        self.max_workers = max(1, max_workers)
+        self.cache = get_pubmed_cache() if use_cache else None
+        # Se consulta antes de cada petición; si se cancela, la búsqueda termina con ReviewCancelled
+        self.cancel_token: Optional[CancelToken] = None
     
-    def search_articles(self, keyphrases: List[str], num_articles: int = 20) -> Dict[str, List[Dict]]:
+    def _check_cancelled(self):
+        """Lanza ReviewCancelled si se ha cancelado la revisión"""
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+    
+    def search_articles(self, keyphrases: List[str], num_articles: int = 20) -> Dict[str, List[Article]]:
         """
         Busca artículos en PubMed usando frases clave
         
@@ -40,57 +81,235 @@ class PubMedSearcher:
         pubmed_data = {}
         current_year = datetime.datetime.now().year
         
-        for kp in keyphrases:
-            articles = self._search_single_keyphrase(kp, num_articles, current_year)
+        if not keyphrases:
+            return pubmed_data
+        
+        windows = self._date_windows(current_year)
+        count_tasks = [(kp, window) for kp in keyphrases for window in windows]
+        
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(count_tasks))) as executor:
+            # Fase 1: recuentos (retmax=0) de todas las ventanas de fechas candidatas en paralelo
+            counts = list(executor.map(lambda task: self._count_results(task[0], task[1]), count_tasks))
+            self._check_cancelled()
+            chosen_windows = [
+                self._select_window(windows, counts[i * len(windows):(i + 1) * len(windows)])
+                for i in range(len(keyphrases))
+            ]
+            
+            # Fase 2: PMIDs solo de la ventana elegida para cada frase clave;
+            # map() conserva el orden original de las frases clave
+            ids_by_keyphrase = list(executor.map(
+                lambda task: self._search_window_ids(task[0], task[1], num_articles),
+                zip(keyphrases, chosen_windows)
+            ))
+            self._check_cancelled()
+            
+            # Fase 3: un único efetch por lotes para la unión deduplicada de PMIDs
+            unique_ids = list(dict.fromkeys(pmid for ids in ids_by_keyphrase for pmid in ids))
+            articles_by_pmid = self._fetch_articles_by_pmid(unique_ids, executor)
+        
+        # Asignar los artículos descargados a cada frase clave, en el orden de esearch
+        for kp, ids in zip(keyphrases, ids_by_keyphrase):
+            articles = [articles_by_pmid[pmid] for pmid in ids if pmid in articles_by_pmid]
             if articles:
                 pubmed_data[kp] = articles
         
         return pubmed_data
     
-    def _search_single_keyphrase(self, keyphrase: str, num_articles: int, current_year: int) -> List[Dict]:
+    @staticmethod
+    def _date_windows(current_year: int) -> List[Optional[Tuple[int, int]]]:
         """
-        Busca artículos para una única frase clave
+        Ventanas de fechas candidatas, de la más estrecha a la más amplia
         
         Args:
-            keyphrase: Frase clave a buscar
-            num_articles: Número de artículos deseados
             current_year: Año actual
             
         Returns:
-            Lista de artículos encontrados
+            Lista de (año inicial, año final); None significa sin límite de fecha
         """
-        try:
-            # Búsqueda inicial con años recientes
-            ids = self._search_with_date_range(
-                keyphrase,
-                current_year - PUBMED_INITIAL_YEARS,
-                current_year,
-                num_articles
-            )
-            
-            # Si hay demasiados resultados, no hacer nada (ya limitado por retmax)
-            # Si hay pocos resultados, extender búsqueda
-            if len(ids) < PUBMED_MIN_RESULTS_THRESHOLD:
-                ids = self._search_with_date_range(
-                    keyphrase,
-                    current_year - 10,  # Extender a 10 años
-                    current_year,
-                    num_articles
-                )
+        return [
+            (current_year - PUBMED_INITIAL_YEARS, current_year),
+            (current_year - 10, current_year),  # Extender a 10 años
+            None
+        ]
+    
+    @staticmethod
+    def _select_window(
+        windows: List[Optional[Tuple[int, int]]],
+        counts: List[int]
+    ) -> Optional[Tuple[int, int]]:
+        """
+        Elige la ventana más estrecha con al menos PUBMED_MIN_RESULTS_THRESHOLD resultados
+        
+        Args:
+            windows: Ventanas candidatas, de la más estrecha a la más amplia
+            counts: Número de resultados de cada ventana
             
-            # Si aún no hay suficientes, búsqueda sin límite de fecha
-            if len(ids) < PUBMED_MIN_RESULTS_THRESHOLD:
-                ids = self._search_without_date(keyphrase, num_articles)
+        Returns:
+            Ventana elegida (la más amplia si ninguna alcanza el umbral), o
+            NO_RESULTS_WINDOW si no hay resultados en ninguna
+        """
+        for window, count in zip(windows, counts):
+            if count >= PUBMED_MIN_RESULTS_THRESHOLD:
+                return window
+        return windows[-1] if any(counts) else NO_RESULTS_WINDOW
+    
+    def _count_results(self, query: str, window: Optional[Tuple[int, int]]) -> int:
+        """
+        Cuenta los resultados de una búsqueda sin descargar PMIDs (esearch con retmax=0)
+        
+        Args:
+            query: Término de búsqueda
+            window: (año inicial, año final) o None sin límite de fecha
             
-            # Obtener detalles de los artículos
-            if ids:
-                return self._fetch_article_details(ids[:num_articles])
+        Returns:
+            Número de artículos en PubMed (0 si la búsqueda falla)
+        """
+        try:
+            if window is None:
+                return self._esearch(query, 0)['count']
+            return self._esearch(query, 0, f"{window[0]}/01/01", f"{window[1]}/12/31")['count']
+        except ReviewCancelled:
+            raise
+        except Exception as e:
+            print(f"Error contando resultados de '{query}': {str(e)}")
+            return 0
+    
+    def _search_window_ids(self, query: str, window: Optional[Tuple[int, int]], max_results: int) -> List[str]:
+        """
+        Obtiene los PMIDs de una búsqueda en la ventana de fechas elegida
+        
+        Args:
+            query: Término de búsqueda
+            window: (año inicial, año final), None sin límite, o NO_RESULTS_WINDOW si no hay resultados
+            max_results: Número máximo de PMIDs
             
+        Returns:
+            Lista de PMIDs
+        """
+        if window == NO_RESULTS_WINDOW:
             return []
+        if window is None:
+            return self._search_without_date(query, max_results)
+        return self._search_with_date_range(query, window[0], window[1], max_results)
+    
+    def _fetch_articles_by_pmid(
+        self,
+        pmids: List[str],
+        executor: Optional[ThreadPoolExecutor] = None
+    ) -> Dict[str, Article]:
+        """
+        Obtiene los metadatos de los artículos de la caché y descarga el resto con
+        esummary en lotes de hasta PUBMED_EFETCH_BATCH_SIZE PMIDs
+        
+        Los abstracts no se descargan aquí: solo hacen falta para las referencias
+        que entran en el prompt (ver fetch_abstracts).
+        
+        Args:
+            pmids: Lista de PMIDs sin duplicados
+            executor: Pool de threads en el que lanzar los lotes (None los descarga en serie)
             
-        except Exception as e:
-            print(f"Error buscando '{keyphrase}': {str(e)}")
-            return []
+        Returns:
+            Diccionario PMID -> artículo
+        """
+        articles_by_pmid = self.cache.get_articles(pmids) if self.cache is not None else {}
+        missing = [pmid for pmid in pmids if pmid not in articles_by_pmid]
+        
+        fetch_map = executor.map if executor is not None else map
+        for articles in fetch_map(self._fetch_article_summaries, self._batches(missing)):
+            for article in articles:
+                articles_by_pmid[article['pmid']] = article
+            if self.cache is not None:
+                self.cache.put_articles(articles)
+        
+        return articles_by_pmid
+    
+    def fetch_abstracts(self, articles: List[Article], executor: Optional[ThreadPoolExecutor] = None):
+        """
+        Completa con efetch los artículos que todavía no tienen abstract
+        
+        Los artículos se actualizan en el sitio, de modo que el cambio se ve en
+        todas las frases clave que comparten el mismo artículo. Tras la llamada
+        ningún artículo queda con abstract None.
+        
+        Args:
+            articles: Artículos seleccionados (normalmente las referencias del prompt)
+            executor: Pool de threads en el que lanzar los lotes (None los descarga en serie)
+        """
+        pending = {article.pmid: article for article in articles if article.abstract is None}
+        if not pending:
+            return
+        
+        full_records = {}
+        if self.cache is not None:
+            full_records = {
+                pmid: record for pmid, record in self.cache.get_articles(list(pending)).items()
+                if record.abstract is not None
+            }
+        missing = [pmid for pmid in pending if pmid not in full_records]
+        
+        fetch_map = executor.map if executor is not None else map
+        for records in fetch_map(self._fetch_article_details, self._batches(missing)):
+            for record in records:
+                full_records[record.pmid] = record
+            if self.cache is not None:
+                self.cache.put_articles(records)
+        
+        for pmid, article in pending.items():
+            record = full_records.get(pmid)
+            if record is None:
+                article.abstract = "No abstract available"
+                continue
+            for field in Article.__slots__:
+                setattr(article, field, getattr(record, field))
+    
+    @staticmethod
+    def _batches(pmids: List[str]) -> List[List[str]]:
+        """Divide una lista de PMIDs en lotes de PUBMED_EFETCH_BATCH_SIZE"""
+        return [
+            pmids[i:i + PUBMED_EFETCH_BATCH_SIZE]
+            for i in range(0, len(pmids), PUBMED_EFETCH_BATCH_SIZE)
+        ]
+    
+    @staticmethod
+    def select_references(
+        pubmed_data: Dict[str, List[Article]],
+        max_references: int = PUBMED_MAX_REFERENCES
+    ) -> List[Article]:
+        """
+        Elige los artículos de referencia para el prompt de análisis
+        
+        Recorre las frases clave en orden y toma los artículos que tienen (o
+        pueden tener) abstract, sin repetir PMIDs.
+        
+        Args:
+            pubmed_data: Diccionario con artículos por frase clave
+            max_references: Número máximo de referencias
+            
+        Returns:
+            Lista de artículos seleccionados
+        """
+        references = {}
+        for articles in pubmed_data.values():
+            for article in articles:
+                if len(references) >= max_references:
+                    return list(references.values())
+                if article.get('abstract') != "No abstract available":
+                    references.setdefault(article.get('pmid'), article)
+        return list(references.values())
+    
+    @staticmethod
+    def count_unique_articles(pubmed_data: Dict[str, List[Article]]) -> int:
+        """
+        Cuenta los artículos distintos, aunque aparezcan en varias frases clave
+        
+        Args:
+            pubmed_data: Diccionario con artículos por frase clave
+            
+        Returns:
+            Número de PMIDs únicos
+        """
+        return len({article.get('pmid') for articles in pubmed_data.values() for article in articles})
     
     def _search_with_date_range(self, query: str, start_year: int, end_year: int, max_results: int) -> List[str]:
         """
@@ -106,18 +325,10 @@ class PubMedSearcher:
             Lista de PMIDs
         """
         try:
-            handle = Entrez.esearch(
-                db="pubmed",
-                term=query,
-                sort="pub date",
-                retmax=max_results,
-                datetype="pdat",
-                mindate=f"{start_year}/01/01",
-                maxdate=f"{end_year}/12/31"
-            )
-            record = Entrez.read(handle)
-            handle.close()
-            return record['IdList']
+            record = self._esearch(query, max_results, f"{start_year}/01/01", f"{end_year}/12/31")
+            return record['ids']
+        except ReviewCancelled:
+            raise
         except Exception as e:
             print(f"Error en búsqueda con fechas: {str(e)}")
             return []
@@ -134,102 +345,120 @@ class PubMedSearcher:
             Lista de PMIDs
         """
         try:
-            handle = Entrez.esearch(
-                db="pubmed",
-                term=query,
-                sort="pub date",
-                retmax=max_results
-            )
+            record = self._esearch(query, max_results)
+            return record['ids']
+        except ReviewCancelled:
+            raise
+        except Exception as e:
+            print(f"Error en búsqueda sin fechas: {str(e)}")
+            return []
+    
+    def _esearch(self, query: str, max_results: int, mindate: str = "", maxdate: str = "") -> Dict:
+        """
+        Ejecuta una petición esearch (o la lee de la caché) respetando el límite de peticiones de NCBI
+        
+        Args:
+            query: Término de búsqueda
+            max_results: Número máximo de PMIDs
+            mindate: Fecha mínima de publicación ('' sin límite)
+            maxdate: Fecha máxima de publicación ('' sin límite)
+            
+        Returns:
+            Diccionario con 'ids' (PMIDs) y 'count' (total de resultados en PubMed)
+        """
+        # Tras una cancelación las peticiones pendientes fallan al momento
+        self._check_cancelled()
+        if self.cache is not None:
+            cached = self.cache.get_search(query, mindate, maxdate, max_results)
+            if cached is not None:
+                return cached
+        
+        params = {'term': query, 'sort': "pub date", 'retmax': max_results}
+        if mindate or maxdate:
+            params.update(datetype="pdat", mindate=mindate, maxdate=maxdate)
+        
+        self.rate_limiter.acquire()
+        self._check_cancelled()
+        handle = Entrez.esearch(db="pubmed", **params)
+        try:
             record = Entrez.read(handle)
+        finally:
             handle.close()
-            return record['IdList']
+        
+        result = {'ids': [str(pmid) for pmid in record['IdList']], 'count': int(record.get('Count', 0))}
+        if self.cache is not None:
+            self.cache.put_search(query, mindate, maxdate, max_results, result)
+        return result
+    
+    def _fetch_article_summaries(self, pmids: List[str]) -> List[Article]:
+        """
+        Obtiene los metadatos de artículos (título, autores, revista, año) con esummary
+        
+        Args:
+            pmids: Lista de PMIDs
+            
+        Returns:
+            Lista de artículos sin abstract
+        """
+        self._check_cancelled()
+        try:
+            self.rate_limiter.acquire()
+            self._check_cancelled()
+            summary_handle = Entrez.esummary(db="pubmed", id=','.join(pmids))
+            try:
+                return list(iter_esummary_xml(summary_handle))
+            finally:
+                summary_handle.close()
+            
+        except ReviewCancelled:
+            raise
         except Exception as e:
-            print(f"Error en búsqueda sin fechas: {str(e)}")
+            print(f"Error obteniendo resúmenes: {str(e)}")
             return []
     
-    def _fetch_article_details(self, pmids: List[str]) -> List[Dict]:
+    def _fetch_article_details(self, pmids: List[str]) -> List[Article]:
         """
         Obtiene detalles completos de artículos por sus PMIDs
         
+        La respuesta de efetch se parsea de forma incremental: cada artículo se
+        convierte en un Article compacto y su árbol XML se libera al momento.
+        
         Args:
             pmids: Lista de PMIDs
             
         Returns:
-            Lista de diccionarios con información de artículos
+            Lista de artículos
         """
+        self._check_cancelled()
         try:
+            self.rate_limiter.acquire()
+            self._check_cancelled()
             fetch_handle = Entrez.efetch(db="pubmed", id=pmids, retmode="xml")
-            articles_xml = Entrez.read(fetch_handle)
-            fetch_handle.close()
-            
-            articles = []
-            for art in articles_xml.get('PubmedArticle', []):
-                try:
-                    article_info = self._parse_article(art)
-                    if article_info:
-                        articles.append(article_info)
-                except Exception as e:
-                    print(f"Error parseando artículo: {str(e)}")
-                    continue
-            
-            return articles
+            try:
+                return [record for record in iter_pubmed_xml(fetch_handle) if isinstance(record, Article)]
+            finally:
+                fetch_handle.close()
             
+        except ReviewCancelled:
+            raise
         except Exception as e:
             print(f"Error obteniendo detalles: {str(e)}")
             return []
     
-    def _parse_article(self, article_xml) -> Optional[Dict]:
+    def _fetch_articles(self, pmids: List[str]) -> List[Article]:
         """
-        Parsea XML de un artículo de PubMed
+        Obtiene artículos (de la caché o de PubMed) conservando el orden de los PMIDs
         
         Args:
-            article_xml: XML del artículo
+            pmids: Lista de PMIDs
             
         Returns:
-            Diccionario con información del artículo o None
+            Lista de artículos encontrados
         """
-        try:
-            medline = article_xml['MedlineCitation']
-            article = medline['Article']
-            
-            # Extraer autores
-            authors = []
-            if 'AuthorList' in article:
-                for author in article['AuthorList']:
-                    if 'ForeName' in author and 'LastName' in author:
-                        authors.append(f"{author['ForeName']} {author['LastName']}")
-                    elif 'CollectiveName' in author:
-                        authors.append(author['CollectiveName'])
-            
-            # Extraer abstract
-            abstract_text = "No abstract available"
-            if 'Abstract' in article and 'AbstractText' in article['Abstract']:
-                abstract_parts = article['Abstract']['AbstractText']
-                if isinstance(abstract_parts, list):
-                    abstract_text = ' '.join(str(part) for part in abstract_parts)
-                else:
-                    abstract_text = str(abstract_parts)
-            
-            # Extraer año
-            year = "N/A"
-            if 'Journal' in article and 'JournalIssue' in article['Journal']:
-                pub_date = article['Journal']['JournalIssue'].get('PubDate', {})
-                year = pub_date.get('Year', pub_date.get('MedlineDate', 'N/A'))
-            
-            return {
-                'pmid': medline.get('PMID', 'N/A'),
-                'title': article.get('ArticleTitle', 'No title'),
-                'authors': ', '.join(authors) if authors else 'No authors listed',
-                'journal': article.get('Journal', {}).get('Title', 'Unknown journal'),
-                'year': str(year),
-                'abstract': abstract_text
-            }
-            
-        except Exception as e:
-            print(f"Error parseando artículo: {str(e)}")
-            return None
+        articles_by_pmid = self._fetch_articles_by_pmid(list(dict.fromkeys(pmids)))
+        return [articles_by_pmid[pmid] for pmid in pmids if pmid in articles_by_pmid]
     
-    def search_with_progressive_and(self, keyphrases: List[str], num_articles: int) -> Dict[str, List[Dict]]:
+    def search_with_progressive_and(self, keyphrases: List[str], num_articles: int) -> Dict[str, List[Article]]:
         """
         Búsqueda progresiva: empieza con términos individuales, 
         luego combina con AND si hay demasiados resultados
@@ -243,19 +472,35 @@ class PubMedSearcher:
         """
         current_year = datetime.datetime.now().year
         
-        # Probar búsqueda con todas las frases combinadas
+        # Probar búsqueda con todas las frases combinadas: basta con el recuento
         combined_query = ' AND '.join(f'"{kp}"' for kp in keyphrases)
+        window = self._date_windows(current_year)[0]
+        count = self._count_results(combined_query, window)
         
-        ids = self._search_with_date_range(combined_query, current_year - PUBMED_INITIAL_YEARS, current_year, 100)
-        
-        if len(ids) > PUBMED_MAX_RESULTS_THRESHOLD:
+        if count > PUBMED_MAX_RESULTS_THRESHOLD:
             # Demasiados resultados, mantener combinación AND
-            articles = self._fetch_article_details(ids[:num_articles])
-            return {'combined_search': articles}
-        elif len(ids) < PUBMED_MIN_RESULTS_THRESHOLD:
+            ids = self._search_window_ids(combined_query, window, num_articles)
+            return {'combined_search': self._fetch_articles(ids)}
+        elif count < PUBMED_MIN_RESULTS_THRESHOLD:
             # Pocos resultados, buscar individualmente
             return self.search_articles(keyphrases, num_articles)
         else:
             # Cantidad razonable
-            articles = self._fetch_article_details(ids[:num_articles])
-            return {'combined_search': articles}
+            ids = self._search_window_ids(combined_query, window, num_articles)
+            return {'combined_search': self._fetch_articles(ids)}
+
+
+def create_pubmed_searcher(mode: str = PUBMED_MODE) -> PubMedSearcher:
+    """
+    Crea el buscador de PubMed configurado
+    
+    Args:
+        mode: "online" para consultar Entrez, "offline" para usar el índice local
+        
+    Returns:
+        Instancia de PubMedSearcher (u OfflinePubMedSearcher)
+    """
+    if mode == "offline":
+        from src.pubmed_offline import OfflinePubMedSearcher
+        return OfflinePubMedSearcher()
+    return PubMedSearcher()
@@ -0,0 +1,211 @@
+"""
+Parser incremental de XML de PubMed (efetch y ficheros baseline/update)
+"""
+import gzip
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Iterator, Optional, Union
+
+
+@dataclass
+class Article:
+    """
+    Registro compacto de un artículo de PubMed.
+
+    Usa __slots__ para no reservar un diccionario por instancia y admite el
+    acceso de estilo diccionario (`article['title']`, `article.get('year')`)
+    que usan el analizador y los generadores de informes.
+    """
+    __slots__ = ('pmid', 'title', 'authors', 'journal', 'year', 'abstract')
+
+    pmid: str
+    title: str
+    authors: str
+    journal: str
+    year: str
+    abstract: Optional[str]
+
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Acceso de estilo diccionario con valor por defecto"""
+        return getattr(self, key) if key in self.__slots__ else default
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Convierte el artículo en un diccionario serializable"""
+        return {key: getattr(self, key) for key in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Article":
+        """Crea un artículo a partir de un diccionario (p. ej. leído de la caché)"""
+        return cls(**{key: data.get(key) for key in cls.__slots__})
+
+
+def _text(element: Optional[ET.Element]) -> str:
+    """Devuelve el texto completo de un elemento, incluidas etiquetas de formato internas"""
+    if element is None:
+        return ""
+    return ''.join(element.itertext()).strip()
+
+
+def parse_article_element(element: ET.Element) -> Optional[Article]:
+    """
+    Extrae los campos usados por PRRA de un elemento <PubmedArticle>
+
+    Args:
+        element: Elemento <PubmedArticle>
+
+    Returns:
+        Artículo o None si no tiene MedlineCitation
+    """
+    medline = element.find('MedlineCitation')
+    if medline is None:
+        return None
+    article = medline.find('Article')
+    if article is None:
+        return None
+
+    # Extraer autores
+    authors = []
+    for author in article.iterfind('AuthorList/Author'):
+        fore_name = author.findtext('ForeName')
+        last_name = author.findtext('LastName')
+        if fore_name and last_name:
+            authors.append(f"{fore_name} {last_name}")
+        elif author.find('CollectiveName') is not None:
+            authors.append(_text(author.find('CollectiveName')))
+
+    # Extraer abstract
+    abstract_parts = [_text(part) for part in article.iterfind('Abstract/AbstractText')]
+    abstract_text = ' '.join(part for part in abstract_parts if part) or "No abstract available"
+
+    # Extraer año
+    pub_date = article.find('Journal/JournalIssue/PubDate')
+    year = "N/A"
+    if pub_date is not None:
+        year = pub_date.findtext('Year') or pub_date.findtext('MedlineDate') or "N/A"
+
+    return Article(
+        pmid=medline.findtext('PMID', 'N/A'),
+        title=_text(article.find('ArticleTitle')) or 'No title',
+        authors=', '.join(authors) if authors else 'No authors listed',
+        journal=article.findtext('Journal/Title') or 'Unknown journal',
+        year=str(year),
+        abstract=abstract_text
+    )
+
+
+def parse_summary_element(element: ET.Element) -> Optional[Article]:
+    """
+    Extrae los metadatos de un elemento <DocSum> de esummary
+
+    El abstract queda como None (pendiente de descargar con efetch) salvo que
+    esummary indique que el artículo no tiene abstract.
+
+    Args:
+        element: Elemento <DocSum>
+
+    Returns:
+        Artículo sin abstract o None si el resumen no es válido
+    """
+    pmid = element.findtext('Id')
+    if not pmid:
+        return None
+
+    items = {}
+    authors = []
+    for item in element.iter('Item'):
+        name = item.get('Name')
+        if name == 'Author':
+            authors.append((item.text or '').strip())
+        elif name not in items:
+            items[name] = (item.text or '').strip()
+
+    if 'Title' not in items:
+        return None
+
+    pub_date = items.get('PubDate', '')
+    return Article(
+        pmid=pmid.strip(),
+        title=items['Title'] or 'No title',
+        authors=', '.join(a for a in authors if a) or 'No authors listed',
+        journal=items.get('FullJournalName') or items.get('Source') or 'Unknown journal',
+        year=pub_date.split(' ')[0] if pub_date else "N/A",
+        abstract="No abstract available" if items.get('HasAbstract') == '0' else None
+    )
+
+
+def iter_esummary_xml(source: BinaryIO) -> Iterator[Article]:
+    """
+    Recorre una respuesta XML de esummary resumen a resumen
+
+    Args:
+        source: Flujo binario con el XML
+
+    Yields:
+        Artículos con metadatos (título, autores, revista, año) y sin abstract
+    """
+    context = ET.iterparse(source, events=('start', 'end'))
+    root = None
+    for event, element in context:
+        if root is None and event == 'start':
+            root = element
+            continue
+        if event == 'end' and element.tag == 'DocSum':
+            article = parse_summary_element(element)
+            root.clear()
+            if article:
+                yield article
+
+
+def iter_pubmed_xml(source: Union[str, BinaryIO]) -> Iterator[Union[Article, Dict[str, str]]]:
+    """
+    Recorre un XML de PubMed artículo a artículo con memoria acotada
+
+    Cada <PubmedArticle> se parsea en cuanto se cierra y se libera a continuación,
+    por lo que un fichero baseline completo se procesa sin cargarlo en memoria.
+    Los PMIDs de <DeleteCitation> (ficheros update) se emiten como {'deleted': pmid}.
+
+    Args:
+        source: Ruta (admite .xml.gz) o flujo binario con el XML
+
+    Yields:
+        Artículos (y diccionarios {'deleted': pmid} para las citas retiradas)
+    """
+    if isinstance(source, str) and source.endswith('.gz'):
+        stream = gzip.open(source, 'rb')
+    elif isinstance(source, str):
+        stream = open(source, 'rb')
+    else:
+        stream = source
+
+    try:
+        context = ET.iterparse(stream, events=('start', 'end'))
+        root = None
+        for event, element in context:
+            if root is None and event == 'start':
+                root = element
+                continue
+            if event != 'end':
+                continue
+
+            if element.tag == 'PubmedArticle':
+                try:
+                    article = parse_article_element(element)
+                except Exception as e:
+                    print(f"Error parseando artículo: {str(e)}")
+                    article = None
+                # Liberar el artículo ya procesado
+                root.clear()
+                if article:
+                    yield article
+            elif element.tag == 'DeleteCitation':
+                for pmid in element.iterfind('PMID'):
+                    yield {'deleted': pmid.text}
+                root.clear()
+    finally:
+        if stream is not source:
+            stream.close()
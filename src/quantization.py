@@ -0,0 +1,214 @@
+"""
+Precisión de los modelos en CPU (fp32, bf16, int8) y caché en disco de los modelos cuantizados
+"""
+import hashlib
+import os
+import re
+from typing import Any, Callable, Dict, Optional
+
+import torch
+
+from src.config import CPU_PRECISION, CPU_PRECISIONS, QUANTIZED_MODEL_CACHE_DIR
+
+
+def cpu_supports_bf16() -> bool:
+    """
+    Indica si la CPU tiene instrucciones bf16 nativas (AVX512-BF16 o AMX)
+
+    Sin ellas PyTorch emula bf16 y el modelo va más lento que en fp32.
+
+    Returns:
+        True si bf16 es rentable en esta CPU
+    """
+    try:
+        with open('/proc/cpuinfo') as f:
+            flags = f.read()
+    except OSError:
+        return False
+    return 'avx512_bf16' in flags or 'amx_bf16' in flags
+
+
+def resolve_precision(device: str, precision: Optional[str] = None) -> str:
+    """
+    Decide la precisión con la que se carga un modelo
+
+    Args:
+        device: Dispositivo de destino ('cpu' o 'cuda')
+        precision: Precisión pedida para CPU (por defecto CPU_PRECISION)
+
+    Returns:
+        'fp16' en GPU; en CPU la precisión pedida, o 'fp32' si se pidió bf16 y la CPU no lo soporta
+    """
+    if device == "cuda":
+        return 'fp16'
+
+    precision = precision or CPU_PRECISION
+    if precision not in CPU_PRECISIONS:
+        raise ValueError(f"Unknown CPU precision '{precision}' (expected one of: {', '.join(CPU_PRECISIONS)})")
+    if precision == 'bf16' and not cpu_supports_bf16():
+        return 'fp32'
+    return precision
+
+
+def torch_dtype(precision: str) -> torch.dtype:
+    """
+    Tipo de dato con el que se cargan los pesos para una precisión
+
+    Args:
+        precision: 'fp16', 'bf16', 'fp32' o 'int8'
+
+    Returns:
+        dtype de torch (int8 se carga en fp32 y se cuantiza después)
+    """
+    return {'fp16': torch.float16, 'bf16': torch.bfloat16}.get(precision, torch.float32)
+
+
+def quantize_int8(model: Any) -> Any:
+    """
+    Cuantiza dinámicamente a int8 las capas Linear del modelo
+
+    Los pesos se guardan en int8 y las activaciones se cuantizan al vuelo en
+    cada multiplicación; embeddings y normalizaciones siguen en fp32.
+
+    Args:
+        model: Modelo cargado en fp32 y en CPU
+
+    Returns:
+        Modelo cuantizado
+    """
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def quantized_cache_path(model_name: str, cache_dir: str = QUANTIZED_MODEL_CACHE_DIR) -> str:
+    """
+    Ruta de los pesos cuantizados en la caché
+
+    El formato de los pesos empaquetados de int8 depende de torch y la
+    arquitectura de transformers, así que la ruta incluye ambas versiones:
+    al actualizarlas se vuelve a convertir.
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        cache_dir: Directorio de la caché
+
+    Returns:
+        Ruta del archivo .pt
+    """
+    import transformers
+
+    safe_name = re.sub(r'[^\w.-]+', '--', model_name)
+    versions = hashlib.sha256(f"{torch.__version__}\0{transformers.__version__}".encode()).hexdigest()[:12]
+    return os.path.join(cache_dir, f"{safe_name}-int8-{versions}.pt")
+
+
+def _quantized_skeleton(model_name: str) -> Any:
+    """
+    Construye el modelo ya cuantizado pero sin pesos, listo para load_state_dict
+
+    El modelo se crea en el dispositivo meta (sin reservar memoria) y sus capas
+    Linear se sustituyen por capas int8 dinámicas vacías, igual que haría
+    quantize_dynamic pero sin pasar por los pesos en fp32.
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+
+    Returns:
+        Modelo cuantizado en CPU con los pesos sin inicializar
+    """
+    from transformers import AutoConfig, AutoModelForCausalLM
+
+    config = AutoConfig.from_pretrained(model_name, trust_remote_code=True)
+    with torch.device("meta"):
+        model = AutoModelForCausalLM.from_config(config, torch_dtype=torch.float32, trust_remote_code=True)
+
+    # quantize_dynamic solo convierte las capas que son exactamente nn.Linear
+    linears = [
+        (name, module) for name, module in model.named_modules()
+        if type(module) is torch.nn.Linear
+    ]
+    for name, module in linears:
+        parent_name, _, child_name = name.rpartition('.')
+        quantized = torch.ao.nn.quantized.dynamic.Linear(
+            module.in_features, module.out_features, bias_=module.bias is not None, dtype=torch.qint8
+        )
+        setattr(model.get_submodule(parent_name), child_name, quantized)
+
+    return model.to_empty(device="cpu")
+
+
+def _quantized_checkpoint(model: Any) -> Dict[str, Any]:
+    """Pesos del modelo cuantizado y buffers no persistentes (p. ej. frecuencias de RoPE)"""
+    state_dict = model.state_dict()
+    buffers = {name: buffer for name, buffer in model.named_buffers() if name not in state_dict}
+    return {'state_dict': state_dict, 'buffers': buffers}
+
+
+def _load_quantized_checkpoint(model_name: str, path: str) -> Any:
+    """
+    Reconstruye un modelo cuantizado a partir de los pesos guardados en la caché
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        path: Ruta del archivo guardado por load_int8_model
+
+    Returns:
+        Modelo cuantizado en CPU
+    """
+    from transformers import GenerationConfig
+
+    # weights_only: el archivo solo contiene tensores, nunca se ejecuta código al leerlo
+    checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+    model = _quantized_skeleton(model_name)
+    model.load_state_dict(checkpoint['state_dict'])
+    for name, buffer in checkpoint['buffers'].items():
+        module_name, _, buffer_name = name.rpartition('.')
+        model.get_submodule(module_name).register_buffer(buffer_name, buffer, persistent=False)
+
+    try:
+        model.generation_config = GenerationConfig.from_pretrained(model_name)
+    except OSError:
+        pass  # El modelo no trae generation_config.json; se usa la derivada de la configuración
+
+    return model.eval()
+
+
+def load_int8_model(
+    model_name: str,
+    load_fp32: Callable[[], Any],
+    cache_dir: str = QUANTIZED_MODEL_CACHE_DIR
+) -> Any:
+    """
+    Carga un modelo cuantizado a int8, convirtiéndolo solo la primera vez
+
+    La conversión necesita el modelo completo en fp32; después se guardan los
+    pesos int8 y las siguientes cargas los vuelcan en un modelo ya cuantizado
+    y sin pesos, sin pasar por fp32.
+
+    Args:
+        model_name: Nombre del modelo de HuggingFace
+        load_fp32: Función que carga el modelo en fp32 (solo se llama si no está en caché)
+        cache_dir: Directorio de la caché
+
+    Returns:
+        Modelo cuantizado en CPU
+    """
+    path = quantized_cache_path(model_name, cache_dir)
+    if os.path.exists(path):
+        try:
+            return _load_quantized_checkpoint(model_name, path)
+        except Exception as e:
+            print(f"Error cargando modelo cuantizado de la caché: {str(e)}")
+
+    model = quantize_int8(load_fp32())
+
+    tmp_path = f"{path}.tmp"
+    try:
+        os.makedirs(cache_dir, exist_ok=True)
+        torch.save(_quantized_checkpoint(model), tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Error guardando modelo cuantizado en la caché: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    return model
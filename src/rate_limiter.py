@@ -0,0 +1,74 @@
+"""
+Limitador de peticiones por token bucket, compartido entre threads
+"""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+
+class TokenBucket:
+    """
+    Token bucket thread-safe.
+
+    Cada petición consume un token; los tokens se reponen a `rate` por segundo
+    hasta un máximo de `capacity`. Los threads que no encuentran token reservan
+    el siguiente disponible y duermen fuera del lock, de modo que se atienden
+    en orden de llegada sin superar la tasa configurada.
+    """
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        """
+        Inicializa el limitador
+
+        Args:
+            rate: Peticiones permitidas por segundo
+            capacity: Ráfaga máxima de peticiones seguidas
+        """
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """
+        Espera hasta disponer de un token y lo consume
+
+        Returns:
+            Segundos esperados
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+
+_buckets: Dict[Tuple[str, float], TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def get_shared_bucket(name: str, rate: float, capacity: Optional[float] = None) -> TokenBucket:
+    """
+    Devuelve un limitador compartido por todo el proceso
+
+    Args:
+        name: Nombre del servicio limitado (p. ej. 'ncbi')
+        rate: Peticiones permitidas por segundo
+        capacity: Ráfaga máxima (por defecto 1, peticiones espaciadas uniformemente)
+
+    Returns:
+        Instancia de TokenBucket
+    """
+    key = (name, rate)
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket(rate, capacity or 1.0)
+        return _buckets[key]
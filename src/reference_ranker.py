@@ -0,0 +1,273 @@
+"""
+Ranking local de artículos de referencia (BM25 + MMR + recencia) con NumPy
+"""
+import datetime
+import re
+import string
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from src.config import (
+    REFERENCE_MMR_LAMBDA,
+    REFERENCE_RECENCY_WEIGHT,
+    REFERENCE_RECENCY_HALF_LIFE
+)
+from src.pubmed_xml import Article
+
+_PUNCTUATION_TABLE = str.maketrans({char: ' ' for char in string.punctuation if char != '-'})
+_YEAR_PATTERN = re.compile(r'(\d{4})')
+
+# Palabras sin valor discriminante en textos biomédicos en inglés
+_STOPWORDS = frozenset("""
+    about above after again against all also among and any are because been before being below
+    between both but can could did does doing down during each few for from further had has have
+    having her here hers him his how into its itself more most not now off once only other our ours
+    out over own same she should some such than that the their theirs them then there these they
+    this those through too under until very was were what when where which while who whom why will
+    with would you your study studies patients results methods conclusion conclusions background
+    objective objectives using used use however may within well based associated
+""".split())
+
+
+@dataclass
+class RankedReference:
+    """Artículo seleccionado junto con las puntuaciones que lo eligieron"""
+    article: Article
+    score: float
+    relevance: float
+    recency: float
+    keyphrases: List[str] = field(default_factory=list)
+
+
+class _SparseVectors:
+    """Vectores de documentos en formato disperso (una entrada por término presente)"""
+
+    def __init__(self, rows: np.ndarray, cols: np.ndarray, weights: np.ndarray, num_docs: int, num_terms: int):
+        self.rows = rows
+        self.cols = cols
+        self.weights = weights
+        self.num_docs = num_docs
+        self.num_terms = num_terms
+
+    def similarity(self, index: int) -> np.ndarray:
+        """Coseno de todos los documentos con el documento `index`"""
+        mask = self.rows == index
+        dense = np.zeros(self.num_terms)
+        dense[self.cols[mask]] = self.weights[mask]
+        return np.bincount(self.rows, weights=self.weights * dense[self.cols], minlength=self.num_docs)
+
+
+def _split(text: str) -> List[str]:
+    """Divide un texto en palabras en minúsculas sin puntuación"""
+    return text.lower().translate(_PUNCTUATION_TABLE).split()
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Divide un texto en términos en minúsculas sin palabras vacías ni números
+
+    Args:
+        text: Texto a tokenizar
+
+    Returns:
+        Lista de términos
+    """
+    return [
+        token for token in _split(text)
+        if len(token) > 2 and token not in _STOPWORDS and not token[0].isdigit()
+    ]
+
+
+class ReferenceRanker:
+    """
+    Ordena los artículos recuperados por relevancia respecto al manuscrito.
+
+    La relevancia es BM25 del texto del artículo (título y abstract si está
+    descargado) frente al extracto del manuscrito. A ella se suma un bonus de
+    recencia y la selección final usa MMR: cada nuevo artículo se penaliza por
+    su parecido (coseno TF-IDF) con los ya elegidos y por repetir frases clave
+    ya cubiertas. Todo el cálculo está vectorizado sobre el vocabulario de la
+    consulta, por lo que 1.000 abstracts se ordenan en unas decenas de ms.
+    """
+
+    def __init__(
+        self,
+        mmr_lambda: float = REFERENCE_MMR_LAMBDA,
+        recency_weight: float = REFERENCE_RECENCY_WEIGHT,
+        recency_half_life: float = REFERENCE_RECENCY_HALF_LIFE,
+        k1: float = 1.5,
+        b: float = 0.75
+    ):
+        """
+        Inicializa el ranker
+
+        Args:
+            mmr_lambda: Peso de la relevancia frente a la diversidad (1 = solo relevancia)
+            recency_weight: Peso del bonus de recencia
+            recency_half_life: Años en los que el bonus de recencia se reduce a la mitad
+            k1: Saturación de frecuencia de términos de BM25
+            b: Normalización por longitud de BM25
+        """
+        self.mmr_lambda = mmr_lambda
+        self.recency_weight = recency_weight
+        self.recency_half_life = recency_half_life
+        self.k1 = k1
+        self.b = b
+
+    def rank(
+        self,
+        query_text: str,
+        pubmed_data: Dict[str, List[Article]],
+        limit: int,
+        candidates: Optional[Sequence[Article]] = None
+    ) -> List[RankedReference]:
+        """
+        Elige los `limit` mejores artículos de referencia
+
+        Args:
+            query_text: Extracto del manuscrito
+            pubmed_data: Artículos por frase clave
+            limit: Número de artículos a devolver
+            candidates: Restringe la selección a estos artículos (por defecto todos)
+
+        Returns:
+            Artículos seleccionados, en orden de selección
+        """
+        keyphrases_by_pmid: Dict[str, List[str]] = {}
+        articles: Dict[str, Article] = {}
+        for keyphrase, keyphrase_articles in pubmed_data.items():
+            for article in keyphrase_articles:
+                articles.setdefault(article.pmid, article)
+                keyphrases_by_pmid.setdefault(article.pmid, []).append(keyphrase)
+
+        if candidates is not None:
+            articles = {article.pmid: article for article in candidates}
+        articles = {
+            pmid: article for pmid, article in articles.items()
+            if article.abstract != "No abstract available"
+        }
+        if not articles or limit <= 0:
+            return []
+
+        pool = list(articles.values())
+        relevance, vectors = self._score(query_text, [self._document_text(a) for a in pool])
+        recency = self._recency([a.year for a in pool])
+        base = relevance + self.recency_weight * recency
+
+        keyphrase_index = {kp: i for i, kp in enumerate(pubmed_data)}
+        membership = np.zeros((len(pool), max(len(keyphrase_index), 1)))
+        for row, article in enumerate(pool):
+            for keyphrase in keyphrases_by_pmid.get(article.pmid, []):
+                membership[row, keyphrase_index[keyphrase]] = 1.0
+        keyphrase_counts = np.maximum(membership.sum(axis=1), 1.0)
+
+        selected: List[int] = []
+        max_similarity = np.zeros(len(pool))
+        covered = np.zeros(membership.shape[1])
+        available = np.ones(len(pool), dtype=bool)
+
+        while len(selected) < min(limit, len(pool)):
+            # Redundancia: parecido con lo ya elegido y frases clave ya cubiertas
+            keyphrase_redundancy = (membership @ covered) / keyphrase_counts
+            redundancy = 0.5 * max_similarity + 0.5 * keyphrase_redundancy
+            mmr = self.mmr_lambda * base - (1 - self.mmr_lambda) * redundancy
+            mmr[~available] = -np.inf
+
+            best = int(np.argmax(mmr))
+            selected.append(best)
+            available[best] = False
+            max_similarity = np.maximum(max_similarity, vectors.similarity(best))
+            covered = np.maximum(covered, membership[best])
+
+        return [
+            RankedReference(
+                article=pool[i],
+                score=float(base[i]),
+                relevance=float(relevance[i]),
+                recency=float(recency[i]),
+                keyphrases=keyphrases_by_pmid.get(pool[i].pmid, [])
+            )
+            for i in selected
+        ]
+
+    @staticmethod
+    def _document_text(article: Article) -> str:
+        """Texto indexado de un artículo: título y, si está descargado, abstract"""
+        if article.abstract:
+            return f"{article.title} {article.abstract}"
+        return article.title
+
+    def _score(self, query_text: str, documents: List[str]) -> Tuple[np.ndarray, "_SparseVectors"]:
+        """
+        Calcula BM25 de cada documento frente a la consulta
+
+        La matriz documento x término se guarda en formato disperso (filas,
+        columnas, valores) y solo con los términos de la consulta, así que el
+        coste es proporcional a las coincidencias y no al tamaño del vocabulario.
+
+        Args:
+            query_text: Texto de la consulta
+            documents: Textos de los documentos
+
+        Returns:
+            Tupla con (relevancia normalizada a [0, 1], vectores TF-IDF unitarios
+            de los documentos sobre el vocabulario de la consulta)
+        """
+        query_tokens = tokenize(query_text)
+        vocabulary = {token: i for i, token in enumerate(dict.fromkeys(query_tokens))}
+        num_docs = len(documents)
+        num_terms = max(len(vocabulary), 1)
+
+        # Solo se cuentan las palabras del documento que aparecen en la consulta
+        rows: List[int] = []
+        cols: List[int] = []
+        values: List[int] = []
+        lengths = np.empty(num_docs)
+        for row, text in enumerate(documents):
+            words = _split(text)
+            lengths[row] = len(words)
+            counts = Counter([word for word in words if word in vocabulary])
+            rows.extend([row] * len(counts))
+            cols.extend(map(vocabulary.__getitem__, counts))
+            values.extend(counts.values())
+
+        rows_array = np.array(rows, dtype=np.int64)
+        cols_array = np.array(cols, dtype=np.int64)
+        tf = np.array(values, dtype=float)
+
+        query_tf = np.bincount([vocabulary[token] for token in query_tokens], minlength=num_terms)
+        doc_freq = np.bincount(cols_array, minlength=num_terms)
+        idf = np.log1p((num_docs - doc_freq + 0.5) / (doc_freq + 0.5))
+
+        avg_length = max(lengths.mean(), 1.0)
+        norm = self.k1 * (1 - self.b + self.b * lengths / avg_length)
+        contributions = tf * (self.k1 + 1) / (tf + norm[rows_array]) * (idf * np.log1p(query_tf))[cols_array]
+        bm25 = np.bincount(rows_array, weights=contributions, minlength=num_docs)
+        relevance = bm25 / bm25.max() if bm25.max() > 0 else bm25
+
+        weights = np.log1p(tf) * idf[cols_array]
+        vector_norms = np.sqrt(np.bincount(rows_array, weights=weights ** 2, minlength=num_docs))
+        weights = weights / np.maximum(vector_norms[rows_array], 1e-12)
+
+        return relevance, _SparseVectors(rows_array, cols_array, weights, num_docs, num_terms)
+
+    def _recency(self, years: List[str]) -> np.ndarray:
+        """
+        Bonus de recencia en [0, 1] que se reduce a la mitad cada `recency_half_life` años
+
+        Args:
+            years: Años de publicación (texto; los no reconocidos puntúan 0)
+
+        Returns:
+            Array con el bonus de cada artículo
+        """
+        current_year = datetime.datetime.now().year
+        matches = [_YEAR_PATTERN.search(year or '') for year in years]
+        ages = np.array([
+            current_year - int(match.group(1)) if match else np.inf
+            for match in matches
+        ], dtype=float)
+        return np.power(0.5, np.clip(ages, 0, None) / self.recency_half_life)
@@ -13,6 +13,9 @@ from reportlab.lib.units import inch
 from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, PageBreak, Table, TableStyle
 from reportlab.lib import colors
 
+from src.pubmed_searcher import PubMedSearcher
+from src.reference_ranker import RankedReference
+
 
 class ReportGenerator:
     """Genera informes de evaluación en diferentes formatos"""
@@ -61,7 +64,8 @@ class ReportGenerator:
         keyphrases: List[str],
         manuscript_text: str,
         article_type: str,
-        manuscript_title: Optional[str] = None
+        manuscript_title: Optional[str] = None,
+        selected_references: Optional[List[RankedReference]] = None
     ) -> str:
         """
         Genera informe completo para auditoría
@@ -74,6 +78,7 @@ class ReportGenerator:
             manuscript_text: Texto del manuscrito
             article_type: Tipo de artículo
             manuscript_title: Título del manuscrito (opcional)
+            selected_references: Referencias incluidas en el prompt, con sus puntuaciones (opcional)
             
         Returns:
             Ruta del archivo generado
@@ -84,12 +89,12 @@ class ReportGenerator:
         if self.output_format == 'pdf':
             self._generate_auditor_pdf(
                 output_path, evaluation, pubmed_data, keyphrases,
-                manuscript_text, article_type, manuscript_title
+                manuscript_text, article_type, manuscript_title, selected_references
             )
         else:  # docx
             self._generate_auditor_docx(
                 output_path, evaluation, pubmed_data, keyphrases,
-                manuscript_text, article_type, manuscript_title
+                manuscript_text, article_type, manuscript_title, selected_references
             )
         
         return output_path
@@ -202,7 +207,8 @@ class ReportGenerator:
         keyphrases: List[str],
         manuscript_text: str,
         article_type: str,
-        manuscript_title: Optional[str]
+        manuscript_title: Optional[str],
+        selected_references: Optional[List[RankedReference]] = None
     ):
         """Genera informe PDF completo para auditoría"""
         doc = SimpleDocTemplate(output_path, pagesize=letter)
@@ -249,7 +255,7 @@ class ReportGenerator:
         
         # Resultados de PubMed
         story.append(Paragraph("PubMed Search Results", heading_style))
-        total_articles = sum(len(articles) for articles in pubmed_data.values())
+        total_articles = PubMedSearcher.count_unique_articles(pubmed_data)
         story.append(Paragraph(f"<b>Total articles retrieved:</b> {total_articles}", styles['Normal']))
         story.append(Spacer(1, 0.1*inch))
         
@@ -262,6 +268,17 @@ class ReportGenerator:
                 ))
         story.append(Spacer(1, 0.3*inch))
         
+        # Referencias usadas en el análisis
+        if selected_references:
+            story.append(Paragraph("References Used in the Analysis", heading_style))
+            for i, ref in enumerate(selected_references, 1):
+                story.append(Paragraph(
+                    f"  {i}. {ref.article.title} ({ref.article.year}) - PMID {ref.article.pmid} - "
+                    f"score {ref.score:.2f} (relevance {ref.relevance:.2f}, recency {ref.recency:.2f})",
+                    styles['Normal']
+                ))
+            story.append(Spacer(1, 0.3*inch))
+        
         # Evaluación
         story.append(PageBreak())
         story.append(Paragraph("Evaluation Results", heading_style))
@@ -291,7 +308,8 @@ class ReportGenerator:
         keyphrases: List[str],
         manuscript_text: str,
         article_type: str,
-        manuscript_title: Optional[str]
+        manuscript_title: Optional[str],
+        selected_references: Optional[List[RankedReference]] = None
     ):
         """Genera informe DOCX completo para auditoría"""
         doc = Document()
@@ -326,7 +344,7 @@ class ReportGenerator:
         
         # Resultados de PubMed
         doc.add_heading('PubMed Search Results', level=1)
-        total_articles = sum(len(articles) for articles in pubmed_data.values())
+        total_articles = PubMedSearcher.count_unique_articles(pubmed_data)
         p = doc.add_paragraph()
         p.add_run('Total articles retrieved: ').bold = True
         p.add_run(str(total_articles))
@@ -340,6 +358,18 @@ class ReportGenerator:
                 p.add_run(f"Authors: {art.get('authors', 'Unknown')}\n")
                 p.add_run(f"Journal: {art.get('journal', 'Unknown')}")
         
+        # Referencias usadas en el análisis
+        if selected_references:
+            doc.add_heading('References Used in the Analysis', level=1)
+            for ref in selected_references:
+                p = doc.add_paragraph(style='List Number')
+                p.add_run(f"{ref.article.title} ").bold = True
+                p.add_run(f"({ref.article.year}) - PMID {ref.article.pmid}\n")
+                p.add_run(
+                    f"Score: {ref.score:.2f} (relevance {ref.relevance:.2f}, "
+                    f"recency {ref.recency:.2f}; key phrases: {', '.join(ref.keyphrases)})"
+                )
+        
         # Evaluación
         doc.add_page_break()
         doc.add_heading('Evaluation Results', level=1)
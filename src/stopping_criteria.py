@@ -0,0 +1,263 @@
+"""
+Criterios de parada anticipada para la generación de frases clave y evaluaciones
+"""
+import re
+from typing import List, Optional
+
+from transformers import StoppingCriteria
+
+from src.cancellation import CancelToken
+
+_BULLET_PATTERN = re.compile(r'^(?:[-*•]|\d+[.)])')
+
+
+def clean_keyphrase_line(line: str) -> str:
+    """
+    Limpia una línea generada como frase clave
+
+    Args:
+        line: Línea del texto generado
+
+    Returns:
+        Línea sin numeración, guiones ni comillas
+    """
+    line = line.strip()
+
+    # Eliminar numeración y guiones
+    line = line.lstrip('0123456789.-) ')
+
+    # Eliminar comillas
+    return line.strip('"\'')
+
+
+def is_valid_keyphrase(phrase: str) -> bool:
+    """Una frase clave válida tiene entre 2 y 6 palabras"""
+    return bool(phrase) and 2 <= len(phrase.split()) <= 6
+
+
+def evaluation_section(line: str) -> Optional[str]:
+    """
+    Detecta si una línea es el encabezado de una sección de la evaluación
+
+    Args:
+        line: Línea del texto generado
+
+    Returns:
+        'major', 'minor', 'other', 'suggestions' o None si no es un encabezado
+    """
+    line_upper = line.upper()
+    if 'MAJOR POINT' in line_upper:
+        return 'major'
+    if 'MINOR POINT' in line_upper:
+        return 'minor'
+    if 'OTHER POINT' in line_upper:
+        return 'other'
+    if 'SUGGESTION' in line_upper or 'IMPROVEMENT' in line_upper:
+        return 'suggestions'
+    return None
+
+
+def count_keyphrase_lines(text: str) -> int:
+    """Cuenta las líneas completas (terminadas en salto de línea) que son frases clave válidas"""
+    return sum(1 for line in text.split('\n')[:-1] if is_valid_keyphrase(clean_keyphrase_line(line)))
+
+
+def evaluation_drift_offset(text: str) -> Optional[int]:
+    """
+    Busca el punto en que una evaluación ya completa empieza a repetirse o divagar
+
+    La evaluación está completa cuando han aparecido las cuatro secciones y
+    SUGGESTIONS tiene al menos un punto. A partir de ahí se considera deriva
+    un nuevo encabezado de sección, un punto ya escrito antes o un párrafo
+    de texto libre tras una línea en blanco. Solo se miran líneas completas.
+
+    Args:
+        text: Texto generado hasta el momento
+
+    Returns:
+        Posición (en caracteres) donde empieza la deriva, o None
+    """
+    seen = set()
+    points = set()
+    current = None
+    suggestions = 0
+    previous_blank = False
+    offset = 0
+
+    for line in text.split('\n')[:-1]:
+        stripped = line.strip()
+        section = evaluation_section(stripped)
+        normalized = re.sub(r'\W+', ' ', stripped.lstrip('-*•0123456789.) ').lower()).strip()
+
+        if len(seen) == 4 and suggestions > 0 and stripped:
+            if section is not None or normalized in points:
+                return offset
+            if previous_blank and not _BULLET_PATTERN.match(stripped):
+                return offset
+
+        if section is not None:
+            seen.add(section)
+            current = section
+        elif current and normalized:
+            points.add(normalized)
+            if current == 'suggestions':
+                suggestions += 1
+
+        previous_blank = not stripped
+        offset += len(line) + 1
+
+    return None
+
+
+class IncrementalDecoder:
+    """
+    Decodifica los tokens generados de una fila a medida que llegan
+
+    Solo decodifica los tokens nuevos más una pequeña ventana anterior, para que
+    los espacios y los caracteres que ocupan varios tokens salgan igual que al
+    decodificar la secuencia completa. Así el coste de cada comprobación no crece
+    con la longitud del texto generado.
+    """
+
+    def __init__(self, tokenizer):
+        """
+        Inicializa el decodificador
+
+        Args:
+            tokenizer: Tokenizador del modelo
+        """
+        self.tokenizer = tokenizer
+        self.text = ""
+        # Tokens [_prefix, _read) ya están en text y sirven de contexto para los siguientes
+        self._prefix = 0
+        self._read = 0
+
+    def update(self, generated_ids) -> str:
+        """
+        Añade al texto los tokens generados desde la última llamada
+
+        Args:
+            generated_ids: Todos los ids generados hasta ahora (sin el prompt)
+
+        Returns:
+            Texto generado completo
+        """
+        window = generated_ids[self._prefix:].tolist()
+        read = self._read - self._prefix
+        if len(window) <= read:
+            return self.text
+
+        context = self.tokenizer.decode(window[:read], skip_special_tokens=True)
+        decoded = self.tokenizer.decode(window, skip_special_tokens=True)
+        # Un carácter incompleto (varios bytes repartidos entre tokens) se espera al siguiente token
+        if len(decoded) > len(context) and not decoded.endswith('\ufffd'):
+            self.text += decoded[len(context):]
+            self._prefix, self._read = self._read, self._prefix + len(window)
+        return self.text
+
+
+class _GeneratedTextCriteria(StoppingCriteria):
+    """Base de los criterios que deciden a partir del texto generado de cada fila del lote"""
+
+    # Cada cuántos tokens se decodifica el texto (decodificar cuesta mucho menos que un paso del modelo)
+    check_every = 1
+
+    def __init__(self, tokenizer, prompt_length: int):
+        """
+        Inicializa el criterio
+
+        Args:
+            tokenizer: Tokenizador del modelo
+            prompt_length: Longitud (con padding) del prompt dentro de input_ids
+        """
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.stop_offsets: List[Optional[int]] = []
+        self.stopped_early = False
+        self._early_rows = 0
+        self._decoders: List[IncrementalDecoder] = []
+
+    def tokens_saved(self, generated_tokens: int, max_new_tokens: int, batch_size: int = 1) -> int:
+        """Tokens que no se han generado gracias a la parada anticipada"""
+        return (max_new_tokens - generated_tokens) * batch_size if self.stopped_early else 0
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        generated_tokens = input_ids.shape[1] - self.prompt_length
+        if not self.stop_offsets:
+            self.stop_offsets = [None] * input_ids.shape[0]
+            self._decoders = [IncrementalDecoder(self.tokenizer) for _ in range(input_ids.shape[0])]
+        if generated_tokens % self.check_every:
+            return False
+
+        finished_ids = {self.tokenizer.eos_token_id, self.tokenizer.pad_token_id}
+        for row in range(input_ids.shape[0]):
+            if self.stop_offsets[row] is None:
+                text = self._decoders[row].update(input_ids[row, self.prompt_length:])
+                if generated_tokens and int(input_ids[row, -1]) in finished_ids:
+                    # La fila ya terminó con EOS y generate la rellena con padding
+                    self.stop_offsets[row] = len(text)
+                else:
+                    self.stop_offsets[row] = self._stop_offset(text)
+                    self._early_rows += self.stop_offsets[row] is not None
+
+        # Se devuelve un bool (y no un tensor por fila) para ser compatible con
+        # todas las versiones de transformers: el lote para cuando acaban todas las filas
+        done = all(offset is not None for offset in self.stop_offsets)
+        self.stopped_early = done and self._early_rows > 0
+        return done
+
+    def trim(self, text: str, row: int = 0) -> str:
+        """Recorta el texto generado de una fila en el punto de parada"""
+        if row < len(self.stop_offsets) and self.stop_offsets[row] is not None:
+            return text[:self.stop_offsets[row]]
+        return text
+
+    def _stop_offset(self, text: str) -> Optional[int]:
+        """Posición del texto en la que la fila ya puede parar, o None"""
+        raise NotImplementedError
+
+
+class KeyphraseStoppingCriteria(_GeneratedTextCriteria):
+    """Para la generación cuando ya hay `num_keyphrases` frases clave válidas"""
+
+    def __init__(self, tokenizer, prompt_length: int, num_keyphrases: int):
+        """
+        Inicializa el criterio
+
+        Args:
+            tokenizer: Tokenizador del modelo
+            prompt_length: Longitud del prompt dentro de input_ids
+            num_keyphrases: Número de frases clave pedidas
+        """
+        super().__init__(tokenizer, prompt_length)
+        self.num_keyphrases = num_keyphrases
+
+    def _stop_offset(self, text: str) -> Optional[int]:
+        if count_keyphrase_lines(text) >= self.num_keyphrases:
+            return len(text)
+        return None
+
+
+class EvaluationStoppingCriteria(_GeneratedTextCriteria):
+    """Para la generación cuando la evaluación está completa y el modelo empieza a repetirse o divagar"""
+
+    check_every = 4
+
+    def _stop_offset(self, text: str) -> Optional[int]:
+        return evaluation_drift_offset(text)
+
+
+class CancelStoppingCriteria(StoppingCriteria):
+    """Para la generación en el siguiente paso cuando se cancela la revisión"""
+
+    def __init__(self, cancel_token: CancelToken):
+        """
+        Inicializa el criterio
+
+        Args:
+            cancel_token: Señal de cancelación de la revisión
+        """
+        self.cancel_token = cancel_token
+
+    def __call__(self, input_ids, scores, **kwargs) -> bool:
+        return self.cancel_token.cancelled
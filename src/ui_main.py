@@ -4,34 +4,59 @@ PRRA main graphical interface
 import sys
 import os
 import json
+import threading
+from concurrent.futures import Future
+from typing import Callable, Optional
 from PyQt5.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QLabel, QLineEdit, QPushButton, QTextEdit, QComboBox, QCheckBox,
     QFileDialog, QProgressBar, QTabWidget, QMessageBox, QPlainTextEdit,
     QGroupBox, QSpinBox, QSplitter
 )
-from PyQt5.QtCore import Qt, QSize
+from PyQt5.QtCore import Qt, QSize, pyqtSignal
 from PyQt5.QtGui import QFont, QIcon
 
 from src.config import (
     AVAILABLE_MODELS, SUPPORTED_FORMATS, DEFAULT_NUM_KEYPHRASES,
     DEFAULT_NUM_ARTICLES, DEFAULT_OUTPUT_FORMAT, DEFAULT_PROMPTS,
-    WINDOW_WIDTH, WINDOW_HEIGHT
+    CPU_PRECISION, CPU_PRECISIONS, LONG_DOCUMENT_BATCH_SIZE, WINDOW_WIDTH, WINDOW_HEIGHT
 )
-from src.document_processor import DocumentProcessor
+from src.document_processor import DocumentProcessor, shutdown_pdf_executor
+from src.memory_planner import plan_model_memory
+from src.model_pool import get_model_pool
+from src.pipeline import ModelPreloader, ReviewPipeline
 from src.worker import WorkerThread
 
 
 class MainWindow(QMainWindow):
     """Ventana principal de la aplicación PRRA"""
     
+    # Fin de las tareas en segundo plano (se emiten desde otros threads)
+    preload_finished = pyqtSignal(object, object)  # (modelo, precisión, documento largo), Future
+    extraction_finished = pyqtSignal(str, object)  # Ruta, Future
+    
     def __init__(self):
         super().__init__()
         self.file_path = None
         self.prompts = DEFAULT_PROMPTS.copy()
         self.worker = None
         
+        # Precarga del modelo y extracción del manuscrito en segundo plano
+        self._preloader = ModelPreloader()
+        self._preload_key = None
+        self._preload_future: Optional[Future] = None
+        self._extraction_future: Optional[Future] = None
+        self._model_status = "not loaded"
+        self._extraction_status = "no file"
+        
         self.init_ui()
+        
+        self.preload_finished.connect(self.on_preload_finished)
+        self.extraction_finished.connect(self.on_extraction_finished)
+        self.model_combo.currentTextChanged.connect(self.preload_selected_model)
+        self.precision_combo.currentTextChanged.connect(self.preload_selected_model)
+        self.update_status_bar()
+        self.preload_selected_model()
     
     def init_ui(self):
         """Inicializa la interfaz de usuario"""
@@ -207,6 +232,35 @@ class MainWindow(QMainWindow):
         cuda_label.setStyleSheet(f"color: {'green' if cuda_available else 'orange'}; font-style: italic;")
         ai_layout.addWidget(cuda_label)
         
+        # Precisión en CPU (en GPU siempre se usa fp16)
+        precision_layout = QHBoxLayout()
+        precision_layout.addWidget(QLabel("CPU precision:"))
+        self.precision_combo = QComboBox()
+        self.precision_combo.addItems(CPU_PRECISIONS)
+        self.precision_combo.setCurrentText(CPU_PRECISION)
+        self.precision_combo.setToolTip(
+            "fp32: full precision. bf16: half the memory, only on CPUs with native bf16.\n"
+            "int8: quantized Linear layers, about a third of the memory and faster generation;\n"
+            "converted once on first use and cached on disk."
+        )
+        self.precision_combo.setEnabled(not cuda_available)
+        precision_layout.addWidget(self.precision_combo)
+        precision_layout.addStretch()
+        ai_layout.addLayout(precision_layout)
+        
+        # Plan de memoria: si el modelo cabe y cómo se cargará
+        plan_layout = QHBoxLayout()
+        btn_plan = QPushButton("Check memory fit")
+        btn_plan.clicked.connect(self.check_memory_plan)
+        plan_layout.addWidget(btn_plan)
+        plan_layout.addStretch()
+        ai_layout.addLayout(plan_layout)
+        
+        self.memory_plan_label = QLabel("")
+        self.memory_plan_label.setWordWrap(True)
+        self.memory_plan_label.setStyleSheet("font-style: italic;")
+        ai_layout.addWidget(self.memory_plan_label)
+        
         ai_group.setLayout(ai_layout)
         layout.addWidget(ai_group)
         
@@ -234,6 +288,13 @@ class MainWindow(QMainWindow):
         self.manual_checkbox.setToolTip("Enable to review and confirm each processing step")
         options_layout.addWidget(self.manual_checkbox)
         
+        self.long_document_checkbox = QCheckBox("Long-document mode (review the full manuscript in chunks)")
+        self.long_document_checkbox.setToolTip(
+            "Evaluate every section of the manuscript instead of an excerpt and merge the results. "
+            "Slower, but nothing past the first pages is ignored"
+        )
+        options_layout.addWidget(self.long_document_checkbox)
+        
         options_group.setLayout(options_layout)
         layout.addWidget(options_group)
         
@@ -246,7 +307,7 @@ class MainWindow(QMainWindow):
         tab = QWidget()
         layout = QVBoxLayout()
         
-        info_label = QLabel("Edit AI prompts (JSON format). Use {num}, {text}, {abstracts}, {type} as placeholders.")
+        info_label = QLabel("Edit AI prompts (JSON format). Use {num}, {text}, {abstracts}, {type}, {section}, {evaluations} as placeholders.")
         info_label.setWordWrap(True)
         info_label.setStyleSheet("color: #666; padding: 5px; background-color: #f9f9f9; border-radius: 3px;")
         layout.addWidget(info_label)
@@ -254,6 +315,7 @@ class MainWindow(QMainWindow):
         self.prompt_editor = QPlainTextEdit()
         self.prompt_editor.setPlainText(json.dumps(self.prompts, indent=4))
         self.prompt_editor.setFont(QFont("Courier", 10))
+        self.prompt_editor.textChanged.connect(self.on_prompts_edited)
         layout.addWidget(self.prompt_editor)
         
         # Botones
@@ -297,6 +359,11 @@ class MainWindow(QMainWindow):
         """)
         layout.addWidget(self.progress_bar)
         
+        # Estado de la generación en curso (tokens, velocidad, tiempo)
+        self.generation_label = QLabel("")
+        self.generation_label.setStyleSheet("color: #666; padding: 2px;")
+        layout.addWidget(self.generation_label)
+        
         # Log de mensajes
         log_label = QLabel("Processing Log:")
         log_label.setStyleSheet("font-weight: bold;")
@@ -331,20 +398,118 @@ class MainWindow(QMainWindow):
             self.file_path = file_path
             self.file_label.setText(f"📄 {os.path.basename(file_path)}")
             
-            # Vista previa
+            # Vista previa inmediata: solo se leen las primeras páginas o párrafos
             try:
-                doc_processor = DocumentProcessor()
-                text = doc_processor.extract_text(file_path)
-                preview = doc_processor.get_text_preview(text, 2000)
-                self.preview.setText(preview)
-                
-                # Log
-                self.log_message(f"Loaded file: {file_path}")
-                self.log_message(f"File size: {len(text)} characters")
-                
-            except Exception as e:
-                QMessageBox.warning(self, "Error", f"Could not read file: {str(e)}")
-                self.file_path = None
+                head = '\n\n'.join(DocumentProcessor.iter_text(file_path, max_chars=2001))
+                self.preview.setText(DocumentProcessor.get_text_preview(head, 2000))
+            except Exception:
+                self.preview.setText("Extracting text...")
+            
+            # La extracción (y detección de tipo) se hace ya, sin bloquear la interfaz;
+            # la revisión reutiliza el resultado
+            self._extraction_status = f"⏳ extracting {os.path.basename(file_path)}..."
+            self.update_status_bar()
+            self._extraction_future = self._run_in_background(ReviewPipeline.extract, file_path)
+            self._extraction_future.add_done_callback(
+                lambda future, path=file_path: self.extraction_finished.emit(path, future)
+            )
+    
+    def on_extraction_finished(self, file_path: str, future: Future):
+        """Registra el resultado de la extracción en segundo plano"""
+        if file_path != self.file_path:
+            return  # Se abrió otro archivo mientras tanto
+        
+        try:
+            text, article_type, _sections = future.result()
+        except Exception as e:
+            QMessageBox.warning(self, "Error", f"Could not read file: {str(e)}")
+            self.file_path = None
+            self._extraction_future = None
+            self.preview.clear()
+            self._extraction_status = "no file"
+            self.update_status_bar()
+            return
+        
+        # Log
+        self.log_message(f"Loaded file: {file_path}")
+        self.log_message(f"File size: {len(text)} characters")
+        
+        self._extraction_status = f"✓ {os.path.basename(file_path)} ({len(text)} characters, {article_type})"
+        self.update_status_bar()
+    
+    def preload_selected_model(self, _text: str = ""):
+        """
+        Pide precargar el modelo seleccionado (si no se ha pedido ya)
+        
+        ModelPreloader carga de uno en uno y solo la última selección, así que
+        recorrer la lista de modelos no lanza varias cargas a la vez.
+        """
+        key = (
+            self.model_combo.currentText(),
+            self.precision_combo.currentText(),
+            self.long_document_checkbox.isChecked()
+        )
+        if key == self._preload_key:
+            return
+        
+        self._preload_key = key
+        self._model_status = f"⏳ loading {key[0]}..."
+        self.update_status_bar()
+        self._preload_future = self._preloader.request(key)
+        self._preload_future.add_done_callback(lambda future, key=key: self.preload_finished.emit(key, future))
+    
+    def on_preload_finished(self, key: tuple, future: Future):
+        """Actualiza el estado del modelo cuando termina la precarga"""
+        if key != self._preload_key:
+            return  # Se eligió otro modelo mientras tanto (la precarga se descartó o ya no importa)
+        
+        model_name = key[0]
+        try:
+            plan, loaded = future.result()
+        except Exception as e:
+            # Se reintentará al volver a elegir el modelo o al empezar la revisión
+            self._preload_key = None
+            self._model_status = f"⚠ {model_name} not preloaded ({str(e)})"
+        else:
+            if loaded:
+                self._model_status = f"✓ {model_name} ready ({plan.precision})"
+            elif not plan.fits:
+                self._model_status = f"✗ {model_name} does not fit in memory"
+            else:
+                self._model_status = f"{model_name} will load when the review starts (memory plan needs confirmation)"
+        self.update_status_bar()
+    
+    def update_status_bar(self):
+        """Muestra el estado del modelo y del manuscrito en la barra de estado"""
+        self.statusBar().showMessage(f"Model: {self._model_status}   |   Manuscript: {self._extraction_status}")
+    
+    @staticmethod
+    def _run_in_background(function: Callable, *args) -> Future:
+        """
+        Ejecuta una función en un thread daemon (no retrasa el cierre de la aplicación)
+        
+        Args:
+            function: Función a ejecutar
+            *args: Argumentos de la función
+            
+        Returns:
+            Future con el resultado
+        """
+        future = Future()
+        
+        def run():
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(function(*args))
+                except Exception as e:
+                    future.set_exception(e)
+        
+        threading.Thread(target=run, daemon=True).start()
+        return future
+    
+    def on_prompts_edited(self):
+        """Descarta los prefijos de prompt precalculados al editar los prompts"""
+        get_model_pool().clear_prefix_caches()
     
     def save_prompts(self):
         """Guarda prompts a archivo JSON"""
@@ -391,6 +556,29 @@ class MainWindow(QMainWindow):
         self.prompt_editor.setPlainText(json.dumps(self.prompts, indent=4))
         QMessageBox.information(self, "Success", "Prompts reset to default")
     
+    def check_memory_plan(self):
+        """
+        Calcula y muestra el plan de memoria del modelo seleccionado
+        
+        Returns:
+            MemoryPlan, o None si no se pudo calcular (p. ej. sin conexión para descargar la configuración)
+        """
+        try:
+            plan = plan_model_memory(
+                self.model_combo.currentText(),
+                self.precision_combo.currentText(),
+                LONG_DOCUMENT_BATCH_SIZE if self.long_document_checkbox.isChecked() else 1
+            )
+        except Exception as e:
+            self.memory_plan_label.setText(f"Memory plan unavailable: {str(e)}")
+            self.memory_plan_label.setStyleSheet("color: orange; font-style: italic;")
+            return None
+        
+        color = 'green' if plan.fits and not plan.offloaded else ('orange' if plan.fits else 'red')
+        self.memory_plan_label.setText(plan.summary())
+        self.memory_plan_label.setStyleSheet(f"color: {color}; font-style: italic;")
+        return plan
+    
     def start_review(self):
         """Inicia el proceso de revisión"""
         # Validaciones
@@ -410,9 +598,27 @@ class MainWindow(QMainWindow):
             QMessageBox.warning(self, "Error", str(e))
             return
         
+        # Comprobar que el modelo cabe en memoria antes de empezar; si la precarga
+        # de este mismo modelo sigue en curso, ya comprobó el plan (y medir ahora daría cifras falsas)
+        self.preload_selected_model()
+        preload = self._preload_future
+        plan = None if not preload.done() else self.check_memory_plan()
+        if plan is not None and not plan.fits:
+            QMessageBox.critical(self, "Not enough memory", plan.summary())
+            return
+        if plan is not None and plan.adjusted:
+            reply = QMessageBox.question(
+                self, "Memory plan",
+                f"{plan.summary()}\n\nStart the review with this plan?",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if reply != QMessageBox.Yes:
+                return
+        
         # Limpiar log y progreso
         self.log_text.clear()
         self.progress_bar.setValue(0)
+        self.generation_label.setText("")
         
         # Deshabilitar botón de inicio
         self.start_btn.setEnabled(False)
@@ -426,12 +632,17 @@ class MainWindow(QMainWindow):
             model_name=self.model_combo.currentText(),
             prompts=self.prompts,
             manual_mode=self.manual_checkbox.isChecked(),
-            output_format=self.output_combo.currentText()
+            output_format=self.output_combo.currentText(),
+            long_document=self.long_document_checkbox.isChecked(),
+            precision=self.precision_combo.currentText(),
+            extraction=self._extraction_future,
+            preload=preload
         )
         
         # Conectar señales
         self.worker.progress.connect(self.progress_bar.setValue)
         self.worker.log_message.connect(self.log_message)
+        self.worker.generation_progress.connect(self.on_generation_progress)
         self.worker.result.connect(self.on_review_complete)
         self.worker.error.connect(self.on_review_error)
         self.worker.finished.connect(self.on_worker_finished)
@@ -443,11 +654,20 @@ class MainWindow(QMainWindow):
         self.log_message("=" * 60)
     
     def stop_review(self):
-        """Detiene el proceso de revisión"""
+        """Detiene el proceso de revisión (sin esperar: on_worker_finished reactiva los botones)"""
         if self.worker and self.worker.isRunning():
             self.log_message("⏹ Stopping process...")
+            self.stop_btn.setEnabled(False)
             self.worker.stop()
-            self.worker.wait()
+    
+    def closeEvent(self, event):
+        """Cancela la revisión en curso y cierra los procesos de extracción antes de cerrar la ventana"""
+        if self.worker and self.worker.isRunning():
+            self.worker.stop()
+            # La cancelación llega en el siguiente token o petición: la espera es corta
+            self.worker.wait(10000)
+        shutdown_pdf_executor()
+        event.accept()
     
     def on_review_complete(self, result: dict):
         """Maneja la finalización exitosa de la revisión"""
@@ -478,6 +698,11 @@ class MainWindow(QMainWindow):
         """Maneja la finalización del worker (éxito o error)"""
         self.start_btn.setEnabled(True)
         self.stop_btn.setEnabled(False)
+        self.generation_label.setText("")
+    
+    def on_generation_progress(self, info):
+        """Muestra tokens generados, velocidad y tiempo de la generación en curso"""
+        self.generation_label.setText(f"🤖 {info.format()}")
     
     def log_message(self, message: str):
         """Añade un mensaje al log"""
@@ -37,9 +37,84 @@ def test_document_processor():
     article_type_2 = dp.detect_article_type(test_text_review)
     print(f"✓ Review article detected as: {article_type_2}")
     
+    scores = dp.article_type_scores(
+        "A SYSTEMATIC\nREVIEW of the literature. Patients' treatments were a preview; resultsx and methods."
+    )
+    assert scores == {'Research Article': 1, 'Review': 3, 'Case Report': 2}
+    assert dp.detect_article_type("We present a Case Report: one patient, diagnosis and treatment.") == "Case Report"
+    print(f"✓ Article type scores: {scores}")
+    
     preview = dp.get_text_preview("This is a long text " * 100, 50)
     print(f"✓ Text preview generated: {len(preview)} chars")
     
+    manuscript = (
+        "Effect of X on Y\n\nSUMMARY\nWe tested X.\n\n1. Background\nY is common.\n\n"
+        "2. Materials and Methods\nPatients were randomized.\n\nResults:\nFewer events.\n\n"
+        "Acknowledgements\n\nReferences\n1. Smith J. Trial. 2020.\n"
+    )
+    sections = dp.segment_sections(manuscript)
+    assert [span.kind for span in sections] == ['front matter', 'abstract', 'introduction', 'methods', 'results', 'references']
+    methods = sections.find('methods')
+    assert manuscript[methods.start:methods.end].strip() == "Patients were randomized."
+    assert sections.find('discussion') is None
+    assert sections.select(manuscript, {'abstract', 'results'}) == "We tested X.\n\nFewer events."
+    body = sections.excluding(manuscript, ('references', 'acknowledgments'))
+    assert body.rstrip().endswith("Fewer events.") and "Smith" not in body and "Acknowledgements" not in body
+    assert [span.kind for span in dp.segment_sections(body)] == ['front matter', 'abstract', 'introduction', 'methods', 'results']
+    print(f"✓ Sections indexed: {', '.join(span.label for span in sections)}")
+    
+    # Extracción de PDF en paralelo: mismo resultado que página a página
+    import tempfile
+    from reportlab.pdfgen import canvas
+    from src.cancellation import CancelToken, ReviewCancelled
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf_path = os.path.join(tmp, "manuscript.pdf")
+        pdf = canvas.Canvas(pdf_path)
+        for page in range(30):
+            if page % 7 != 3:  # Algunas páginas sin texto
+                pdf.drawString(72, 720, f"Page {page} results of the randomized trial")
+                pdf.drawString(72, 700, f"Second line of page {page}")
+            pdf.showPage()
+        pdf.save()
+        
+        serial = dp._extract_from_pdf(pdf_path, workers=1)
+        parallel = dp._extract_from_pdf(pdf_path, workers=2, min_pages=1)
+        assert parallel == serial and "Page 29 results" in serial
+        print(f"✓ Parallel PDF extraction matches serial output ({len(serial)} chars)")
+        
+        # El pool se rehace al cambiar el número de procesos y se puede cerrar y volver a crear
+        from src import document_processor
+        first = document_processor._get_pdf_executor(2)
+        assert document_processor._get_pdf_executor(2) is first
+        resized = document_processor._get_pdf_executor(3)
+        assert resized is not first and resized._max_workers == 3
+        assert dp._extract_from_pdf(pdf_path, workers=3, min_pages=1) == serial
+        document_processor.shutdown_pdf_executor()
+        assert document_processor._pdf_executor is None
+        assert dp._extract_from_pdf(pdf_path, workers=2, min_pages=1) == serial
+        document_processor.shutdown_pdf_executor()
+        print("✓ PDF process pool resized on demand and shut down cleanly")
+        
+        assert ' '.join(dp.iter_text(pdf_path)) == serial
+        head = list(dp.iter_text(pdf_path, max_chars=100))
+        assert sum(len(piece) for piece in head) == 100 and len(head) == 2
+        
+        txt_path = os.path.join(tmp, "manuscript.txt")
+        with open(txt_path, 'w', encoding='utf-8') as f:
+            f.write("Title\n\nIntroduction text\nsecond line\n\n\nReferences\n1. Smith 2020\n")
+        paragraphs = list(dp.iter_text(txt_path, stop_when=lambda piece: piece.startswith("References")))
+        assert paragraphs == ["Title", "Introduction text\nsecond line"]
+        print("✓ iter_text streams pages/paragraphs with max_chars and stop_when")
+        
+        token = CancelToken()
+        token.cancel()
+        try:
+            dp._extract_from_pdf(pdf_path, token, workers=2, min_pages=1)
+            assert False, "Cancelled extraction should raise"
+        except ReviewCancelled:
+            print("✓ Parallel PDF extraction cancelled")
+    
     print("✓ DocumentProcessor tests passed")
 
 def test_pubmed_searcher():
@@ -48,13 +123,664 @@ def test_pubmed_searcher():
     print("Testing PubMedSearcher")
     print("="*60)
     
-    from src.pubmed_searcher import PubMedSearcher
+    from src.config import PUBMED_MIN_RESULTS_THRESHOLD
+    from src.pubmed_searcher import NO_RESULTS_WINDOW, PubMedSearcher
     
     ps = PubMedSearcher()
     print("✓ PubMedSearcher instance created")
+    
+    windows = PubMedSearcher._date_windows(2025)
+    assert PubMedSearcher._select_window(windows, [1, PUBMED_MIN_RESULTS_THRESHOLD, 500]) == windows[1]
+    assert PubMedSearcher._select_window(windows, [0, 1, 2]) is None
+    assert PubMedSearcher._select_window(windows, [0, 0, 0]) == NO_RESULTS_WINDOW
+    assert ps._search_window_ids("asthma", NO_RESULTS_WINDOW, 20) == []
+    print("✓ Narrowest date window with enough results chosen")
+    
+    # Cancelar a mitad de búsqueda: ReviewCancelled sale al momento, sin "Error ..." ni resultados vacíos
+    import contextlib
+    import io
+    from src import pubmed_searcher
+    from src.cancellation import CancelToken, ReviewCancelled
+    
+    class FakeHandle:
+        def close(self):
+            pass
+    
+    token = CancelToken()
+    requests = []
+    
+    def esearch(**params):
+        requests.append(params['term'])
+        token.cancel()
+        return FakeHandle()
+    
+    entrez = pubmed_searcher.Entrez
+    original = entrez.esearch, entrez.read
+    entrez.esearch, entrez.read = esearch, lambda handle: {'IdList': ['1'], 'Count': '30'}
+    try:
+        ps = PubMedSearcher(use_cache=False, max_workers=2)
+        ps.cancel_token = token
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                ps.search_articles(["asthma control", "inhaled corticosteroids"], 20)
+                assert False, "Cancelled search should raise"
+            except ReviewCancelled:
+                pass
+        assert "Error" not in output.getvalue()
+        assert len(requests) <= 2
+        for method, args in ((ps._count_results, ("asthma", None)), (ps._search_without_date, ("asthma", 20)),
+                             (ps._fetch_article_summaries, (["1"],)), (ps._fetch_article_details, (["1"],))):
+            try:
+                method(*args)
+                assert False, f"{method.__name__} should raise"
+            except ReviewCancelled:
+                pass
+    finally:
+        entrez.esearch, entrez.read = original
+    print(f"✓ Cancelling mid-search raises at once ({len(requests)} request(s) sent)")
     print("✓ Note: Actual PubMed searches require internet connection")
     print("✓ PubMedSearcher module loaded successfully")
 
+SAMPLE_PUBMED_XML = """<?xml version="1.0"?>
+<PubmedArticleSet>
+  <PubmedArticle><MedlineCitation><PMID>101</PMID><Article>
+    <Journal><Title>Thorax</Title><JournalIssue><PubDate><Year>2023</Year></PubDate></JournalIssue></Journal>
+    <ArticleTitle>Asthma control in <i>children</i></ArticleTitle>
+    <Abstract><AbstractText Label="AIM">Inhaled corticosteroids improve asthma control.</AbstractText></Abstract>
+    <AuthorList><Author><LastName>Smith</LastName><ForeName>Ann</ForeName></Author></AuthorList>
+  </Article></MedlineCitation></PubmedArticle>
+  <PubmedArticle><MedlineCitation><PMID>102</PMID><Article>
+    <Journal><Title>Chest</Title><JournalIssue><PubDate><MedlineDate>2009 Jan-Feb</MedlineDate></PubDate></JournalIssue></Journal>
+    <ArticleTitle>Severe asthma outcomes</ArticleTitle>
+    <AuthorList><Author><CollectiveName>Asthma Group</CollectiveName></Author></AuthorList>
+  </Article></MedlineCitation></PubmedArticle>
+  <DeleteCitation><PMID>999</PMID></DeleteCitation>
+</PubmedArticleSet>
+"""
+
+SAMPLE_ESUMMARY_XML = """<?xml version="1.0"?>
+<eSummaryResult>
+  <DocSum><Id>101</Id>
+    <Item Name="PubDate" Type="Date">2023 Mar 4</Item>
+    <Item Name="Source" Type="String">Thorax</Item>
+    <Item Name="AuthorList" Type="List"><Item Name="Author" Type="String">Smith A</Item></Item>
+    <Item Name="Title" Type="String">Asthma control in children</Item>
+    <Item Name="HasAbstract" Type="Integer">1</Item>
+    <Item Name="FullJournalName" Type="String">Thorax</Item>
+  </DocSum>
+  <DocSum><Id>102</Id>
+    <Item Name="PubDate" Type="Date">2009 Jan-Feb</Item>
+    <Item Name="Source" Type="String">Chest</Item>
+    <Item Name="AuthorList" Type="List"></Item>
+    <Item Name="Title" Type="String">Severe asthma outcomes</Item>
+    <Item Name="HasAbstract" Type="Integer">0</Item>
+  </DocSum>
+</eSummaryResult>
+"""
+
+def test_pubmed_xml():
+    """Test streaming PubMed XML parser"""
+    print("\n" + "="*60)
+    print("Testing PubMed XML parser")
+    print("="*60)
+    
+    import io
+    from src.pubmed_xml import Article, iter_pubmed_xml
+    
+    records = list(iter_pubmed_xml(io.BytesIO(SAMPLE_PUBMED_XML.encode('utf-8'))))
+    articles = [r for r in records if isinstance(r, Article)]
+    assert [a.pmid for a in articles] == ['101', '102']
+    assert records[-1] == {'deleted': '999'}
+    print("✓ Articles and deletions streamed from efetch-style XML")
+    
+    first, second = articles
+    assert first['title'] == "Asthma control in children"
+    assert first.get('abstract') == "Inhaled corticosteroids improve asthma control."
+    assert first.year == "2023" and second.year == "2009 Jan-Feb"
+    assert second.abstract == "No abstract available"
+    assert Article.from_dict(first.to_dict()) == first
+    assert not hasattr(first, '__dict__')
+    print("✓ Compact records keep dictionary-style access")
+    
+    from src.pubmed_xml import iter_esummary_xml
+    from src.pubmed_searcher import PubMedSearcher
+    
+    summaries = list(iter_esummary_xml(io.BytesIO(SAMPLE_ESUMMARY_XML.encode('utf-8'))))
+    assert [(a.pmid, a.year, a.journal) for a in summaries] == [('101', '2023', 'Thorax'), ('102', '2009', 'Chest')]
+    assert summaries[0].abstract is None
+    assert summaries[1].abstract == "No abstract available"
+    print("✓ esummary metadata parsed without abstracts")
+    
+    references = PubMedSearcher.select_references({'asthma': summaries, 'children': summaries[:1]})
+    assert [a.pmid for a in references] == ['101']
+    print("✓ Only articles that can have an abstract are selected as references")
+    
+    print("✓ PubMed XML parser tests passed")
+
+def test_reference_ranker():
+    """Test relevance ranking of reference articles"""
+    print("\n" + "="*60)
+    print("Testing ReferenceRanker")
+    print("="*60)
+    
+    import time
+    from src.pubmed_xml import Article
+    from src.reference_ranker import ReferenceRanker
+    
+    manuscript = "Inhaled corticosteroids and asthma exacerbations in school-age children."
+    relevant = Article('1', "Inhaled corticosteroids reduce asthma exacerbations in children", "A", "J", "2023", None)
+    duplicate = Article('2', "Inhaled corticosteroids reduce asthma exacerbations in children", "B", "J", "2022", None)
+    other_topic = Article('3', "Asthma in children: exacerbations at school", "C", "J", "2021", None)
+    unrelated = Article('4', "Hip fracture surgery outcomes", "D", "J", "2024", None)
+    no_abstract = Article('5', "Asthma corticosteroids children", "E", "J", "2024", "No abstract available")
+    pubmed_data = {
+        'inhaled corticosteroids': [unrelated, relevant, duplicate, no_abstract],
+        'school asthma': [other_topic]
+    }
+    
+    ranker = ReferenceRanker()
+    ranked = ranker.rank(manuscript, pubmed_data, 3)
+    assert [r.article.pmid for r in ranked][:2] == ['1', '3'], [r.article.pmid for r in ranked]
+    assert all(r.article.pmid != '5' for r in ranked)
+    assert ranked[0].keyphrases == ['inhaled corticosteroids']
+    assert 0 <= ranked[0].relevance <= 1 and 0 < ranked[0].recency <= 1
+    print("✓ Most relevant article first, near-duplicates pushed down by MMR")
+    
+    words = manuscript.split() + [f"filler{i}" for i in range(50)]
+    many = {'kp': [
+        Article(str(i), ' '.join(words[i % 40:i % 40 + 12]), "A", "J", str(2000 + i % 25), ' '.join(words * 4))
+        for i in range(1000)
+    ]}
+    start = time.perf_counter()
+    ranker.rank(manuscript, many, 10)
+    elapsed = time.perf_counter() - start
+    print(f"✓ 1000 abstracts ranked in {elapsed * 1000:.0f} ms")
+    
+    print("✓ ReferenceRanker tests passed")
+
+class WordTokenizer:
+    """Tokenizador mínimo (palabras y espacios) para probar el reparto de tokens"""
+    
+    def __init__(self):
+        self.vocab = {}
+        self.words = {0: ''}
+    
+    def _encode(self, text):
+        import re
+        ids = []
+        for piece in re.findall(r'\s+|\S+', text):
+            if piece not in self.vocab:
+                self.vocab[piece] = len(self.vocab) + 1
+                self.words[self.vocab[piece]] = piece
+            ids.append(self.vocab[piece])
+        return ids
+    
+    def __call__(self, text, add_special_tokens=True):
+        if isinstance(text, list):
+            return {'input_ids': [self(t, add_special_tokens)['input_ids'] for t in text]}
+        return {'input_ids': ([0] if add_special_tokens else []) + self._encode(text)}
+    
+    def decode(self, ids, skip_special_tokens=True):
+        return ''.join(self.words[i] for i in ids)
+
+class MergingTokenizer(WordTokenizer):
+    """El prompt completo tokeniza más largo que la suma de sus partes (como las fusiones en las fronteras)"""
+    
+    def __call__(self, text, add_special_tokens=True):
+        if isinstance(text, list):
+            return {'input_ids': [super(MergingTokenizer, self).__call__(t, add_special_tokens)['input_ids'] for t in text]}
+        # Las palabras largas se parten en dos tokens solo dentro del prompt completo
+        return {'input_ids': [
+            token for ids in super().__call__(text, add_special_tokens)['input_ids']
+            for token in ([ids] if len(self.words[ids]) < 7 else self._encode(self.words[ids][:3]) + self._encode(self.words[ids][3:]))
+        ]}
+
+def test_prompt_budget():
+    """Test token budget allocation for prompts"""
+    print("\n" + "="*60)
+    print("Testing PromptBudget")
+    print("="*60)
+    
+    from src.config import DEFAULT_PROMPTS, PROMPT_BUDGET_WEIGHTS
+    from src.prompt_budget import PromptBudget
+    
+    tokenizer = WordTokenizer()
+    budget = PromptBudget(tokenizer, 600)
+    manuscript = ' '.join(f"word{i}" for i in range(5000))
+    abstracts = [' '.join(f"abs{j}_{i}" for i in range(60)) for j in range(10)]
+    
+    result = budget.build(
+        DEFAULT_PROMPTS['analysis'], {'type': "Original Article"},
+        {'text': manuscript, 'abstracts': abstracts}, PROMPT_BUDGET_WEIGHTS
+    )
+    assert len(result.input_ids) <= 600
+    assert len(result.input_ids) >= 590, len(result.input_ids)
+    assert result.prompt.endswith("Evaluation:")
+    assert "SUGGESTIONS FOR IMPROVEMENT" in result.prompt
+    assert 0 < result.items_included['abstracts'] < 10
+    assert result.truncated == ['text', 'abstracts']
+    assert result.static_prefix.startswith("You are an expert") and "{" not in result.static_prefix
+    assert result.prompt.startswith(result.static_prefix)
+    print(f"✓ Instructions kept, budget filled: {len(result.input_ids)}/600 tokens")
+    
+    short = budget.build(
+        DEFAULT_PROMPTS['analysis'], {'type': "Original Article"},
+        {'text': "A short manuscript.", 'abstracts': abstracts}, PROMPT_BUDGET_WEIGHTS
+    )
+    assert short.items_included['abstracts'] > result.items_included['abstracts']
+    assert "A short manuscript." in short.prompt
+    print("✓ Tokens not needed by the manuscript go to the abstracts")
+    
+    keyphrases = budget.build(DEFAULT_PROMPTS['keyphrases'], {'num': 5}, {'text': manuscript, 'abstracts': abstracts}, {})
+    assert keyphrases.prompt.endswith("Key phrases:")
+    assert 'abstracts' not in keyphrases.tokens_by_field
+    assert len(keyphrases.input_ids) >= 590
+    print("✓ Fields missing from the template do not use budget")
+    
+    merging = MergingTokenizer()
+    for text in (manuscript, "A short manuscript."):
+        result = PromptBudget(merging, 600).build(
+            DEFAULT_PROMPTS['analysis'], {'type': "Original Article"},
+            {'text': text, 'abstracts': abstracts}, PROMPT_BUDGET_WEIGHTS
+        )
+        assert len(result.input_ids) <= 600
+        assert result.input_ids == merging(result.prompt)['input_ids']
+        assert result.prompt.endswith("Evaluation:") and "SUGGESTIONS FOR IMPROVEMENT" in result.prompt
+        assert result.items_included['abstracts'] > 0
+    assert "A short manuscript." in result.prompt
+    print(f"✓ Prompt over the limit after boundary merges trimmed from the flexible parts ({len(result.input_ids)}/600 tokens)")
+    
+    try:
+        PromptBudget(tokenizer, 20).build(
+            DEFAULT_PROMPTS['analysis'], {'type': "Original Article"},
+            {'text': manuscript, 'abstracts': abstracts}, PROMPT_BUDGET_WEIGHTS
+        )
+        assert False, "Instructions longer than the budget should raise"
+    except ValueError:
+        pass
+    print("✓ Instructions that do not fit raise instead of being cut")
+    
+    print("✓ PromptBudget tests passed")
+
+def test_long_document():
+    """Test chunking and merging for long-document mode"""
+    print("\n" + "="*60)
+    print("Testing Long Document Mode")
+    print("="*60)
+    
+    import tempfile
+    from src.long_document import ChunkCache, chunk_manuscript, merge_evaluations, split_sections
+    
+    def paragraph(name, words):
+        return ' '.join(f"{name}{i}" for i in range(words))
+    
+    manuscript = "\n\n".join([
+        "A Study Title",
+        "Abstract", paragraph("abs", 40),
+        "1. Introduction", paragraph("intro", 60),
+        "2. Methods", paragraph("meth", 150), paragraph("meth_b", 150),
+        "RESULTS:", paragraph("res", 500),
+        "Discussion", paragraph("disc", 80),
+        "References", paragraph("ref", 300)
+    ])
+    
+    labels = [label for label, _ in split_sections(manuscript)]
+    assert labels == ['Front matter', 'Abstract', 'Introduction', 'Methods', 'Results', 'Discussion', 'References']
+    print(f"✓ Sections detected: {', '.join(labels)}")
+    
+    tokenizer = WordTokenizer()
+    chunks = chunk_manuscript(manuscript, tokenizer, 400)
+    for label, text in chunks:
+        assert len(tokenizer(text, add_special_tokens=False)['input_ids']) <= 400
+    joined = ' '.join(text for _, text in chunks)
+    assert 'ref0' not in joined
+    assert 'meth_b149' in joined and 'res499' in joined and 'disc79' in joined
+    assert chunks[0][0] == 'Front matter, Abstract, Introduction'
+    print(f"✓ {len(chunks)} chunks, all within budget, references skipped")
+    
+    merged = merge_evaluations([
+        {'major': ['Sample size is too small.'], 'minor': ['Typo in Table 1'], 'other': [], 'suggestions': []},
+        {'major': ['sample size is too small', 'No control group'], 'minor': [], 'other': [], 'suggestions': ['Add a CONSORT diagram']}
+    ])
+    assert merged['major'] == ['Sample size is too small.', 'No control group']
+    assert merged['suggestions'] == ['Add a CONSORT diagram']
+    print("✓ Duplicate points removed when merging chunk evaluations")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ChunkCache(tmp)
+        key = ChunkCache.key("model", "prompt", max_new_tokens=600)
+        assert key != ChunkCache.key("model", "prompt", max_new_tokens=300)
+        assert cache.get(key) is None
+        cache.put(key, "MAJOR POINTS:\n- Something")
+        assert cache.get(key) == "MAJOR POINTS:\n- Something"
+    print("✓ Chunk outputs cached per model, prompt and generation parameters")
+    
+    print("✓ Long document tests passed")
+
+def test_pubmed_offline():
+    """Test offline PubMed index and searcher"""
+    print("\n" + "="*60)
+    print("Testing OfflinePubMedSearcher")
+    print("="*60)
+    
+    import gzip
+    import tempfile
+    from src.pubmed_offline import PubMedIndexImporter, OfflinePubMedSearcher
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        xml_path = os.path.join(tmp, "pubmed_sample.xml.gz")
+        with gzip.open(xml_path, 'wt', encoding='utf-8') as f:
+            f.write(SAMPLE_PUBMED_XML)
+        index_path = os.path.join(tmp, "index.sqlite")
+        
+        counts = PubMedIndexImporter(index_path).import_file(xml_path)
+        assert counts == {'imported': 2, 'deleted': 1}, counts
+        print(f"✓ Imported sample baseline file: {counts}")
+        
+        searcher = OfflinePubMedSearcher(index_path)
+        results = searcher.search_articles(["asthma control", "asthma"], 10)
+        assert [a['pmid'] for a in results["asthma control"]] == ['101']
+        assert [a['pmid'] for a in results["asthma"]] == ['101', '102']
+        assert results["asthma control"][0]['title'] == "Asthma control in children"
+        assert results["asthma"][1]['authors'] == "Asthma Group"
+        print("✓ Local full-text search with date windows")
+        
+        combined = searcher.search_with_progressive_and(["asthma", "children"], 10)
+        assert combined, combined
+        print("✓ Progressive AND search on the local index")
+        
+        from src.cancellation import CancelToken, ReviewCancelled
+        searcher.cancel_token = CancelToken()
+        searcher.cancel_token.cancel()
+        try:
+            searcher.search_articles(["asthma"], 10)
+            assert False, "cancelled search should raise"
+        except ReviewCancelled:
+            pass
+        print("✓ Cancelled search stops with ReviewCancelled")
+        searcher.conn.close()
+    
+    print("✓ OfflinePubMedSearcher tests passed")
+
+def test_pubmed_cache():
+    """Test PubMedCache module"""
+    print("\n" + "="*60)
+    print("Testing PubMedCache")
+    print("="*60)
+    
+    from src.pubmed_cache import PubMedCache
+    from src.pubmed_xml import Article
+    
+    cache = PubMedCache(':memory:', ttl_days=1, max_searches=2, max_articles=2)
+    cache.put_search("asthma", "2020/01/01", "2025/12/31", 20, {'ids': ['1', '2'], 'count': 2})
+    assert cache.get_search("asthma", "2020/01/01", "2025/12/31", 20)['ids'] == ['1', '2']
+    assert cache.get_search("asthma", "", "", 20) is None
+    print("✓ esearch results cached by query, date window and retmax")
+    
+    cache.put_articles([
+        Article(str(i), f"Article {i}", "Author", "Journal", "2024", "Abstract") for i in range(3)
+    ])
+    cached = cache.get_articles(['0', '1', '2'])
+    assert len(cached) == 2
+    assert all(isinstance(article, Article) for article in cached.values())
+    assert cached['2']['title'] == "Article 2"
+    print("✓ Article table trimmed to its size limit")
+    
+    cache.ttl_seconds = -1
+    assert cache.get_search("asthma", "2020/01/01", "2025/12/31", 20) is None
+    print("✓ Expired searches are ignored")
+    
+    print("✓ PubMedCache tests passed")
+
+def test_extraction_cache():
+    """Test the content-addressed extraction cache"""
+    print("\n" + "="*60)
+    print("Testing ExtractionCache")
+    print("="*60)
+    
+    import shutil
+    import tempfile
+    from src.document_processor import EXTRACTOR_VERSION, DocumentProcessor
+    from src.extraction_cache import ExtractionCache
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = ExtractionCache(os.path.join(tmp, "cache"))
+        path = os.path.join(tmp, "manuscript.txt")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("A randomized controlled trial\n\nMethods\nPatients were randomized.\n\nResults\nFewer events.\n")
+        
+        first = DocumentProcessor.extract_manuscript(path, cache=cache)
+        assert not first.cached
+        assert [label for label, _, _ in first.sections] == ['Front matter', 'Methods', 'Results']
+        label, start, end = first.sections[1]
+        assert first.text[start:end].strip() == "Patients were randomized."
+        
+        # Una copia con otro nombre se sirve de la caché sin volver a extraer
+        copy_path = os.path.join(tmp, "renamed.txt")
+        shutil.copy(path, copy_path)
+        extract_text = DocumentProcessor.extract_text
+        DocumentProcessor.extract_text = staticmethod(lambda *args: (_ for _ in ()).throw(AssertionError("re-extracted")))
+        try:
+            second = DocumentProcessor.extract_manuscript(copy_path, cache=cache)
+        finally:
+            DocumentProcessor.extract_text = extract_text
+        assert second.cached and second.text == first.text
+        assert second.article_type == first.article_type and second.sections == first.sections
+        print("✓ Repeat extraction served from the cache, keyed by content")
+        
+        with open(copy_path, 'a', encoding='utf-8') as f:
+            f.write("Discussion\nChanged.\n")
+        assert not DocumentProcessor.extract_manuscript(copy_path, cache=cache).cached
+        print("✓ Modified file is extracted again")
+        
+        old_entry = os.path.join(cache.cache_dir, f"{cache.key(path, EXTRACTOR_VERSION)}.json")
+        new_entry = os.path.join(cache.cache_dir, f"{cache.key(copy_path, EXTRACTOR_VERSION)}.json")
+        os.utime(old_entry, (0, 0))
+        cache.max_bytes = os.path.getsize(new_entry)
+        assert cache.evict() == 1
+        assert os.listdir(cache.cache_dir) == [os.path.basename(new_entry)]
+        print("✓ Least recently used entries evicted over the size limit")
+    
+    print("✓ ExtractionCache tests passed")
+
+def test_rate_limiter():
+    """Test TokenBucket rate limiter"""
+    print("\n" + "="*60)
+    print("Testing TokenBucket")
+    print("="*60)
+    
+    import threading
+    import time
+    from src.rate_limiter import TokenBucket
+    
+    bucket = TokenBucket(rate=20)
+    stamps = []
+    
+    def worker():
+        bucket.acquire()
+        stamps.append(time.monotonic())
+    
+    threads = [threading.Thread(target=worker) for _ in range(6)]
+    start = time.monotonic()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    
+    # 6 peticiones a 20/s: la primera es inmediata, las otras 5 esperan 0.05 s cada una
+    elapsed = max(stamps) - start
+    assert elapsed >= 0.24, elapsed
+    print(f"✓ 6 concurrent requests spaced over {elapsed:.2f}s at 20 req/s")
+    
+    print("✓ TokenBucket tests passed")
+
+def test_background_handoff():
+    """Test the worker's wait for the background preload and extraction"""
+    print("\n" + "="*60)
+    print("Testing Background Preload/Extraction Handoff")
+    print("="*60)
+    
+    import threading
+    import time
+    from concurrent.futures import Future
+    from src.cancellation import CancelToken, ReviewCancelled
+    try:
+        from src.pipeline import ReviewPipeline
+    except ImportError as e:
+        print(f"⚠ Background handoff not tested (missing dependency: {e.name})")
+        return
+    
+    def finish_later(future, delay, result=None, error=None, events=None, name=None):
+        def run():
+            time.sleep(delay)
+            if events is not None:
+                events.append(name)
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+        threading.Thread(target=run, daemon=True).start()
+    
+    # Sin tareas en segundo plano no se espera nada
+    logs = []
+    pipeline = ReviewPipeline(5, 5, {}, 'pdf', log=logs.append)
+    assert pipeline.wait_for_background() is None and logs == []
+    
+    # La extracción solo se recoge después de la precarga
+    events = []
+    preload, extraction = Future(), Future()
+    finish_later(preload, 0.2, events=events, name="preload")
+    finish_later(extraction, 0.05, result=("text", "Original Research"), events=events, name="extraction")
+    assert pipeline.wait_for_background(preload, extraction) == ("text", "Original Research")
+    assert events == ["extraction", "preload"] and preload.done()
+    assert any("loading in the background" in message for message in logs)
+    
+    # Un error en la precarga no impide la revisión; uno en la extracción sí
+    preload, extraction = Future(), Future()
+    preload.set_exception(RuntimeError("out of memory"))
+    extraction.set_result(("text", "Review"))
+    assert pipeline.wait_for_background(preload, extraction) == ("text", "Review")
+    extraction = Future()
+    finish_later(extraction, 0.05, error=ValueError("unreadable file"))
+    try:
+        pipeline.wait_for_background(None, extraction)
+        assert False, "Extraction errors should propagate"
+    except ValueError:
+        pass
+    print("✓ Extraction result handed over after the preload finishes")
+    
+    # Precargas: una a la vez, solo la selección actual
+    from src.pipeline import ModelPreloader
+    
+    started = []
+    running = []
+    overlapped = []
+    release_first = threading.Event()
+    
+    def fake_preload(model_name, precision, long_document):
+        if running:
+            overlapped.append(model_name)
+        running.append(model_name)
+        started.append(model_name)
+        if model_name == "model-a":
+            release_first.wait(5)
+        running.remove(model_name)
+        return model_name, True
+    
+    preloader = ModelPreloader(fake_preload, debounce=0.05)
+    first = preloader.request(("model-a", "fp32", False))
+    deadline = time.perf_counter() + 2
+    while not started and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    assert started == ["model-a"]
+    
+    # Mientras model-a carga se recorren varios modelos: al llegar su turno solo el último sigue elegido
+    stale = [preloader.request((name, "fp32", False)) for name in ("model-b", "model-c")]
+    last = preloader.request(("model-d", "fp32", False))
+    assert preloader.current_key == ("model-d", "fp32", False)
+    time.sleep(0.1)
+    assert started == ["model-a"], "Nothing else may load while a preload is running"
+    release_first.set()
+    assert last.result(timeout=5) == ("model-d", True)
+    assert first.result(timeout=5) == ("model-a", True)
+    assert [future.result(timeout=5) for future in stale] == [None, None]
+    assert started == ["model-a", "model-d"] and overlapped == []
+    print("✓ Preloads run one at a time; stale selections skipped without loading")
+    
+    # Cambios rápidos de selección: solo se carga la última (debounce)
+    started.clear()
+    futures = [preloader.request((name, "fp32", False)) for name in ("model-e", "model-f", "model-g")]
+    assert futures[-1].result(timeout=5) == ("model-g", True)
+    assert [future.result(timeout=5) for future in futures[:-1]] == [None, None]
+    assert started == ["model-g"]
+    print("✓ Rapid selection changes debounced into a single preload")
+    
+    # Stop durante cualquiera de las dos esperas responde sin esperar a que terminen
+    for pending in ("preload", "extraction"):
+        token = CancelToken()
+        pipeline = ReviewPipeline(5, 5, {}, 'pdf', cancel_token=token)
+        preload, extraction = Future(), Future()
+        if pending == "extraction":
+            preload.set_result(None)
+        threading.Timer(0.1, token.cancel).start()
+        start = time.perf_counter()
+        try:
+            pipeline.wait_for_background(preload, extraction)
+            assert False, "Cancelled wait should raise"
+        except ReviewCancelled:
+            pass
+        assert time.perf_counter() - start < 2
+        assert not extraction.done()
+    print("✓ Cancelling while waiting for the preload or the extraction raises at once")
+    
+    # Las secciones salen de la extracción: ni la caché ni la revisión vuelven a segmentar
+    import tempfile
+    from src.document_processor import DocumentProcessor
+    from src.extraction_cache import ExtractionCache
+    
+    class PlanReached(Exception):
+        pass
+    
+    def stop_at_plan(model_name):
+        raise PlanReached()
+    
+    segmentations = []
+    segment_sections = DocumentProcessor.segment_sections
+    
+    def counting_segment_sections(text):
+        segmentations.append(text)
+        return segment_sections(text)
+    
+    DocumentProcessor.segment_sections = staticmethod(counting_segment_sections)
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = ExtractionCache(os.path.join(tmp, "cache"))
+            path = os.path.join(tmp, "manuscript.txt")
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write("A randomized trial\n\nMethods\nPatients.\n\nResults\nFewer events.\n\nReferences\n1. Smith 2020\n")
+            
+            ReviewPipeline.extract(path, cache)
+            assert len(segmentations) == 1
+            text, article_type, sections = ReviewPipeline.extract(path, cache)
+            assert len(segmentations) == 1
+            assert sections.find('results') is not None
+            assert "Smith" not in ReviewPipeline.review_text(text, sections)
+            
+            logs = []
+            pipeline = ReviewPipeline(5, 5, {}, 'pdf', log=logs.append)
+            pipeline.plan_memory = stop_at_plan
+            try:
+                pipeline.run(path, "model", extracted=(text, article_type, sections))
+                assert False, "run should stop at the memory plan"
+            except PlanReached:
+                pass
+            assert len(segmentations) == 1
+            assert any("Sections: Front matter, Methods, Results, References" in message for message in logs)
+    finally:
+        DocumentProcessor.segment_sections = segment_sections
+    print("✓ Section index reused from the extraction cache, not segmented again")
+
 def test_report_generator():
     """Test ReportGenerator module"""
     print("\n" + "="*60)
@@ -72,6 +798,541 @@ def test_report_generator():
     
     print("✓ ReportGenerator tests passed")
 
+def test_model_pool():
+    """Test ModelPool module"""
+    print("\n" + "="*60)
+    print("Testing ModelPool")
+    print("="*60)
+    
+    from src.model_pool import ModelPool
+    
+    class FakeTensor:
+        def __init__(self, n):
+            self.n = n
+        def numel(self):
+            return self.n
+        def element_size(self):
+            return 1
+    
+    class FakeModel:
+        def __init__(self, n):
+            self.weights = [FakeTensor(n)]
+        def parameters(self):
+            return self.weights
+        def buffers(self):
+            return []
+    
+    pool = ModelPool(max_ram_gb=100 / 1024 ** 3)
+    loads = []
+    
+    def loader(name):
+        def load():
+            loads.append(name)
+            return FakeModel(60), object()
+        return load
+    
+    entry_a, hit = pool.acquire("model-a", "float32", "cpu", loader("model-a"))
+    assert not hit and entry_a.size_bytes == 60
+    pool.release(entry_a)
+    
+    entry_a, hit = pool.acquire("model-a", "float32", "cpu", loader("model-a"))
+    assert hit and loads == ["model-a"]
+    pool.release(entry_a)
+    print("✓ Warm model reused without reloading")
+    
+    # model-b no cabe junto a model-a: se descarta el menos usado recientemente
+    entry_b, hit = pool.acquire("model-b", "float32", "cpu", loader("model-b"))
+    pool.release(entry_b)
+    stats = pool.stats()
+    assert stats['evictions'] == 1 and stats['loaded'] == 1
+    assert stats['hits'] == 1 and stats['misses'] == 2
+    print(f"✓ LRU eviction under memory budget: {pool.format_stats()}")
+    
+    for i in range(3):
+        pool.put_prefix(entry_b, f"prefix-{i}", i, max_entries=2)
+    assert pool.get_prefix(entry_b, "prefix-0") is None
+    assert pool.get_prefix(entry_b, "prefix-2") == 2
+    pool.clear_prefix_caches()
+    assert pool.get_prefix(entry_b, "prefix-2") is None
+    print("✓ Prompt prefix caches bounded per model and cleared on prompt edits")
+    
+    # Los pesos de las capas cuantizadas a int8 no aparecen en parameters()
+    class FakePacked:
+        def _weight_bias(self):
+            return FakeTensor(40), None
+    
+    class FakeQuantizedLinear:
+        _packed_params = FakePacked()
+    
+    class FakeQuantizedModel(FakeModel):
+        def modules(self):
+            return [self, FakeQuantizedLinear()]
+    
+    assert ModelPool._estimate_model_bytes(FakeQuantizedModel(10)) == 50
+    print("✓ Packed int8 weights counted in the model footprint")
+    
+    assert pool.is_loaded("model-b", "float32", "cpu") and not pool.is_loaded("model-a", "float32", "cpu")
+    assert pool.reclaimable_bytes("cpu") == 60
+    entry_b, hit = pool.acquire("model-b", "float32", "cpu", loader("model-b"))
+    assert pool.reclaimable_bytes("cpu") == 0
+    pool.release(entry_b)
+    print("✓ Loaded models and reclaimable memory reported for the memory planner")
+    
+    # Otro reparto de capas u otro dispositivo es otra entrada; el mismo plan, con las claves en otro orden, no
+    offload = {'device_map': "auto", 'max_memory': {0: "4GiB", 'cpu': "8GiB"}, 'offload_folder': "/tmp/offload"}
+    same_plan = {'offload_folder': "/tmp/offload", 'max_memory': {'cpu': "8GiB", 0: "4GiB"}, 'device_map': "auto"}
+    assert ModelPool.key("model-b", "float32", "cpu", offload) == ModelPool.key("model-b", "float32", "cpu", same_plan)
+    assert not pool.is_loaded("model-b", "float32", "cpu", offload)
+    assert not pool.is_loaded("model-b", "float32", "cuda")
+    entry_b, hit = pool.acquire("model-b", "float32", "cpu", loader("model-b"), load_options=offload)
+    assert not hit and loads[-1] == "model-b"
+    pool.release(entry_b)
+    assert pool.is_loaded("model-b", "float32", "cpu", same_plan)
+    assert not pool.is_loaded("model-b", "float32", "cpu")
+    print("✓ Pool entries keyed by device and load options")
+    
+    # La carga no bloquea el pool: la interfaz puede consultarlo mientras tanto
+    import threading
+    started, finish = threading.Event(), threading.Event()
+    
+    def slow_load():
+        loads.append("model-c")
+        started.set()
+        finish.wait(5)
+        return FakeModel(30), object()
+    
+    results = []
+    def acquire_c():
+        results.append(pool.acquire("model-c", "float32", "cpu", slow_load))
+    
+    threads = [threading.Thread(target=acquire_c) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    assert started.wait(5)
+    done = threading.Event()
+    threading.Thread(target=lambda: (pool.clear_prefix_caches(), pool.is_loaded("model-c", "float32", "cpu"), done.set())).start()
+    assert done.wait(1), "Pool lock held during model load"
+    finish.set()
+    for thread in threads:
+        thread.join(5)
+    assert loads.count("model-c") == 1
+    assert sorted(hit for _, hit in results) == [False, True]
+    print("✓ Pool stays responsive while a model loads; concurrent requests share one load")
+    
+    entry_c = results[0][0]
+    pool.release(entry_c)
+    pool.evict("model-c")
+    assert pool.is_loaded("model-c", "float32", "cpu")
+    pool.release(entry_c)
+    pool.evict("model-c")
+    assert not pool.is_loaded("model-c", "float32", "cpu")
+    print("✓ Models in use are not evicted")
+    
+    print("✓ ModelPool tests passed")
+
+def test_memory_planner():
+    """Test MemoryPlanner module"""
+    print("\n" + "="*60)
+    print("Testing MemoryPlanner")
+    print("="*60)
+    
+    from types import SimpleNamespace
+    from src.memory_planner import choose_plan, footprint_from_config
+    
+    gb = 1024 ** 3
+    llama_7b = SimpleNamespace(
+        hidden_size=4096, num_hidden_layers=32, num_attention_heads=32,
+        num_key_value_heads=32, intermediate_size=11008, vocab_size=32000
+    )
+    footprint = footprint_from_config(llama_7b)
+    assert 6.6e9 < footprint.parameters < 6.8e9
+    assert footprint.weights_bytes('int8') < footprint.weights_bytes('bf16') < footprint.weights_bytes('fp32')
+    print(f"✓ Llama-2-7B estimated at {footprint.parameters / 1e9:.2f}B parameters")
+    
+    plan = choose_plan("llama", footprint, 'fp32', 64 * gb)
+    assert plan.fits and plan.precision == 'fp32' and not plan.adjusted and plan.load_kwargs() == {}
+    
+    # 16 GB: fp32 no cabe; int8 solo si ya está convertido (la conversión necesita fp32)
+    plan = choose_plan("llama", footprint, 'fp32', 16 * gb, int8_cached=True)
+    assert plan.fits and plan.precision == 'int8' and plan.adjusted
+    plan = choose_plan("llama", footprint, 'fp32', 16 * gb)
+    assert plan.fits and plan.offloaded and plan.load_kwargs()['device_map'] == "auto"
+    assert 'offload_folder' in plan.load_kwargs()
+    plan = choose_plan("llama", footprint, 'fp32', 16 * gb, allow_disk_offload=False)
+    assert not plan.fits
+    print(f"✓ 16 GB plan without offload refused:\n{plan.summary()}")
+    
+    # GPU de 8 GB: las capas que no caben van a RAM
+    plan = choose_plan("llama", footprint, 'fp16', 64 * gb, available_vram=8 * gb)
+    assert plan.fits and plan.device == "cuda" and set(plan.max_memory) == {0, 'cpu'}
+    plan = choose_plan("llama", footprint, 'fp16', 64 * gb, available_vram=24 * gb)
+    assert plan.fits and not plan.offloaded
+    print("✓ Layers offloaded to CPU when the GPU is too small")
+    
+    print("✓ MemoryPlanner tests passed")
+
+def test_model_loader():
+    """Test the .bin to safetensors fallback of the model loader"""
+    print("\n" + "="*60)
+    print("Testing Model Loader")
+    print("="*60)
+    
+    import tempfile
+    try:
+        import accelerate  # noqa: F401 (low_cpu_mem_usage y device_map)
+        import torch
+        from transformers import AutoModelForCausalLM, LlamaConfig, PreTrainedModel
+        from src.model_loader import converted_model_path, load_model_weights
+    except ImportError as e:
+        print(f"⚠ Model loader not tested (missing dependency: {e.name})")
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        # Modelo diminuto publicado solo con pesos .bin
+        model_dir = os.path.join(tmp, "bin-only")
+        config = LlamaConfig(
+            vocab_size=64, hidden_size=16, intermediate_size=32, num_hidden_layers=1,
+            num_attention_heads=2, num_key_value_heads=2, max_position_embeddings=32
+        )
+        torch.manual_seed(0)
+        original = AutoModelForCausalLM.from_config(config).eval()
+        original.save_pretrained(model_dir, safe_serialization=False)
+        assert os.path.exists(os.path.join(model_dir, "pytorch_model.bin"))
+        cache_dir = os.path.join(tmp, "converted")
+        converted = converted_model_path(model_dir, cache_dir)
+        
+        # Si la conversión falla no queda ni la copia ni el directorio temporal
+        save_pretrained = PreTrainedModel.save_pretrained
+        
+        def failing_save(self, save_directory, **kwargs):
+            os.makedirs(save_directory, exist_ok=True)
+            open(os.path.join(save_directory, "model.safetensors"), 'wb').close()
+            raise OSError("disk full")
+        
+        PreTrainedModel.save_pretrained = failing_save
+        try:
+            load_model_weights(model_dir, torch.float32, "cpu", cache_dir)
+            assert False, "A failed conversion should raise"
+        except OSError:
+            pass
+        finally:
+            PreTrainedModel.save_pretrained = save_pretrained
+        assert not os.path.exists(converted) and not os.path.exists(f"{converted}.tmp")
+        print("✓ Failed conversion leaves no partial copy")
+        
+        # Primera carga: se convierte (pasando por el directorio temporal) y se guarda la copia
+        os.makedirs(f"{converted}.tmp")  # resto de una conversión interrumpida
+        model, source = load_model_weights(model_dir, torch.float32, "cpu", cache_dir)
+        assert source == 'converted now'
+        assert os.path.exists(os.path.join(converted, "model.safetensors"))
+        assert not os.path.exists(f"{converted}.tmp")
+        
+        # Segunda carga: usa la copia convertida aunque el .bin ya no esté
+        os.remove(os.path.join(model_dir, "pytorch_model.bin"))
+        model, source = load_model_weights(model_dir, torch.float32, "cpu", cache_dir)
+        assert source == 'converted'
+        
+        input_ids = torch.tensor([[1, 5, 9, 13]])
+        with torch.no_grad():
+            assert torch.allclose(original(input_ids).logits, model.eval()(input_ids).logits)
+    print("✓ .bin-only model converted once to safetensors and reused")
+
+def test_quantization():
+    """Test the int8 cache: only tensors are saved, loaded back without unpickling the model"""
+    print("\n" + "="*60)
+    print("Testing Int8 Quantization Cache")
+    print("="*60)
+    
+    import tempfile
+    try:
+        import torch
+        from transformers import AutoModelForCausalLM, LlamaConfig
+        from src.quantization import load_int8_model, quantized_cache_path
+    except ImportError as e:
+        print(f"⚠ Int8 cache not tested (missing dependency: {e.name})")
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        model_dir = os.path.join(tmp, "tiny-llama")
+        config = LlamaConfig(
+            vocab_size=64, hidden_size=16, intermediate_size=32, num_hidden_layers=1,
+            num_attention_heads=2, num_key_value_heads=2, max_position_embeddings=32
+        )
+        torch.manual_seed(0)
+        AutoModelForCausalLM.from_config(config).save_pretrained(model_dir)
+        cache_dir = os.path.join(tmp, "quantized")
+        
+        fp32_loads = []
+        
+        def load_fp32():
+            fp32_loads.append(1)
+            return AutoModelForCausalLM.from_pretrained(model_dir).eval()
+        
+        converted = load_int8_model(model_dir, load_fp32, cache_dir).eval()
+        path = quantized_cache_path(model_dir, cache_dir)
+        assert os.path.exists(path) and not os.path.exists(f"{path}.tmp")
+        
+        # El archivo se lee con weights_only=True: no contiene el modelo serializado
+        checkpoint = torch.load(path, map_location="cpu", weights_only=True)
+        assert set(checkpoint) == {'state_dict', 'buffers'}
+        
+        cached = load_int8_model(model_dir, load_fp32, cache_dir)
+        assert len(fp32_loads) == 1
+        assert isinstance(cached.model.layers[0].mlp.up_proj, torch.ao.nn.quantized.dynamic.Linear)
+        
+        input_ids = torch.tensor([[1, 5, 9, 13]])
+        with torch.no_grad():
+            assert torch.allclose(converted(input_ids).logits, cached(input_ids).logits)
+    print("✓ Int8 weights cached as a state dict and rebuilt without the fp32 model")
+
+def test_generation_progress():
+    """Test live generation progress reporting"""
+    print("\n" + "="*60)
+    print("Testing Generation Progress")
+    print("="*60)
+    
+    try:
+        from src.generation_progress import ProgressStreamer
+    except ImportError as e:
+        print(f"⚠ Generation progress not tested (missing dependency: {e.name})")
+        return
+    
+    now = [0.0]
+    events = []
+    streamer = ProgressStreamer(events.append, "Analysis", 100, part=2, parts=4, interval=1.0, clock=lambda: now[0])
+    streamer.put("prompt")
+    for step in range(1, 6):
+        now[0] = step * 0.2
+        streamer.put("token")
+    assert [event.tokens for event in events] == [0, 5]  # Los avisos se agrupan cada `interval` segundos
+    now[0] = 1.5
+    streamer.end()
+    
+    last = events[-1]
+    assert last.finished and last.tokens == 5 and abs(last.elapsed - 1.5) < 1e-9
+    assert abs(last.tokens_per_second - 4 / 1.3) < 1e-9
+    assert last.fraction == 0.5 and "(2/4)" in last.format()
+    print(f"✓ Tokens counted and updates coalesced: {last.format()}")
+    
+    try:
+        import torch
+        from src.ai_analyzer import AIAnalyzer
+    except ImportError as e:
+        print(f"⚠ Analyzer progress not tested (missing dependency: {e.name})")
+        return
+    from types import SimpleNamespace
+    from src.config import DEFAULT_PROMPTS
+    
+    class AnalyzerTokenizer(WordTokenizer):
+        pad_token_id = 0
+        eos_token_id = 0
+        
+        def batch_decode(self, rows, skip_special_tokens=True):
+            return [self.decode(row.tolist()) for row in rows]
+    
+    class FakeModel:
+        """Genera una respuesta fija token a token, como generate con un streamer"""
+        config = SimpleNamespace(max_position_embeddings=4096)
+        
+        def __init__(self, reply_ids):
+            self.reply_ids = reply_ids
+        
+        def generate(self, input_ids, max_new_tokens, streamer=None, stopping_criteria=(), **kwargs):
+            if streamer is not None:
+                streamer.put(input_ids)
+            for token in self.reply_ids[:max_new_tokens]:
+                input_ids = torch.cat([input_ids, torch.tensor([[token]])], dim=1)
+                if streamer is not None:
+                    streamer.put(torch.tensor([token]))
+                if any(criteria(input_ids, None) for criteria in stopping_criteria):
+                    break
+            if streamer is not None:
+                streamer.end()
+            return input_ids
+    
+    tokenizer = AnalyzerTokenizer()
+    reply = (
+        "MAJOR POINTS:\n- The sample is small.\nMINOR POINTS:\n- Typo in Table 1.\n"
+        "OTHER POINTS:\n- None.\nSUGGESTIONS FOR IMPROVEMENT:\n- Add a power calculation.\n"
+    )
+    analyzer = AIAnalyzer("fake-model", device="cpu")
+    analyzer.model = FakeModel(tokenizer(reply, add_special_tokens=False)['input_ids'])
+    analyzer.tokenizer = tokenizer
+    
+    # El callback se instala antes de analizar, como hace el pipeline
+    progress = []
+    analyzer.generation_callback = progress.append
+    evaluation = analyzer.analyze_manuscript(
+        "Patients were randomized.", {}, DEFAULT_PROMPTS['analysis'], "Research Article", references=[]
+    )
+    assert analyzer.generation_callback is not None
+    assert progress and progress[-1].finished and progress[-1].stage == "Analysis"
+    assert progress[-1].tokens == len(tokenizer(reply, add_special_tokens=False)['input_ids'])
+    assert evaluation['major']
+    print(f"✓ Callback set before analyze_manuscript receives progress ({len(progress)} updates)")
+    
+    print("✓ Generation progress tests passed")
+
+def test_stopping_criteria():
+    """Test early stopping of keyphrase and evaluation generation"""
+    print("\n" + "="*60)
+    print("Testing Stopping Criteria")
+    print("="*60)
+    
+    import re
+    import numpy as np
+    try:
+        from src.stopping_criteria import (
+            EvaluationStoppingCriteria, KeyphraseStoppingCriteria, evaluation_drift_offset
+        )
+    except ImportError as e:
+        print(f"⚠ Stopping criteria not tested (missing dependency: {e.name})")
+        return
+    
+    class PieceTokenizer:
+        """Cada token es un trozo de texto; cuenta los tokens decodificados"""
+        eos_token_id = 0
+        pad_token_id = 0
+        
+        def __init__(self):
+            self.pieces = ["<eos>"]
+            self.decoded_tokens = 0
+        
+        def encode(self, text):
+            ids = []
+            for piece in re.findall(r'[^ \n]+|[ \n]', text):
+                if piece not in self.pieces:
+                    self.pieces.append(piece)
+                ids.append(self.pieces.index(piece))
+            return ids
+        
+        def decode(self, ids, skip_special_tokens=True):
+            self.decoded_tokens += len(ids)
+            return ''.join(self.pieces[i] for i in ids if i or not skip_special_tokens)
+    
+    def generate(criteria, tokenizer, text, prompt_length=3):
+        """Simula generate: llama al criterio tras cada token hasta que pide parar"""
+        ids = [1] * prompt_length + tokenizer.encode(text)
+        for length in range(prompt_length + 1, len(ids) + 1):
+            if criteria(np.array([ids[:length]]), None):
+                return tokenizer.decode(ids[prompt_length:length])
+        return None
+    
+    tokenizer = PieceTokenizer()
+    tokenizer.encode("x")  # Reservar ids distintos del prompt
+    keyphrases = (
+        "1. asthma\n"
+        "2. inhaled corticosteroids in children with severe persistent asthma\n"
+        "3. asthma control\n"
+        "- inhaled corticosteroids\n"
+        "4. should never be generated\n"
+    )
+    criteria = KeyphraseStoppingCriteria(tokenizer, 3, num_keyphrases=2)
+    generated = generate(criteria, tokenizer, keyphrases)
+    assert generated == "1. asthma\n2. inhaled corticosteroids in children with severe persistent asthma\n3. asthma control\n- inhaled corticosteroids\n"
+    assert criteria.stopped_early and criteria.trim(generated) == generated
+    print("✓ Keyphrases stop after 2 valid lines (1-word and 7+-word lines ignored)")
+    
+    criteria = KeyphraseStoppingCriteria(tokenizer, 3, num_keyphrases=5)
+    assert generate(criteria, tokenizer, keyphrases) is None and not criteria.stopped_early
+    
+    # Cada comprobación decodifica solo los tokens nuevos (y unos pocos de contexto)
+    tokenizer.decoded_tokens = 0
+    long_text = "one\n" * 400
+    criteria = KeyphraseStoppingCriteria(tokenizer, 3, num_keyphrases=1)
+    generate(criteria, tokenizer, long_text)
+    assert tokenizer.decoded_tokens < 4 * len(tokenizer.encode(long_text))
+    print(f"✓ Generated text decoded incrementally ({tokenizer.decoded_tokens} token decodes for 800 tokens)")
+    
+    evaluation = (
+        "MAJOR POINTS:\n- The sample is small.\n"
+        "MINOR POINTS:\n- Typo in Table 1.\n"
+        "OTHER POINTS:\n- None.\n"
+        "SUGGESTIONS FOR IMPROVEMENT:\n- Add a power calculation.\n"
+    )
+    assert evaluation_drift_offset(evaluation) is None
+    assert evaluation_drift_offset(evaluation + "MAJOR POINTS:\n") == len(evaluation)
+    assert evaluation_drift_offset(evaluation + "- The sample is small!\n") == len(evaluation)
+    assert evaluation_drift_offset(evaluation + "- Report attrition.\n\nIn conclusion the paper\n") == len(evaluation) + len("- Report attrition.\n\n")
+    incomplete = evaluation[:evaluation.index("SUGGESTIONS")]
+    assert evaluation_drift_offset(incomplete + "MAJOR POINTS:\n") is None
+    print("✓ Evaluation drift found at a repeated point, a new section header or free text")
+    
+    criteria = EvaluationStoppingCriteria(tokenizer, 3)
+    generated = generate(criteria, tokenizer, evaluation + "MAJOR POINTS:\n- The sample is small.\n")
+    assert generated is not None and criteria.trim(generated) == evaluation
+    print("✓ Evaluation trimmed before the repeated section")
+    
+    print("✓ Stopping criteria tests passed")
+
+def test_batch():
+    """Test batch discovery, manifest resume and CLI routing"""
+    print("\n" + "="*60)
+    print("Testing Batch Mode")
+    print("="*60)
+    
+    import tempfile
+    import time
+    from src.cli import COMMANDS, build_parser, is_cli_command
+    
+    assert is_cli_command(["batch", "manuscripts/"]) and is_cli_command(["--help"])
+    assert not is_cli_command([]) and not is_cli_command(["-style", "fusion"])
+    parser = build_parser()
+    assert set(COMMANDS) == set(parser._subparsers._group_actions[0].choices)
+    args = parser.parse_args(["batch", "manuscripts/", "--precision", "int8", "--recursive"])
+    assert args.func.__name__ == "_run_batch" and args.precision == "int8" and args.recursive
+    print("✓ Only known subcommands are routed to the CLI; Qt options reach the GUI")
+    
+    try:
+        from src.batch import BatchJob, BatchRunner
+    except ImportError as e:
+        print(f"⚠ Batch runner not tested (missing dependency: {e.name})")
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        def touch(*parts):
+            path = os.path.join(tmp, *parts)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(parts[-1])
+            return path
+        
+        first, second = touch("a.txt"), touch("b.pdf")
+        touch("a_Author_Report.pdf")
+        touch("notes.xyz")
+        nested = touch("sub", "c.docx")
+        
+        runner = BatchRunner(tmp, "model", pipeline=None, log=lambda message: None)
+        assert runner.discover() == [first, second]
+        runner.recursive = True
+        assert runner.discover() == [first, second, nested]
+        print("✓ Manuscripts discovered, PRRA reports and other files skipped")
+        
+        runner._write_entry(BatchJob(first), {'status': 'ok'})
+        runner._write_entry(BatchJob(second), {'status': 'error', 'error': 'boom'})
+        with open(runner.manifest_path, 'a', encoding='utf-8') as f:
+            f.write('{"file": "truncated')
+        
+        manifest = runner.load_manifest()
+        assert set(manifest) == {first, second}
+        assert runner.is_completed(manifest[first], first)
+        assert not runner.is_completed(manifest[second], second)
+        assert not runner.is_completed(None, nested)
+        
+        # Un manuscrito modificado (tamaño o fecha) se vuelve a revisar
+        stat = os.stat(first)
+        os.utime(first, (stat.st_atime, stat.st_mtime + 10))
+        assert not runner.is_completed(manifest[first], first)
+        os.utime(first, (stat.st_atime, stat.st_mtime))
+        assert runner.is_completed(manifest[first], first)
+        with open(first, 'a', encoding='utf-8') as f:
+            f.write("edited")
+        os.utime(first, (stat.st_atime, stat.st_mtime))
+        assert not runner.is_completed(manifest[first], first)
+        print("✓ Manifest resume skips finished manuscripts unless size or mtime changed")
+    
+    print("✓ Batch tests passed")
+
 def test_config():
     """Test config module"""
     print("\n" + "="*60)
@@ -99,7 +1360,23 @@ def main():
         test_config()
         test_document_processor()
         test_pubmed_searcher()
+        test_rate_limiter()
+        test_pubmed_cache()
+        test_extraction_cache()
+        test_pubmed_xml()
+        test_reference_ranker()
+        test_prompt_budget()
+        test_long_document()
+        test_pubmed_offline()
+        test_background_handoff()
         test_report_generator()
+        test_model_pool()
+        test_memory_planner()
+        test_model_loader()
+        test_quantization()
+        test_generation_progress()
+        test_stopping_criteria()
+        test_batch()
         
         print("\n" + "="*60)
         print("✅ All core module tests passed!")